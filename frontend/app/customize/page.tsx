@@ -14,7 +14,7 @@ import Link from "next/link"
 import { SiteHeader } from "@/components/site-header"
 import { SiteFooter } from "@/components/site-footer"
 import { motion } from "framer-motion"
-import { getJobStatus } from "@/services/api"
+import { FINAL_STATUSES, getJobStatus, watchJobStatus } from "@/services/api"
 import { Alert, AlertDescription } from "@/components/ui/alert"
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5001';
@@ -58,28 +58,29 @@ export default function CustomizePage() {
         console.log("Job status:", jobStatus)
 
         if (jobStatus.status === 'pending' || jobStatus.status === 'processing') {
-          const pollingInterval = setInterval(async () => {
-            try {
-              const updatedJobStatus = await getJobStatus(storedJobId)
-              console.log("Updated job status:", updatedJobStatus)
-
-              if (updatedJobStatus.status === 'completed') {
-                clearInterval(pollingInterval)
-                setModelUrl(`${API_BASE_URL}/api/file/${updatedJobStatus.filename}`)
-                setIsLoading(false)
-              } else if (updatedJobStatus.status === 'failed') {
-                clearInterval(pollingInterval)
-                setError(updatedJobStatus.error || 'Failed to process model')
-                setIsLoading(false)
-              }
-            } catch (err) {
-              console.error("Error updating job status:", err)
+          const stopWatching = watchJobStatus(storedJobId, (updatedJobStatus) => {
+            console.log("Updated job status:", updatedJobStatus)
+
+            if (updatedJobStatus.status === 'failed') {
+              setError(updatedJobStatus.error || 'Failed to process model')
+            } else if (updatedJobStatus.status === 'cancelled') {
+              setError(updatedJobStatus.cancel_reason || 'This quote was cancelled')
+            } else if (FINAL_STATUSES.includes(updatedJobStatus.status)) {
+              setModelUrl(`${API_BASE_URL}/api/file/${updatedJobStatus.filename}`)
             }
-          }, 3000)
+            if (FINAL_STATUSES.includes(updatedJobStatus.status)) {
+              setIsLoading(false)
+            }
+          }, (err) => {
+            setError(err.message || 'Failed to get job status')
+            setIsLoading(false)
+          })
 
-          return () => clearInterval(pollingInterval)
+          return stopWatching
         } else if (jobStatus.status === 'failed') {
           setError(jobStatus.error || 'Failed to process model')
+        } else if (jobStatus.status === 'cancelled') {
+          setError(jobStatus.cancel_reason || 'This quote was cancelled')
         } else {
           if (jobStatus.material_id) {
             setSelectedMaterial(jobStatus.material_id)
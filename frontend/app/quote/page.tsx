@@ -15,7 +15,7 @@ import Link from "next/link"
 import { SiteHeader } from "@/components/site-header"
 import { SiteFooter } from "@/components/site-footer"
 import { motion } from "framer-motion"
-import { getJobStatus, getMaterials } from "@/services/api"
+import { FINAL_STATUSES, getJobStatus, getMaterials, watchJobStatus } from "@/services/api"
 
 // Define API base URL for model files
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5001';
@@ -128,30 +128,30 @@ export default function QuotePage() {
           return
         }
         
-        if (jobStatus.status !== 'completed') {
-          // If the job is not completed, poll for updates
-          const pollingInterval = setInterval(async () => {
-            try {
-              const updatedStatus = await getJobStatus(storedJobId)
-              
-              if (updatedStatus.status === 'completed' || updatedStatus.status === 'failed') {
-                clearInterval(pollingInterval)
-                
-                if (updatedStatus.status === 'failed') {
-                  setError(updatedStatus.error || 'Failed to process model')
-                } else {
-                  // Process the completed job
-                  processCompletedJob(updatedStatus, storedQuality || "standard", 1, false)
-                }
+        if (jobStatus.status === 'cancelled') {
+          setError(jobStatus.cancel_reason || 'This quote was cancelled')
+          return
+        }
+        
+        if (!FINAL_STATUSES.includes(jobStatus.status)) {
+          // If the job is not completed, wait for the server to push updates
+          const stopWatching = watchJobStatus(
+            storedJobId,
+            (updatedStatus) => {
+              if (updatedStatus.status === 'failed') {
+                setError(updatedStatus.error || 'Failed to process model')
+              } else if (updatedStatus.status === 'cancelled') {
+                setError(updatedStatus.cancel_reason || 'This quote was cancelled')
+              } else if (FINAL_STATUSES.includes(updatedStatus.status)) {
+                // Process the completed job
+                processCompletedJob(updatedStatus, storedQuality || "standard", 1, false)
               }
-            } catch (err: any) {
-              clearInterval(pollingInterval)
-              setError(err.message || 'Failed to get job status')
-            }
-          }, 3000)
+            },
+            (err) => setError(err.message || 'Failed to get job status')
+          )
           
-          // Clean up interval on component unmount
-          return () => clearInterval(pollingInterval)
+          // Stop watching on component unmount
+          return stopWatching
         } else {
           // Process the completed job
           processCompletedJob(jobStatus, storedQuality || "standard", 1, false)
@@ -24,8 +24,9 @@ interface UploadParams {
  */
 interface JobStatus {
   id: string;
-  status: 'pending' | 'processing' | 'completed' | 'failed' | 'approved' | 'rejected';
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'approved' | 'rejected' | 'cancelled';
   created_at: number;
+  version?: number;
   filename: string;
   original_filename: string;
   material_id: string;
@@ -56,8 +57,14 @@ interface JobStatus {
     };
   };
   error?: string;
+  cancel_reason?: string;
 }
 
+/**
+ * Statuses a job never leaves (job_events.FINAL_STATUSES on the backend)
+ */
+export const FINAL_STATUSES: JobStatus['status'][] = ['completed', 'failed', 'approved', 'rejected', 'cancelled'];
+
 /**
  * Interface for material data
  */
@@ -185,6 +192,39 @@ export async function getJobStatus(jobId: string): Promise<JobStatus> {
   }
 }
 
+/**
+ * Follow a job's status over Server-Sent Events instead of polling
+ * @param jobId Job ID
+ * @param onUpdate Called with the job every time it changes
+ * @param onError Called if the stream is closed by an error
+ * @returns Function that stops watching
+ */
+export function watchJobStatus(
+  jobId: string,
+  onUpdate: (job: JobStatus) => void,
+  onError?: (error: Error) => void
+): () => void {
+  const source = new EventSource(`${API_BASE_URL}/api/job/${jobId}/events`);
+
+  source.onmessage = (event) => {
+    const job: JobStatus = JSON.parse(event.data);
+    // The server ends the stream at a final status; close so the browser doesn't reconnect
+    if (FINAL_STATUSES.includes(job.status)) {
+      source.close();
+    }
+    onUpdate(job);
+  };
+
+  source.onerror = () => {
+    // EventSource retries on its own unless the connection was refused outright
+    if (source.readyState === EventSource.CLOSED && onError) {
+      onError(new Error('Lost connection to job status updates'));
+    }
+  };
+
+  return () => source.close();
+}
+
 /**
  * Get all available materials and colors
  * @returns Promise with materials data
@@ -233,12 +273,16 @@ export async function updateMaterials(materialsData: MaterialsResponse): Promise
 }
 
 /**
- * Get all jobs (admin only)
- * @returns Promise with all jobs
+ * Get one page of jobs, newest first (admin only)
+ * @param params Optional filters: status, material_id, created_after, created_before, fields, limit, cursor
+ * @returns Promise with the jobs on the page and the cursor of the next page (null on the last page)
  */
-export async function getAllJobs(): Promise<JobStatus[]> {
+export async function getAllJobs(
+  params: Record<string, string> = {}
+): Promise<{ jobs: JobStatus[]; next_cursor: string | null }> {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/jobs`);
+    const query = new URLSearchParams(params).toString();
+    const response = await fetch(`${API_BASE_URL}/api/jobs${query ? `?${query}` : ''}`);
     
     if (!response.ok) {
       const errorData = await response.json();
@@ -0,0 +1,340 @@
+"""Admission control in front of PrusaSlicer.
+
+Several slicers at once on large models can run the container out of
+memory, and slicing one model at a time leaves cores idle. Each job's
+memory and CPU need is estimated from the scheduler's cost features
+(triangle count, bounding-box volume, infill, supports) and its expected
+slice time. Before a slicer starts, the job reserves that need against
+two budgets:
+
+- memory: ADMISSION_MEMORY_BUDGET_MB (default ADMISSION_MEMORY_FRACTION of
+  the cgroup or /proc/meminfo limit) for all reservations together, and
+  the memory available right now, less ADMISSION_MEMORY_HEADROOM_MB, must
+  still hold the job;
+- CPU: ADMISSION_CPU_BUDGET slicer threads (default the CPU count), less
+  whatever load /proc/loadavg shows beyond the reserved slicers.
+
+A job gets as many PrusaSlicer threads as its expected slice time warrants
+(one per SECONDS_PER_THREAD) and the free CPU allows, so slicers run wide
+when the host is idle and narrow under load. SLICER_MAX_THREADS (default
+half the CPU budget) keeps one large job from shutting out the rest.
+A job that finds nothing else running is always admitted, so a model
+larger than the budget still slices, alone. A job that has waited longer
+than ADMISSION_FAIR_WAIT_SECONDS holds back jobs that came after it.
+
+Reservations are rows in SQLite so the worker threads and worker.py's
+slicer processes share them; rows of processes that died are dropped.
+Slices record their peak memory in the slice span; check the estimate and
+refit it from the job store with
+
+    python3 admission.py check <jobs.db>
+    python3 admission.py calibrate <jobs.db> [output.json]
+"""
+import contextlib
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+import calibration
+import scheduler
+import slice_model
+from metrics import span
+
+# Coefficients over scheduler.FEATURES; `calibrate` replaces them
+DEFAULT_COEFFICIENTS = {
+    "memory_mb": [250.0, 90.0, 0.05, 0.1, 0.05],
+    "samples": 0,
+    "calibrated_at": None
+}
+
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_MEMORY_BUDGET_MB = float(os.environ.get("ADMISSION_MEMORY_BUDGET_MB", 0))
+ADMISSION_MEMORY_FRACTION = float(os.environ.get("ADMISSION_MEMORY_FRACTION", 0.8))
+ADMISSION_MEMORY_HEADROOM_MB = float(os.environ.get("ADMISSION_MEMORY_HEADROOM_MB", 512))
+ADMISSION_CPU_BUDGET = int(os.environ.get("ADMISSION_CPU_BUDGET", 0)) or (os.cpu_count() or 1)
+ADMISSION_FAIR_WAIT_SECONDS = float(os.environ.get("ADMISSION_FAIR_WAIT_SECONDS", 60))
+SLICER_MAX_THREADS = int(os.environ.get("SLICER_MAX_THREADS", 0)) or max(1, ADMISSION_CPU_BUDGET // 2)
+# Expected slice seconds worth one more PrusaSlicer thread
+SECONDS_PER_THREAD = 10.0
+# Seconds between admission attempts of a waiting job
+POLL_INTERVAL = 0.5
+
+CGROUP_V2 = "/sys/fs/cgroup"
+CGROUP_V1 = "/sys/fs/cgroup/memory"
+
+load_coefficients = calibration.CoefficientsFile(DEFAULT_COEFFICIENTS, "admission").load
+
+
+def estimate(features, expected_seconds, coefficients=DEFAULT_COEFFICIENTS):
+    """A job's need: {"memory_mb": peak slicer memory, "threads": threads worth giving it}"""
+    memory_mb = max(float(np.array(features) @ np.array(coefficients["memory_mb"])), 1.0)
+    threads = math.ceil((expected_seconds or 0.0) / SECONDS_PER_THREAD)
+    return {"memory_mb": round(memory_mb, 1), "threads": max(1, min(threads, SLICER_MAX_THREADS))}
+
+
+def job_need(job, coefficients=DEFAULT_COEFFICIENTS):
+    """estimate() for a stored job (jobs from before the scheduler go by file size)"""
+    features = job.get("cost_features") or scheduler.extract_features(
+        None, job.get("fill_density", 0.15), job.get("enable_supports", True), job.get("file_size", 0)
+    )
+    return estimate(features, job.get("expected_slice_seconds"), coefficients)
+
+
+def peak_memory_mb(spans):
+    """Peak slicer memory according to a run's spans (None if it wasn't sampled)"""
+    peaks = [item["peak_rss_mb"] for item in spans if item["name"] == "slice" and "peak_rss_mb" in item]
+    return max(peaks) if peaks else None
+
+
+# Live readings
+
+def _read_number(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if not value.isdigit():
+        # cgroup v2 writes "max" when there is no limit
+        return None
+    return int(value)
+
+
+def memory_status():
+    """(limit MB, available MB) for this container, the tighter of cgroup and /proc/meminfo; None where unknown"""
+    limit = available = None
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[1:2]}
+        limit = info["MemTotal"] / 1024.0
+        available = info.get("MemAvailable", info.get("MemFree", 0)) / 1024.0
+    except (OSError, ValueError, KeyError):
+        pass
+
+    for max_file, current_file in ((os.path.join(CGROUP_V2, "memory.max"), os.path.join(CGROUP_V2, "memory.current")),
+                                   (os.path.join(CGROUP_V1, "memory.limit_in_bytes"),
+                                    os.path.join(CGROUP_V1, "memory.usage_in_bytes"))):
+        cgroup_max = _read_number(max_file)
+        cgroup_current = _read_number(current_file)
+        # v1 reports "no limit" as a huge number
+        if cgroup_max is None or cgroup_current is None or cgroup_max >= 1 << 60:
+            continue
+        cgroup_limit = cgroup_max / (1024.0 * 1024.0)
+        cgroup_available = max(cgroup_max - cgroup_current, 0) / (1024.0 * 1024.0)
+        limit = cgroup_limit if limit is None else min(limit, cgroup_limit)
+        available = cgroup_available if available is None else min(available, cgroup_available)
+        break
+    return limit, available
+
+
+def cpu_load():
+    """One-minute load average (None where the platform has none)"""
+    try:
+        return os.getloadavg()[0]
+    except (OSError, AttributeError):
+        return None
+
+
+class AdmissionController:
+    """Memory and CPU reservations of running slicers, shared through an SQLite file"""
+
+    def __init__(self, db_path, memory_budget_mb=None, cpu_budget=None, headroom_mb=None,
+                 fair_wait_seconds=None, enabled=None, read_memory=memory_status, read_load=cpu_load):
+        self.db_path = db_path
+        self.enabled = ADMISSION_CONTROL if enabled is None else enabled
+        limit, _ = read_memory()
+        if memory_budget_mb is None:
+            memory_budget_mb = ADMISSION_MEMORY_BUDGET_MB or (limit * ADMISSION_MEMORY_FRACTION if limit else 0)
+        self.memory_budget_mb = memory_budget_mb or float("inf")
+        self.cpu_budget = cpu_budget or ADMISSION_CPU_BUDGET
+        self.headroom_mb = ADMISSION_MEMORY_HEADROOM_MB if headroom_mb is None else headroom_mb
+        self.fair_wait_seconds = ADMISSION_FAIR_WAIT_SECONDS if fair_wait_seconds is None else fair_wait_seconds
+        self.read_memory = read_memory
+        self.read_load = read_load
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS reservations (
+                holder TEXT PRIMARY KEY,
+                pid INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                memory_mb REAL NOT NULL,
+                threads INTEGER NOT NULL,
+                since REAL NOT NULL
+            )"""
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _drop_dead(self, conn):
+        for holder, pid in conn.execute("SELECT holder, pid FROM reservations").fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                conn.execute("DELETE FROM reservations WHERE holder = ?", (holder,))
+            except PermissionError:
+                pass
+
+    def _decide(self, rows, holder, need, since, now):
+        """Threads to start the slicer with, or None if it has to wait"""
+        running = [row for row in rows if row[1] == "running" and row[0] != holder]
+        reserved_mb = sum(row[2] for row in running)
+        reserved_threads = sum(row[3] for row in running)
+        if not running:
+            return max(1, min(need["threads"], self.cpu_budget))
+
+        # Let a job that has waited too long go first
+        if any(row[1] == "waiting" and row[0] != holder and row[4] < since and row[4] < now - self.fair_wait_seconds
+               for row in rows):
+            return None
+
+        if reserved_mb + need["memory_mb"] > self.memory_budget_mb:
+            return None
+        _, available_mb = self.read_memory()
+        if available_mb is not None and need["memory_mb"] > available_mb - self.headroom_mb:
+            return None
+
+        free_threads = self.cpu_budget - reserved_threads
+        load = self.read_load()
+        if load is not None:
+            # Load the reserved slicers don't account for is someone else's
+            free_threads = min(free_threads, (os.cpu_count() or 1) - max(load - reserved_threads, 0.0))
+        if free_threads < 1:
+            return None
+        return max(1, min(need["threads"], int(free_threads)))
+
+    def try_admit(self, holder, need, since=None):
+        """Reserve need for holder if it fits now; returns the thread count, or None (holder stays in line)"""
+        now = time.time()
+        since = now if since is None else since
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._drop_dead(conn)
+            rows = conn.execute("SELECT holder, state, memory_mb, threads, since FROM reservations").fetchall()
+            threads = self._decide(rows, holder, need, since, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO reservations (holder, pid, state, memory_mb, threads, since) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (holder, os.getpid(), "waiting" if threads is None else "running", need["memory_mb"],
+                 threads or 0, since)
+            )
+            conn.execute("COMMIT")
+            return threads
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, holder):
+        self._conn().execute("DELETE FROM reservations WHERE holder = ?", (holder,))
+
+    @contextlib.contextmanager
+    def admit(self, holder, need, should_cancel=None, spans=None):
+        """Wait until need fits, hold the reservation for the block and yield the slicer thread count.
+
+        The wait is timed into spans as "admission_wait" when it wasn't
+        immediate. should_cancel() is polled while waiting; returning True
+        raises SliceCancelled. Disabled, it yields None at once (PrusaSlicer
+        picks its own thread count).
+        """
+        if not self.enabled:
+            yield None
+            return
+        since = time.time()
+        try:
+            threads = self.try_admit(holder, need, since)
+            if threads is None:
+                with span(spans, "admission_wait"):
+                    while threads is None:
+                        if should_cancel is not None and should_cancel():
+                            raise slice_model.SliceCancelled("Job was cancelled")
+                        time.sleep(POLL_INTERVAL)
+                        threads = self.try_admit(holder, need, since)
+            yield threads
+        finally:
+            self.release(holder)
+
+    def stats(self):
+        """Reserved memory and threads of running slicers, and how many jobs wait for admission"""
+        rows = self._conn().execute(
+            "SELECT state, COUNT(*), COALESCE(SUM(memory_mb), 0), COALESCE(SUM(threads), 0) FROM reservations GROUP BY state"
+        ).fetchall()
+        by_state = {state: (count, memory_mb, threads) for state, count, memory_mb, threads in rows}
+        running = by_state.get("running", (0, 0.0, 0))
+        return {
+            "running": running[0],
+            "waiting": by_state.get("waiting", (0, 0.0, 0))[0],
+            "reserved_memory_mb": round(running[1], 1),
+            "reserved_threads": running[2],
+            "memory_budget_mb": None if math.isinf(self.memory_budget_mb) else round(self.memory_budget_mb, 1),
+            "cpu_budget": self.cpu_budget
+        }
+
+
+# Checking and calibration against finished jobs
+
+def _sample(job):
+    if job.get("cost_features") and job.get("actual_slice_memory_mb"):
+        return job["cost_features"], job.get("expected_slice_seconds"), job["actual_slice_memory_mb"]
+    return None
+
+
+def collect_samples(store):
+    """(features, expected slice seconds, peak MB) for every completed job whose slicer memory was sampled"""
+    return calibration.job_samples(store, _sample)
+
+
+def check(samples, coefficients=DEFAULT_COEFFICIENTS):
+    """How the memory estimate compares with measured peaks; underestimates are what risk the OOM killer"""
+    estimated = np.array([estimate(s[0], s[1], coefficients)["memory_mb"] for s in samples])
+    actual = np.array([s[2] for s in samples])
+    ratio = estimated / np.maximum(actual, 1e-9)
+    return {
+        "samples": len(samples),
+        "median_estimated_over_actual": round(float(np.median(ratio)), 3),
+        "p10_estimated_over_actual": round(float(np.percentile(ratio, 10)), 3),
+        "underestimated_pct": round(float((ratio < 1).mean()) * 100, 2)
+    }
+
+
+def calibrate(samples):
+    """Refit the memory model on measured peaks"""
+    if len(samples) < 2:
+        raise ValueError(f"Need at least 2 sliced jobs with memory readings, found {len(samples)}")
+    X = np.array([s[0] for s in samples])
+    y = np.array([s[2] for s in samples])
+    prior = DEFAULT_COEFFICIENTS["memory_mb"]
+    coefficients = {
+        "memory_mb": calibration.fit_ridge(X, y, prior).tolist(),
+        "samples": len(samples),
+        "calibrated_at": time.time()
+    }
+    loo = calibration.relative_errors(X, y, prior)
+    report = {
+        "samples": len(samples),
+        "coefficients": dict(zip(scheduler.FEATURES, coefficients["memory_mb"])),
+        "loo_mean_abs_pct_error": round(float(loo.mean()) * 100, 2),
+        "loo_p90_abs_pct_error": round(float(np.percentile(loo, 90)) * 100, 2)
+    }
+    return coefficients, report
+
+
+def main(argv):
+    return calibration.job_store_cli(argv, "admission", collect_samples, check, calibrate,
+                                     "No completed jobs with slicer memory readings", load_coefficients)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,286 @@
+"""Content-addressed storage for uploaded models and sliced G-code.
+
+Every artifact is stored once under objects/<aa>/<sha256><ext> and
+appears in the upload folder under its job's filename as a hardlink to
+that object, so duplicates of a popular part cost a directory entry
+instead of another copy and existing paths keep working. G-code is
+gzip-compressed on the way in (<name>.gcode.gz); /api/file serves it
+with Content-Encoding: gzip to clients that accept it.
+
+An SQLite index records which job each name belongs to and when it was
+last served. collect() enforces a disk quota by removing the least
+recently used names of jobs that are not protected; an object is
+deleted when its last name goes.
+
+    python3 artifact_store.py import <folder>   # adopt files written before the store existed
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+OBJECTS_DIR = "objects"
+# Bytes per read when hashing/compressing
+CHUNK_SIZE = 1024 * 1024
+# Extensions compressed on the way in
+COMPRESSED_EXTENSIONS = (".gcode",)
+# gzip level: 6 gets G-code to ~25% of its size at a fraction of level 9's cost
+GZIP_LEVEL = 6
+# last_used is only rewritten when older than this many seconds
+TOUCH_INTERVAL = 60
+# After a collection, usage is brought down to this fraction of the quota
+LOW_WATERMARK = 0.9
+# Times add_file rewrites an object that another process collected under it
+ADD_ATTEMPTS = 3
+
+
+class ArtifactStore:
+    """Hardlink-deduplicated artifact storage with an LRU disk quota"""
+
+    def __init__(self, root, db_path):
+        self.root = root
+        self.objects = os.path.join(root, OBJECTS_DIR)
+        os.makedirs(self.objects, exist_ok=True)
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS artifacts (
+                name TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                object TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                job_id TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_object ON artifacts (object)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_last_used ON artifacts (last_used)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _object_path(self, digest, ext):
+        return os.path.join(self.objects, digest[:2], digest + ext)
+
+    def add_file(self, path, name=None, job_id=None, digest=None):
+        """Move a file into the store and link it back as name; returns the stored name.
+
+        G-code is compressed, so its stored name gains a .gz suffix. digest
+        is the SHA-256 of the file contents, if the caller already has it.
+        """
+        name = name or os.path.basename(path)
+        ext = os.path.splitext(name)[1].lower()
+        compress = ext in COMPRESSED_EXTENSIONS
+        if digest is None:
+            digest = _hash_file(path)
+        stored_ext = ext + ".gz" if compress else ext
+        stored_name = name + ".gz" if compress else name
+        object_path = self._object_path(digest, stored_ext)
+
+        # Until a name links to the object, remove() in another process may delete it,
+        # so the incoming file is only dropped once the link is made
+        for _ in range(ADD_ATTEMPTS):
+            if not os.path.exists(object_path):
+                self._write_object(path, object_path, compress)
+            try:
+                self._add_name(stored_name, digest, object_path, os.path.getsize(object_path), job_id)
+                break
+            except FileNotFoundError:
+                # Collected between the check and the link; write it again
+                continue
+        else:
+            raise FileNotFoundError(f"Object {object_path} kept disappearing while storing {name}")
+        # Drop the incoming copy, unless it sat under the stored name and has just become the link
+        if os.path.abspath(path) != os.path.abspath(os.path.join(self.root, stored_name)):
+            os.unlink(path)
+        return stored_name
+
+    def _write_object(self, path, object_path, compress):
+        """Write the object for path (gzipped if compress), leaving path in place"""
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(object_path), suffix=".part")
+        if compress:
+            with open(path, "rb") as src, os.fdopen(fd, "wb") as raw, \
+                    gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=GZIP_LEVEL, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.chmod(tmp_path, 0o644)
+        else:
+            os.close(fd)
+            os.unlink(tmp_path)
+            try:
+                os.link(path, tmp_path)
+            except OSError:
+                shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, object_path)
+
+    def _add_name(self, stored_name, digest, object_path, size, job_id):
+        """Link object_path into the root as stored_name and index it"""
+        link_path = os.path.join(self.root, stored_name)
+        if os.path.lexists(link_path):
+            os.unlink(link_path)
+        try:
+            os.link(object_path, link_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # Filesystem without hardlinks: fall back to a copy
+            shutil.copyfile(object_path, link_path)
+
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO artifacts (name, digest, object, size, job_id, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stored_name, digest, os.path.relpath(object_path, self.root), size, job_id, now, now)
+        )
+
+    def _row(self, name):
+        """Index row for name, or for name + ".gz" if it was stored compressed"""
+        return self._conn().execute(
+            "SELECT name, digest, object, size FROM artifacts WHERE name IN (?, ?) ORDER BY name LIMIT 1",
+            (name, name + ".gz")
+        ).fetchone()
+
+    def stored_name(self, name):
+        """The indexed name of an artifact (name, or name + ".gz" if stored compressed), or None"""
+        row = self._row(name)
+        return row[0] if row else None
+
+    def link(self, name, new_name, job_id=None):
+        """Store an existing artifact under another name too (no copy); returns the stored name or None"""
+        row = self._row(name)
+        if row is None:
+            return None
+        stored_name, digest, object_rel, size = row
+        if stored_name.endswith(".gz") and not new_name.endswith(".gz"):
+            new_name += ".gz"
+        try:
+            self._add_name(new_name, digest, os.path.join(self.root, object_rel), size, job_id)
+        except FileNotFoundError:
+            # The object was collected in the meantime
+            return None
+        return new_name
+
+    def touch(self, name):
+        """Mark an artifact as used now (for LRU ordering)"""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE artifacts SET last_used = ? WHERE name = ? AND last_used < ?",
+            (now, name, now - TOUCH_INTERVAL)
+        )
+
+    def usage(self):
+        """Bytes on disk held by stored objects"""
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT object, MAX(size) AS size FROM artifacts GROUP BY object)"
+        ).fetchone()
+        return row[0]
+
+    def stats(self):
+        conn = self._conn()
+        names, logical = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+        objects = conn.execute("SELECT COUNT(DISTINCT object) FROM artifacts").fetchone()[0]
+        return {"names": names, "objects": objects, "bytes_on_disk": self.usage(), "bytes_referenced": logical}
+
+    def remove(self, name):
+        """Delete one stored name, and its object if nothing else links to it; returns bytes freed"""
+        conn = self._conn()
+        row = conn.execute("SELECT object, size FROM artifacts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return 0
+        object_rel, size = row
+        conn.execute("DELETE FROM artifacts WHERE name = ?", (name,))
+        link_path = os.path.join(self.root, name)
+        if os.path.lexists(link_path):
+            os.unlink(link_path)
+        if conn.execute("SELECT 1 FROM artifacts WHERE object = ? LIMIT 1", (object_rel,)).fetchone():
+            return 0
+        object_path = os.path.join(self.root, object_rel)
+        if os.path.exists(object_path):
+            os.unlink(object_path)
+        return size
+
+    def collect(self, quota_bytes, is_protected=lambda job_id: False, batch_size=200):
+        """Remove least recently used artifacts until usage is under the quota; returns bytes freed.
+
+        is_protected(job_id) keeps the artifacts of jobs still needed
+        (queued, slicing or approved for printing).
+        """
+        usage = self.usage()
+        if usage <= quota_bytes:
+            return 0
+        target = quota_bytes * LOW_WATERMARK
+        freed = 0
+        protected = {}
+        skipped = 0
+        while usage - freed > target:
+            rows = self._conn().execute(
+                "SELECT name, job_id FROM artifacts ORDER BY last_used LIMIT ? OFFSET ?",
+                (batch_size, skipped)
+            ).fetchall()
+            if not rows:
+                break
+            for name, job_id in rows:
+                if usage - freed <= target:
+                    break
+                if job_id is not None:
+                    if job_id not in protected:
+                        protected[job_id] = is_protected(job_id)
+                    if protected[job_id]:
+                        skipped += 1
+                        continue
+                freed += self.remove(name)
+        return freed
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def import_folder(store, folder, extensions=(".stl", ".3mf", ".obj", ".gcode")):
+    """Adopt model and G-code files not yet in the store; returns (files, bytes_before, bytes_after)"""
+    files = 0
+    before = store.usage()
+    raw = 0
+    for entry in sorted(os.listdir(folder)):
+        path = os.path.join(folder, entry)
+        if not os.path.isfile(path) or os.path.splitext(entry)[1].lower() not in extensions:
+            continue
+        if os.stat(path).st_nlink > 1:
+            # Already a link into the store
+            continue
+        raw += os.path.getsize(path)
+        store.add_file(path, entry)
+        files += 1
+    return files, raw, store.usage() - before
+
+
+def main(argv):
+    if len(argv) < 3 or argv[1] != "import":
+        print("Usage: python3 artifact_store.py import <folder>", file=sys.stderr)
+        return 1
+    folder = argv[2]
+    store = ArtifactStore(folder, os.path.join(folder, "artifacts.db"))
+    files, raw, stored = import_folder(store, folder)
+    print(f"Imported {files} file(s): {raw / 1e6:.1f} MB -> {stored / 1e6:.1f} MB on disk")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
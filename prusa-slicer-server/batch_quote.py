@@ -0,0 +1,171 @@
+"""Batch quotes: many models in one request.
+
+POST /api/batch takes several model files, or one zip of them, with
+shared settings and optional per-part overrides. Parts with the same
+content and slicing parameters (fill density, supports, quality) form
+one child job, so a part listed several times or in several colors is
+sliced once. The parent job lists the parts and children; every time a
+child changes, summarize() recomputes its per-part prices (unit price
+times quantity) and the batch total.
+"""
+import json
+import os
+import zipfile
+
+from upload_ingest import IngestStream
+
+# Per-part settings a "parts" entry may override
+PART_FIELDS = ("quantity", "material_id", "color_id", "quality_id", "fill_density", "enable_supports")
+# Settings that change the slice (the rest only change the price)
+SLICING_FIELDS = ("fill_density", "enable_supports", "quality_id")
+MAX_QUANTITY = 10000
+# Bytes per read when extracting zip members
+CHUNK_SIZE = 1024 * 1024
+
+
+class BatchError(ValueError):
+    """The batch request is malformed; the message is safe to return to the client"""
+
+
+def parse_settings(values, defaults):
+    """Part settings from form fields or a "parts" entry, falling back to defaults"""
+    settings = dict(defaults)
+    for key in PART_FIELDS:
+        if key in values and values[key] is not None:
+            settings[key] = values[key]
+    try:
+        settings["quantity"] = int(settings.get("quantity", 1))
+        settings["fill_density"] = float(settings["fill_density"])
+    except (TypeError, ValueError):
+        raise BatchError("quantity must be an integer and fill_density a number")
+    if not 1 <= settings["quantity"] <= MAX_QUANTITY:
+        raise BatchError(f"quantity must be between 1 and {MAX_QUANTITY}")
+    if not 0.0 <= settings["fill_density"] <= 1.0:
+        raise BatchError("fill_density must be between 0 and 1")
+    settings["enable_supports"] = str(settings["enable_supports"]).lower() == "true"
+    for key in ("material_id", "color_id", "quality_id"):
+        settings[key] = str(settings[key])
+    return settings
+
+
+def parse_overrides(raw):
+    """Per-part settings from the "parts" form field: a JSON list of {"name": ..., <field>: value}"""
+    if not raw:
+        return {}
+    try:
+        entries = json.loads(raw)
+    except ValueError:
+        raise BatchError("parts must be a JSON list")
+    if not isinstance(entries, list) or not all(isinstance(e, dict) and "name" in e for e in entries):
+        raise BatchError("parts must be a list of objects with a \"name\"")
+    return {str(entry["name"]): entry for entry in entries}
+
+
+def match_override(name, overrides):
+    """The "parts" entry for a file, by its full name or its base name"""
+    return overrides.get(name) or overrides.get(os.path.basename(name))
+
+
+def extract_zip(path, directory, extensions, max_file_size, max_total_size, max_files):
+    """Stream the models in a zip into directory; returns [(member name, IngestResult)].
+
+    Sizes are counted on the decompressed bytes as they are written, so a
+    zip that lies about its sizes can't get past the limits. Raises
+    BatchError (or RequestEntityTooLarge for an oversized member).
+    """
+    results = []
+    streams = []
+    total = 0
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                base = os.path.basename(name)
+                if info.is_dir() or name.startswith("__MACOSX/") or base.startswith("."):
+                    continue
+                if "." not in base or base.rsplit(".", 1)[1].lower() not in extensions:
+                    continue
+                if len(results) >= max_files:
+                    raise BatchError(f"A batch may hold at most {max_files} files")
+                stream = IngestStream(directory, max_file_size)
+                streams.append(stream)
+                with archive.open(info) as src:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                        total += len(chunk)
+                        if total > max_total_size:
+                            raise BatchError(f"Batch is larger than {max_total_size / (1024 * 1024):.0f}MB unpacked")
+                        stream.write(chunk)
+                results.append((name, stream.finish()))
+    except BaseException as e:
+        for stream in streams:
+            stream.discard()
+        for _, result in results:
+            if os.path.exists(result.path):
+                os.unlink(result.path)
+        if isinstance(e, zipfile.BadZipFile):
+            raise BatchError("Archive is not a valid zip file") from None
+        raise
+    return results
+
+
+def group_parts(parts):
+    """Group parts that slice identically: {(content_hash, *slicing settings): [part, ...]} in upload order"""
+    groups = {}
+    for part in parts:
+        key = (part["content_hash"],) + tuple(part[field] for field in SLICING_FIELDS)
+        groups.setdefault(key, []).append(part)
+    return groups
+
+
+def summarize(parts, children, price_part, final_statuses):
+    """Aggregate a batch from its children; returns (status, fields for the parent job).
+
+    children maps child job id -> job (None if not stored yet);
+    price_part(part, slice_result) returns calculate_price's dict. The
+    batch stays "processing" until every child is final, then becomes
+    "completed" if every part got a price and "failed" otherwise.
+    """
+    lines = []
+    total = 0.0
+    counts = {"completed": 0, "failed": 0, "waiting": 0}
+    for part in parts:
+        child = children.get(part["job_id"]) or {"status": "pending"}
+        line = {
+            "name": part["name"],
+            "job_id": part["job_id"],
+            "quantity": part["quantity"],
+            "material_id": part["material_id"],
+            "color_id": part["color_id"],
+            "status": child["status"]
+        }
+        if child["status"] in ("completed", "approved", "rejected") and child.get("result"):
+            price_info = price_part(part, child["result"])
+            if "error" in price_info:
+                line["error"] = price_info["error"]
+                counts["failed"] += 1
+            else:
+                line["unit_price"] = price_info["total_price"]
+                line["total_price"] = round(price_info["total_price"] * part["quantity"], 2)
+                line["price_info"] = price_info
+                total += line["total_price"]
+                counts["completed"] += 1
+        elif child["status"] in final_statuses:
+            line["error"] = child.get("error") or f"Part was {child['status']}"
+            counts["failed"] += 1
+        else:
+            counts["waiting"] += 1
+        lines.append(line)
+
+    if counts["waiting"]:
+        status = "processing"
+    else:
+        status = "completed" if not counts["failed"] else "failed"
+    return status, {
+        "progress": {**counts, "total": len(parts)},
+        "result": {
+            "parts": lines,
+            "total_price": round(total, 2),
+            "total_quantity": sum(part["quantity"] for part in parts),
+            "unique_slices": len(children)
+        }
+    }
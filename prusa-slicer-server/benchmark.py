@@ -0,0 +1,542 @@
+"""Upload-to-quote benchmark over a folder of models (userModels/ by default).
+
+Replays every STL/3MF/OBJ in the folder through /api/upload, the slicing
+workers and pricing, in-process, and reports per-stage latency
+percentiles, throughput and peak RSS as JSON. prusa-slicer is replaced
+by a deterministic fake that answers each model with a stored .gcode
+from the same folder (the one sliced from it, if there is one), so the
+run needs no slicer and is repeatable offline:
+
+    python3 benchmark.py run ../userModels --output before.json
+    python3 benchmark.py run ../userModels --output after.json
+    python3 benchmark.py compare before.json after.json [--fail-over 10]
+
+Each run works in a fresh temporary UPLOAD_FOLDER; repeated or duplicate
+models are slice-cache hits, as they would be in production. Every
+completed job's G-code must download from /api/file; jobs whose G-code
+doesn't are listed under "gcode_missing". `--job-queue redis` runs the
+same replay through the distributed queue, on redis_standin.py and
+in-process slicer_node.py threads.
+
+`decimation` measures quote-time mesh simplification (mesh_decimation.py)
+on the folder instead: triangles removed, volume drift and, when a real
+prusa-slicer is on PATH, slice time saved and the drift in filament and
+print time between the original and the simplified mesh:
+
+    python3 benchmark.py decimation ../userModels [--max-error-mm 0.05] [--output decimation.json]
+"""
+import argparse
+import contextlib
+import datetime
+import glob
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MODEL_EXTENSIONS = (".stl", ".3mf", ".obj")
+# Files copied from the corpus folder into the run's UPLOAD_FOLDER
+CONFIG_FILES = ("materials.json", "prequote_coefficients.json")
+PROFILE_DIR = "prusaslicer-config"
+PERCENTILES = (50, 90, 95, 99)
+# Stage order in reports
+STAGES = ("upload", "analyze", "provisional_quote", "queue_wait", "read_3mf", "slice", "price", "process_job", "end_to_end")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Fake slicer
+
+def build_manifest(folder):
+    """Map model hashes to the stored G-code sliced from them; all G-code files are fallbacks"""
+    gcode_files = sorted(glob.glob(os.path.join(folder, "*.gcode")))
+    by_model = {}
+    for gcode_path in gcode_files:
+        model_path = os.path.splitext(gcode_path)[0] + ".stl"
+        if os.path.exists(model_path):
+            by_model[_sha256(model_path)] = gcode_path
+    return {"by_model": by_model, "fallback": gcode_files}
+
+
+def fake_slicer(argv):
+    """Stand-in for the prusa-slicer CLI: copy the stored G-code for the model to --output"""
+    with open(os.environ["FAKE_SLICER_MANIFEST"]) as f:
+        manifest = json.load(f)
+    model_path = argv[-1]
+    if "--info" in argv:
+        import mesh_analysis
+        try:
+            size = mesh_analysis.analyze_mesh(model_path).size
+        except (OSError, mesh_analysis.MeshError) as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        print(f"size_x = {size['x']:.6f}\nsize_y = {size['y']:.6f}\nsize_z = {size['z']:.6f}")
+        return 0
+    if "--output" not in argv or not manifest["fallback"]:
+        print("fake prusa-slicer: nothing to do", file=sys.stderr)
+        return 1
+
+    digest = _sha256(model_path)
+    gcode_path = manifest["by_model"].get(digest)
+    if gcode_path is None:
+        # Models without a stored slice get a fixed pick based on their content
+        gcode_path = manifest["fallback"][int(digest[:8], 16) % len(manifest["fallback"])]
+    # A fixed delay plus one proportional to the model's size, for a mixed load
+    delay = float(os.environ.get("FAKE_SLICER_DELAY", 0))
+    delay += float(os.environ.get("FAKE_SLICER_DELAY_PER_MB", 0)) * os.path.getsize(model_path) / 1e6
+    if delay:
+        time.sleep(delay)
+    shutil.copyfile(gcode_path, argv[argv.index("--output") + 1])
+    return 0
+
+
+def install_fake_slicer(workdir, manifest):
+    """Write the manifest and a prusa-slicer wrapper into workdir; returns the bin directory"""
+    manifest_path = os.path.join(workdir, "fake-slicer-manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    wrapper = os.path.join(bin_dir, "prusa-slicer")
+    with open(wrapper, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" fake-slicer "$@"\n')
+    os.chmod(wrapper, 0o755)
+    os.environ["FAKE_SLICER_MANIFEST"] = manifest_path
+    return bin_dir
+
+
+# Measurement
+
+class StageTimer:
+    """Collects per-stage durations from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, module, name, stage):
+        """Replace module.name with a version that records its duration under stage"""
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        setattr(module, name, timed)
+
+    def summary(self):
+        stages = {}
+        for stage in sorted(self.samples, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            values = np.array(self.samples[stage]) * 1000.0
+            stats = {"count": int(len(values)), "mean_ms": round(float(values.mean()), 3)}
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = round(float(np.percentile(values, p)), 3)
+            stats["max_ms"] = round(float(values.max()), 3)
+            stages[stage] = stats
+        return stages
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def collect_models(folder):
+    return sorted(
+        path for path in glob.glob(os.path.join(folder, "*"))
+        if path.lower().endswith(MODEL_EXTENSIONS)
+    )
+
+
+def prepare_upload_folder(folder, workdir):
+    """Copy the corpus's materials and profiles into workdir and install the fake slicer; returns its bin directory"""
+    os.makedirs(workdir, exist_ok=True)
+    for name in CONFIG_FILES:
+        if os.path.exists(os.path.join(folder, name)):
+            shutil.copyfile(os.path.join(folder, name), os.path.join(workdir, name))
+    if os.path.isdir(os.path.join(folder, PROFILE_DIR)):
+        shutil.copytree(os.path.join(folder, PROFILE_DIR), os.path.join(workdir, PROFILE_DIR), dirs_exist_ok=True)
+    return install_fake_slicer(workdir, build_manifest(folder))
+
+
+def run_benchmark(folder, workers=2, clients=4, repeat=1, job_store="sqlite", timeout=300.0, workdir=None,
+                  job_queue="local"):
+    """Replay the folder's models through the server and return the results dict"""
+    folder = os.path.abspath(folder)
+    models = collect_models(folder)
+    if not models:
+        raise ValueError(f"No models ({', '.join(MODEL_EXTENSIONS)}) found in {folder}")
+
+    workdir = workdir or tempfile.mkdtemp(prefix="quote-bench-")
+    bin_dir = prepare_upload_folder(folder, workdir)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    # The server reads its configuration at import time
+    os.environ["UPLOAD_FOLDER"] = workdir
+    os.environ["SLICER_WORKERS"] = str(workers)
+    os.environ["JOB_STORE"] = job_store
+    os.environ["JOB_QUEUE"] = job_queue
+    node_stop = threading.Event()
+    if job_queue == "redis":
+        import redis_standin
+        standin = redis_standin.start_standin()
+        os.environ["REDIS_URL"] = f"redis://127.0.0.1:{standin.port}/0"
+    import server
+    import slice_model
+    if job_queue == "redis":
+        import redis_queue
+        import slicer_node
+        # Slicer nodes with their own cache directory, sharing nothing with the API node but the queue
+        for i in range(workers):
+            threading.Thread(target=slicer_node.run_node, daemon=True,
+                             args=(redis_queue.queue_from_env(), node_stop, os.path.join(workdir, "node"))).start()
+
+    timer = StageTimer()
+    timer.wrap(server, "analyze_upload", "analyze")
+    timer.wrap(server, "build_provisional_quote", "provisional_quote")
+    timer.wrap(server, "convert_3mf_to_stl", "read_3mf")
+    timer.wrap(server, "calculate_price", "price")
+    timer.wrap(slice_model, "slice_model", "slice")
+    process_job = server.process_job
+
+    def timed_process_job(job_id, job=None):
+        start = time.perf_counter()
+        created_at = (server.jobs.get(job_id) or {}).get("created_at")
+        if created_at is not None:
+            timer.record("queue_wait", max(0.0, time.time() - created_at))
+        try:
+            return process_job(job_id, job)
+        finally:
+            timer.record("process_job", time.perf_counter() - start)
+
+    server.process_job = timed_process_job
+
+    def replay(model_path):
+        client = server.app.test_client()
+        start = time.perf_counter()
+        with open(model_path, "rb") as f:
+            response = client.post(
+                "/api/upload",
+                data={"file": (f, os.path.basename(model_path))},
+                content_type="multipart/form-data"
+            )
+        timer.record("upload", time.perf_counter() - start)
+        if response.status_code != 200:
+            return {"model": os.path.basename(model_path), "status": "rejected", "error": response.get_json().get("error")}
+
+        job_id = response.get_json()["job_id"]
+        event = server.job_events.subscribe(job_id)
+        try:
+            deadline = time.time() + timeout
+            while True:
+                event.clear()
+                job = server.jobs.get(job_id)
+                if job["status"] in ("completed", "failed") or time.time() > deadline:
+                    break
+                event.wait(min(1.0, max(0.0, deadline - time.time())))
+        finally:
+            server.job_events.unsubscribe(job_id, event)
+        if job["status"] == "completed":
+            timer.record("end_to_end", time.perf_counter() - start)
+        result = job.get("result") or {}
+        # The print file, or the quote-only G-code of a simplified mesh
+        gcode_file = result.get("gcode_file") or result.get("quote_gcode_file")
+        return {
+            "model": os.path.basename(model_path),
+            "status": job["status"],
+            "error": job.get("error"),
+            "cache_hit": result.get("cache_hit", False),
+            "gcode_ok": bool(gcode_file) and client.get(f"/api/file/{gcode_file}").status_code == 200
+        }
+
+    queue = models * repeat
+    started_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        outcomes = list(pool.map(replay, queue))
+    wall = time.perf_counter() - wall_start
+    server.shutdown_workers()
+    node_stop.set()
+
+    completed = [o for o in outcomes if o["status"] == "completed"]
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": started_at,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": folder,
+            "models": len(models),
+            "workers": workers,
+            "clients": clients,
+            "repeat": repeat,
+            "job_store": job_store,
+            "job_queue": job_queue,
+            "fake_slicer_delay": float(os.environ.get("FAKE_SLICER_DELAY", 0)),
+            "fake_slicer_delay_per_mb": float(os.environ.get("FAKE_SLICER_DELAY_PER_MB", 0)),
+            "scheduler_policy": server.scheduler.SCHEDULER_POLICY,
+            "fast_lane_workers": server.scheduler.fast_lane_workers(workers)
+        },
+        "jobs": len(outcomes),
+        "completed": len(completed),
+        "failed": [o for o in outcomes if o["status"] != "completed"],
+        "cache_hits": sum(1 for o in completed if o["cache_hit"]),
+        "gcode_missing": [o["model"] for o in completed if not o["gcode_ok"]],
+        "wall_seconds": round(wall, 3),
+        "throughput_jobs_per_s": round(len(completed) / wall, 3) if wall > 0 else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        # Largest child process; a fork of the server counts at its pre-exec size
+        "peak_slicer_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0, 1),
+        "stages": timer.summary()
+    }
+
+
+def _drift_pct(original, simplified):
+    return round((simplified / original - 1.0) * 100.0, 4) if original else None
+
+
+def _abs_summary(values):
+    values = np.abs([v for v in values if v is not None])
+    if not len(values):
+        return None
+    return {"median": round(float(np.median(values)), 4), "max": round(float(values.max()), 4)}
+
+
+def run_decimation(folder, max_error_mm, above_triangles=0, fill_density=0.15, enable_supports=False, workdir=None):
+    """Simplify every STL/3MF in the folder and compare quote slices of the original and simplified mesh"""
+    import mesh_analysis
+    import mesh_decimation
+    import slice_model
+
+    folder = os.path.abspath(folder)
+    workdir = workdir or tempfile.mkdtemp(prefix="quote-decimation-")
+    profile_file = os.path.join(folder, PROFILE_DIR, "x1c.ini")
+    if not os.path.exists(profile_file):
+        profile_file = slice_model.PROFILE_FILE
+    slicer = shutil.which("prusa-slicer")
+    can_slice = slicer is not None and os.path.exists(profile_file)
+
+    def quote_slice(path, mesh_info, name):
+        spans = []
+        result = slice_model.slice_model(path, fill_density, enable_supports,
+                                         gcode_path=os.path.join(workdir, name + ".gcode"),
+                                         profile_file=profile_file, mesh_info=mesh_info, spans=spans)
+        return {
+            "slice_seconds": next(item["duration_ms"] for item in spans if item["name"] == "slice") / 1000.0,
+            "filament_used_g": result.filament_used_g,
+            "estimated_hours": slice_model.parse_time_string(result.estimated_time)
+        }
+
+    seen = set()
+    models = []
+    for path in collect_models(folder):
+        if not path.lower().endswith((".stl", ".3mf")):
+            continue
+        digest = _sha256(path)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        entry = {"model": os.path.basename(path)}
+        models.append(entry)
+        try:
+            triangles = mesh_analysis.load_mesh(path)
+        except (OSError, mesh_analysis.MeshError) as e:
+            entry["error"] = str(e)
+            continue
+        original = mesh_analysis.analyze_triangles(triangles)
+        entry["triangles_before"] = original.triangle_count
+        if above_triangles and not mesh_decimation.enabled(original.triangle_count, above_triangles):
+            entry["skipped"] = f"at most {above_triangles} triangles"
+            continue
+        result = mesh_decimation.decimate(triangles, max_error_mm)
+        simplified = mesh_analysis.analyze_triangles(result.triangles)
+        entry.update(result.stats())
+        entry["decimate_seconds"] = entry.pop("seconds")
+        entry["volume_drift_pct"] = _drift_pct(original.volume_mm3, simplified.volume_mm3)
+        if not can_slice:
+            continue
+
+        original_path = os.path.join(workdir, digest + ".stl")
+        simplified_path = os.path.join(workdir, digest + "_quote.stl")
+        mesh_analysis.write_binary_stl(triangles, original_path)
+        mesh_analysis.write_binary_stl(result.triangles, simplified_path)
+        try:
+            before = quote_slice(original_path, original, digest)
+            after = quote_slice(simplified_path, original, digest + "_quote")
+        except slice_model.SliceError as e:
+            entry["error"] = e.message
+            continue
+        entry["slice_seconds"] = [round(before["slice_seconds"], 3), round(after["slice_seconds"], 3)]
+        entry["filament_drift_pct"] = _drift_pct(before["filament_used_g"], after["filament_used_g"])
+        entry["time_drift_pct"] = _drift_pct(before["estimated_hours"], after["estimated_hours"])
+
+    decimated = [m for m in models if "triangles_after" in m]
+    sliced = [m for m in decimated if "slice_seconds" in m]
+    slice_before = sum(m["slice_seconds"][0] for m in sliced)
+    slice_after = sum(m["slice_seconds"][1] for m in sliced)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": folder,
+            "max_error_mm": max_error_mm,
+            "above_triangles": above_triangles,
+            "fill_density": fill_density,
+            "enable_supports": enable_supports,
+            "slicer": slicer if can_slice else None
+        },
+        "models": len(models),
+        "decimated": len(decimated),
+        "triangles_before": sum(m["triangles_before"] for m in decimated),
+        "triangles_after": sum(m["triangles_after"] for m in decimated),
+        "decimate_seconds": round(sum(m["decimate_seconds"] for m in decimated), 3),
+        "max_error_mm": max((m["max_error_mm"] for m in decimated), default=0.0),
+        "abs_volume_drift_pct": _abs_summary(m["volume_drift_pct"] for m in decimated),
+        # Only with a real slicer: the fake one answers from stored G-code
+        "sliced": len(sliced),
+        "slice_seconds": [round(slice_before, 3), round(slice_after, 3)] if sliced else None,
+        "slice_time_saved_pct": round((1 - slice_after / slice_before) * 100, 2) if slice_before else None,
+        "abs_filament_drift_pct": _abs_summary(m["filament_drift_pct"] for m in sliced),
+        "abs_time_drift_pct": _abs_summary(m["time_drift_pct"] for m in sliced),
+        "per_model": models
+    }
+
+
+def compare(base, new, fail_over=None):
+    """Print stage-by-stage changes between two result files; returns the number of regressions"""
+    regressions = 0
+    print(f"{'stage':<18}{'p50 ms':>22}{'p95 ms':>22}{'change p95':>12}")
+    for stage in STAGES:
+        if stage not in base["stages"] or stage not in new["stages"]:
+            continue
+        old_stats, new_stats = base["stages"][stage], new["stages"][stage]
+        change = (new_stats["p95_ms"] - old_stats["p95_ms"]) / old_stats["p95_ms"] * 100 if old_stats["p95_ms"] else 0.0
+        flag = ""
+        if fail_over is not None and change > fail_over:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{stage:<18}{old_stats['p50_ms']:>10.1f} -> {new_stats['p50_ms']:<9.1f}"
+              f"{old_stats['p95_ms']:>10.1f} -> {new_stats['p95_ms']:<9.1f}{change:>+11.1f}%{flag}")
+    print(f"throughput: {base['throughput_jobs_per_s']} -> {new['throughput_jobs_per_s']} jobs/s")
+    print(f"peak RSS:   {base['peak_rss_mb']} -> {new['peak_rss_mb']} MB")
+    return regressions
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == "fake-slicer":
+        return fake_slicer(argv[2:])
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="benchmark a folder of models")
+    run.add_argument("folder", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "userModels"))
+    run.add_argument("--workers", type=int, default=2, help="slicer worker threads (SLICER_WORKERS)")
+    run.add_argument("--clients", type=int, default=4, help="concurrent uploads")
+    run.add_argument("--repeat", type=int, default=1, help="times to replay the folder")
+    run.add_argument("--job-store", default="sqlite", choices=("sqlite", "memory"))
+    run.add_argument("--job-queue", default="local", choices=("local", "redis"),
+                     help="redis slices on in-process slicer nodes through redis_standin.py")
+    run.add_argument("--slice-delay", type=float, default=0.0, help="seconds the fake slicer sleeps per slice")
+    run.add_argument("--slice-delay-per-mb", type=float, default=0.0,
+                     help="extra seconds the fake slicer sleeps per MB of model")
+    run.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for each job")
+    run.add_argument("--output", help="write the JSON results here instead of stdout")
+    run.add_argument("--keep", action="store_true", help="keep the temporary upload folder")
+    decimation = commands.add_parser("decimation", help="measure quote-time mesh simplification on a folder")
+    decimation.add_argument("folder", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "userModels"))
+    decimation.add_argument("--max-error-mm", type=float, default=0.05, help="QUOTE_DECIMATE_MAX_ERROR_MM")
+    decimation.add_argument("--above-triangles", type=int, default=0,
+                            help="only simplify meshes above this many triangles (0 = all of them)")
+    decimation.add_argument("--fill-density", type=float, default=0.15)
+    decimation.add_argument("--supports", action="store_true", help="slice with supports")
+    decimation.add_argument("--output", help="write the JSON results here instead of stdout")
+    diff = commands.add_parser("compare", help="compare two result files")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    diff.add_argument("--fail-over", type=float, help="exit 1 if any stage's p95 grew by more than this percentage")
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return 1 if compare(base, new, args.fail_over) else 0
+
+    if args.command == "decimation":
+        workdir = tempfile.mkdtemp(prefix="quote-decimation-")
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                results = run_decimation(args.folder, args.max_error_mm, args.above_triangles,
+                                         args.fill_density, args.supports, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+            print(f"Wrote {args.output}: {results['decimated']}/{results['models']} models simplified, "
+                  f"{results['triangles_before']} -> {results['triangles_after']} triangles", file=sys.stderr)
+        else:
+            print(text)
+        return 0
+
+    os.environ["FAKE_SLICER_DELAY"] = str(args.slice_delay)
+    os.environ["FAKE_SLICER_DELAY_PER_MB"] = str(args.slice_delay_per_mb)
+    workdir = tempfile.mkdtemp(prefix="quote-bench-")
+    try:
+        # The server logs to stdout; keep it clear for the results
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_benchmark(args.folder, args.workers, args.clients, args.repeat,
+                                    args.job_store, args.timeout, workdir, args.job_queue)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}: {results['completed']}/{results['jobs']} jobs, "
+              f"{results['throughput_jobs_per_s']} jobs/s", file=sys.stderr)
+    else:
+        print(text)
+    if results["gcode_missing"]:
+        print(f"G-code missing for {len(results['gcode_missing'])} completed job(s)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,119 @@
+"""Shared plumbing of the fitted cost models (prequote, scheduler, admission).
+
+Each model keeps its coefficients in a JSON file next to the job store,
+merged over its defaults and re-read only when the file changes, and is
+refitted by ridge regression shrunk towards those defaults. scheduler.py
+and admission.py check and calibrate against finished jobs through the
+same `check|calibrate <jobs.db> [output.json]` command line.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+# Ridge strength pulling fitted coefficients towards the defaults
+RIDGE_LAMBDA = 1.0
+
+FINISHED_STATUSES = ("completed", "approved", "rejected")
+
+
+class CoefficientsFile:
+    """Calibrated coefficients over defaults, re-reading the file only when it changes"""
+
+    def __init__(self, defaults, label):
+        self.defaults = defaults
+        self.label = label
+        self._path = None
+        self._stat = None
+        self._coefficients = defaults
+
+    def load(self, path):
+        try:
+            st = os.stat(path)
+            stat_key = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return self.defaults
+
+        if self._path != path or self._stat != stat_key:
+            try:
+                with open(path, "r") as f:
+                    coefficients = {**self.defaults, **json.load(f)}
+            except (OSError, ValueError) as e:
+                print(f"Could not load {self.label} coefficients from {path}: {str(e)}", file=sys.stderr)
+                coefficients = self.defaults
+            self._path, self._stat, self._coefficients = path, stat_key, coefficients
+        return self._coefficients
+
+
+def fit_ridge(X, y, prior, lam=RIDGE_LAMBDA):
+    """Least squares shrunk towards prior, with the penalty scaled per feature"""
+    scale = np.sqrt((X ** 2).mean(axis=0))
+    scale[scale == 0] = 1.0
+    Xs = X / scale
+    prior_s = np.asarray(prior) * scale
+    A = Xs.T @ Xs + lam * np.eye(X.shape[1])
+    b = Xs.T @ y + lam * prior_s
+    return np.linalg.solve(A, b) / scale
+
+
+def relative_errors(X, y, prior, lam=RIDGE_LAMBDA):
+    """Leave-one-out relative errors of the ridge fit"""
+    errors = []
+    for i in range(len(y)):
+        mask = np.arange(len(y)) != i
+        w = fit_ridge(X[mask], y[mask], prior, lam)
+        errors.append(abs(X[i] @ w - y[i]) / max(y[i], 1e-9))
+    return np.array(errors)
+
+
+def job_samples(store, sample, page_size=500):
+    """sample(job) for every finished job in store, leaving out those it returns None for"""
+    samples = []
+    cursor = None
+    while True:
+        rows = store.query(statuses=FINISHED_STATUSES, cursor=cursor, limit=page_size)
+        for job_id, created_at, version, load in rows:
+            value = sample(load())
+            if value is not None:
+                samples.append(value)
+        if len(rows) < page_size:
+            return samples
+        cursor = (rows[-1][1], rows[-1][0])
+
+
+def job_store_cli(argv, name, collect_samples, check, calibrate, no_samples_error, load_coefficients=None):
+    """`python3 <name>.py check|calibrate <jobs.db> [output.json]`, writing <name>_coefficients.json by default.
+
+    check gets the coefficients in use as well when load_coefficients is given.
+    """
+    if len(argv) < 3 or argv[1] not in ("check", "calibrate"):
+        print(f"Usage: python3 {name}.py check|calibrate <jobs.db> [output.json]", file=sys.stderr)
+        return 1
+
+    from job_store import SQLiteJobStore
+
+    db_path = argv[2]
+    coefficients_path = os.path.join(os.path.dirname(db_path), f"{name}_coefficients.json")
+    samples = collect_samples(SQLiteJobStore(db_path))
+    if argv[1] == "check":
+        if not samples:
+            print(json.dumps({"error": no_samples_error}))
+            return 1
+        if load_coefficients is None:
+            result = check(samples)
+        else:
+            result = check(samples, load_coefficients(coefficients_path))
+        print(json.dumps(result, indent=2))
+        return 0
+
+    output = argv[3] if len(argv) > 3 else coefficients_path
+    try:
+        coefficients, report = calibrate(samples)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
+    with open(output, "w") as f:
+        json.dump(coefficients, f, indent=2)
+    print(json.dumps({**report, "output": output}, indent=2))
+    return 0
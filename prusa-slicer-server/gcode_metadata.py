@@ -0,0 +1,225 @@
+"""Read slice statistics from PrusaSlicer G-code without scanning the whole file.
+
+PrusaSlicer writes the statistics (filament used, cost, estimated time)
+followed by the full config block as `; key = value` comments at the very
+end of the file. Reading the tail is enough for well-formed output; files
+that don't follow that layout fall back to a streaming scan. has_supports
+is the `support_material` setting; whether any support was actually
+generated is only in the body (`;TYPE:Support` sections), so that is only
+looked for with scan_supports, which may read the whole file. Gzipped
+G-code (.gcode.gz, as kept by artifact_store) is read the same way after
+decompression.
+"""
+import gzip
+import math
+import os
+from dataclasses import dataclass, asdict, field
+
+# Initial tail window; the X1C footer + config block is ~22 KB
+TAIL_BYTES = 64 * 1024
+# Largest tail window tried before falling back to a full scan
+MAX_TAIL_BYTES = 1024 * 1024
+
+FILAMENT_G_KEY = "total filament used [g]"
+SUPPORT_TYPE_MARKERS = (";TYPE:Support material", ";TYPE:Support material interface")
+
+
+@dataclass
+class GcodeMetadata:
+    """Statistics of a sliced G-code file"""
+    filament_used_g: float = 0.0
+    estimated_time: str = "Unknown"
+    estimated_time_silent: str = None
+    has_supports: bool = False
+    filament_cost: float = None
+    # Per-extruder values, in extruder order
+    filament_used_mm: list = field(default_factory=list)
+    filament_used_cm3: list = field(default_factory=list)
+    filament_used_g_per_extruder: list = field(default_factory=list)
+    layer_count: int = None
+    layer_height: float = None
+    fill_density: float = None
+    config: dict = field(default_factory=dict, repr=False)
+
+    def to_dict(self, include_config=False):
+        data = asdict(self)
+        if not include_config:
+            data.pop("config")
+        return data
+
+
+def _parse_comment(line):
+    """Split a '; key = value' comment line, or return None"""
+    if not line.startswith("; ") or " = " not in line:
+        return None
+    key, value = line[2:].split(" = ", 1)
+    return key.strip(), value.strip()
+
+
+def _float_list(value):
+    try:
+        return [float(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        return []
+
+
+def _percent(value):
+    """Parse '15%' or '0.15' to a 0-1 fraction"""
+    try:
+        if value.endswith("%"):
+            return float(value[:-1]) / 100.0
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _read_tail(f, size):
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    f.seek(max(file_size - size, 0))
+    data = f.read()
+    if file_size > size:
+        # Drop the partial first line
+        data = data[data.find(b"\n") + 1:]
+    return data.decode("utf-8", errors="replace"), file_size <= size
+
+
+def _parse_footer(text):
+    values = {}
+    for line in text.splitlines():
+        parsed = _parse_comment(line)
+        if parsed:
+            values[parsed[0]] = parsed[1]
+    return values if FILAMENT_G_KEY in values else None
+
+
+def _collect_tail(gcode_path):
+    """Return the footer key/value pairs, or None if the tail has no stats"""
+    if gcode_path.endswith(".gz"):
+        return _collect_gzip_tail(gcode_path)
+    with open(gcode_path, "rb") as f:
+        size = TAIL_BYTES
+        while True:
+            text, whole_file = _read_tail(f, size)
+            values = _parse_footer(text)
+            if values is not None:
+                return values
+            if whole_file or size >= MAX_TAIL_BYTES:
+                return None
+            size *= 4
+
+
+def _collect_gzip_tail(gcode_path):
+    """gzip can't seek from the end: decompress, keeping only the last MAX_TAIL_BYTES"""
+    tail = b""
+    with gzip.open(gcode_path, "rb") as f:
+        for chunk in iter(lambda: f.read(MAX_TAIL_BYTES), b""):
+            tail = (tail + chunk)[-MAX_TAIL_BYTES:]
+    # Drop the partial first line
+    text = tail[tail.find(b"\n") + 1:].decode("utf-8", errors="replace")
+    return _parse_footer(text)
+
+
+def _collect_streaming(gcode_path):
+    """Full-file fallback: key/value comments plus support feature markers"""
+    values = {}
+    support_markers = False
+    opener = gzip.open if gcode_path.endswith(".gz") else open
+    with opener(gcode_path, "rt", errors="replace") as gcode:
+        for line in gcode:
+            if line.startswith(";TYPE:"):
+                if line.startswith(SUPPORT_TYPE_MARKERS):
+                    support_markers = True
+                continue
+            parsed = _parse_comment(line)
+            if parsed:
+                values[parsed[0]] = parsed[1]
+    return values, support_markers
+
+
+def _has_support_markers(gcode_path):
+    """Stream the G-code up to the first support extrusion; False if there is none"""
+    opener = gzip.open if gcode_path.endswith(".gz") else open
+    with opener(gcode_path, "rt", errors="replace") as gcode:
+        for line in gcode:
+            if line.startswith(SUPPORT_TYPE_MARKERS):
+                return True
+    return False
+
+
+def read_gcode_metadata(gcode_path, object_height=None, scan_supports=False):
+    """Extract slice statistics from a PrusaSlicer G-code file.
+
+    object_height (mm) lets the layer count be derived from the layer
+    heights in the config when the slicer doesn't write it out.
+    scan_supports makes has_supports mean support extrusions were
+    generated rather than enabled, at the cost of reading the body up to
+    the first one (all of it when the model needed none).
+    """
+    values = _collect_tail(gcode_path)
+    streamed = values is None
+    support_markers = False
+    if streamed:
+        values, support_markers = _collect_streaming(gcode_path)
+    enabled = values.get("support_material") == "1"
+    if scan_supports and enabled and not streamed:
+        support_markers = _has_support_markers(gcode_path)
+
+    meta = GcodeMetadata(config=values)
+    meta.filament_used_g = float(values.get(FILAMENT_G_KEY, 0.0))
+    meta.filament_used_mm = _float_list(values.get("filament used [mm]", ""))
+    meta.filament_used_cm3 = _float_list(values.get("filament used [cm3]", ""))
+    meta.filament_used_g_per_extruder = _float_list(values.get("filament used [g]", ""))
+
+    cost = values.get("total filament cost", values.get("filament cost"))
+    if cost is not None:
+        costs = _float_list(cost)
+        meta.filament_cost = sum(costs) if costs else None
+
+    for key, value in values.items():
+        if key.startswith("estimated printing time (normal mode)"):
+            meta.estimated_time = value
+        elif key.startswith("estimated printing time (silent mode)"):
+            meta.estimated_time_silent = value
+        elif key == "estimated printing time" and meta.estimated_time == "Unknown":
+            meta.estimated_time = value
+
+    if scan_supports:
+        meta.has_supports = support_markers
+    else:
+        # Supports were enabled in the config or the body has support extrusions
+        meta.has_supports = enabled or support_markers
+
+    if "fill_density" in values:
+        meta.fill_density = _percent(values["fill_density"])
+
+    try:
+        meta.layer_height = float(values["layer_height"])
+    except (KeyError, ValueError):
+        meta.layer_height = None
+
+    for key in ("total layers count", "total layer number", "total layers"):
+        if key in values:
+            try:
+                meta.layer_count = int(values[key])
+            except ValueError:
+                pass
+            break
+    else:
+        if object_height and meta.layer_height:
+            first_layer = _first_layer_height(values, meta.layer_height)
+            remaining = max(object_height - first_layer, 0.0)
+            meta.layer_count = 1 + math.ceil(round(remaining / meta.layer_height, 6))
+
+    return meta
+
+
+def _first_layer_height(values, layer_height):
+    """first_layer_height may be absolute (mm) or a percentage of layer_height"""
+    value = values.get("first_layer_height", "")
+    if value.endswith("%"):
+        return layer_height * float(value[:-1]) / 100.0
+    try:
+        return float(value)
+    except ValueError:
+        return layer_height
@@ -0,0 +1,22 @@
+# Gunicorn settings for the HTTP tier: gunicorn -c gunicorn.conf.py server:app
+# Slicing runs in worker.py; keep SLICER_WORKERS=0 for these processes.
+import os
+
+bind = os.environ.get("HTTP_BIND", "0.0.0.0:5000")
+
+# Request-handling processes; each keeps its own materials/pre-quote caches
+workers = int(os.environ.get("HTTP_WORKERS", 2 * (os.cpu_count() or 1) + 1))
+
+# Threads per process. Every open SSE stream or long-poll holds one thread,
+# so workers * threads bounds the number of concurrently watched jobs.
+worker_class = "gthread"
+threads = int(os.environ.get("HTTP_THREADS", 16))
+
+# Uploads are streamed to disk while being received; allow slow clients
+timeout = int(os.environ.get("HTTP_TIMEOUT", 120))
+graceful_timeout = 30
+
+# No preloading: every process opens its own SQLite connections after the fork
+preload_app = False
+
+accesslog = "-"
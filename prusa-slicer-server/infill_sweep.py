@@ -0,0 +1,218 @@
+"""Infill sweeps: quote every fill density from a few slices.
+
+POST /api/job/<id>/sweep slices the job's upload at a handful of anchor
+densities (SWEEP_ANCHORS), as child jobs that spread across the slicers
+like batch parts. For a fixed mesh, filament use and print time are close
+to piecewise-linear in infill, so between anchors they are interpolated
+linearly.
+
+Error bars come from the anchors themselves: leaving an interior anchor
+out and interpolating across its neighbours shows how far the curve bends
+there. That bend, as a curvature c, bounds the interpolation error inside
+an interval [a, b] by c / 2 * (x - a) * (b - x), which is zero at the
+anchors and largest halfway between them. Outside the anchors the same
+expression extrapolates the end interval. A query that lands in an
+interval whose error is above SWEEP_TOLERANCE_PCT queues one more anchor
+at the interval's midpoint, up to SWEEP_MAX_ANCHORS.
+"""
+import os
+
+import numpy as np
+
+import slice_model
+
+SWEEP_ANCHORS = os.environ.get("SWEEP_ANCHORS", "0,0.2,0.5,1")
+SWEEP_MAX_ANCHORS = int(os.environ.get("SWEEP_MAX_ANCHORS", 9))
+SWEEP_TOLERANCE_PCT = float(os.environ.get("SWEEP_TOLERANCE_PCT", 2.0))
+# Densities the stored curve is sampled at, besides the anchors
+CURVE_STEP = 0.05
+# Anchors are placed on this grid and never closer together than two steps
+ANCHOR_STEP = 0.01
+# Relative errors are taken against at least this much filament (g) / time (s)
+MIN_FILAMENT_G = 1.0
+MIN_TIME_S = 60.0
+
+
+class SweepError(ValueError):
+    """The sweep request is malformed; the message is safe to return to the client"""
+
+
+def parse_anchors(raw=None):
+    """Sorted, distinct anchor densities from a comma-separated list (default SWEEP_ANCHORS)"""
+    try:
+        values = [float(value) for value in str(raw or SWEEP_ANCHORS).split(",") if value.strip()]
+    except ValueError:
+        raise SweepError("anchors must be a comma-separated list of fill densities")
+    anchors = sorted({round(value / ANCHOR_STEP) * ANCHOR_STEP for value in values})
+    anchors = [round(value, 2) for value in anchors]
+    if any(not 0.0 <= value <= 1.0 for value in anchors):
+        raise SweepError("anchors must be between 0 and 1")
+    if not 2 <= len(anchors) <= SWEEP_MAX_ANCHORS:
+        raise SweepError(f"A sweep needs between 2 and {SWEEP_MAX_ANCHORS} distinct anchors")
+    return anchors
+
+
+class InfillFit:
+    """Piecewise-linear filament and print time over fill density, with error bounds"""
+
+    def __init__(self, densities, filament_g, time_s):
+        order = np.argsort(densities)
+        self.x = np.asarray(densities, dtype=float)[order]
+        self.filament_g = np.asarray(filament_g, dtype=float)[order]
+        self.time_s = np.asarray(time_s, dtype=float)[order]
+        self.filament_curvature = self._interval_curvature(self.filament_g)
+        self.time_curvature = self._interval_curvature(self.time_s)
+
+    def _interval_curvature(self, y):
+        """Curvature bound per interval from leave-one-out residuals at its interior end(s); NaN if unknown"""
+        x = self.x
+        at_anchor = np.full(len(x), np.nan)
+        if len(x) >= 3:
+            h1 = x[1:-1] - x[:-2]
+            h2 = x[2:] - x[1:-1]
+            across = y[:-2] + (y[2:] - y[:-2]) * h1 / (h1 + h2)
+            at_anchor[1:-1] = 2.0 * np.abs(y[1:-1] - across) / (h1 * h2)
+        # An end interval only has one interior anchor to go by
+        return np.fmax(at_anchor[:-1], at_anchor[1:])
+
+    def _interval(self, x):
+        """Index of the interval x falls in (the end intervals extend past the outer anchors)"""
+        return int(np.clip(np.searchsorted(self.x, x, side="right") - 1, 0, len(self.x) - 2))
+
+    def _evaluate(self, x, y, curvature):
+        i = self._interval(x)
+        a, b = self.x[i], self.x[i + 1]
+        value = y[i] + (y[i + 1] - y[i]) * (x - a) / (b - a)
+        error = curvature[i] / 2.0 * abs((x - a) * (b - x))
+        return max(float(value), 0.0), float(error)
+
+    def predict(self, x):
+        """Interpolated values and error bounds at fill density x; errors are None where unknown"""
+        filament_g, filament_err = self._evaluate(x, self.filament_g, self.filament_curvature)
+        time_s, time_err = self._evaluate(x, self.time_s, self.time_curvature)
+        if np.isclose(self.x, x).any():
+            filament_err = time_err = 0.0
+        return {
+            "filament_g": filament_g,
+            "filament_err": None if np.isnan(filament_err) else filament_err,
+            "time_s": time_s,
+            "time_err": None if np.isnan(time_err) else time_err
+        }
+
+    def interval_error_pct(self, i):
+        """Largest relative error inside interval i (at its midpoint), in percent; None if unknown"""
+        mid = (self.x[i] + self.x[i + 1]) / 2.0
+        point = self.predict(mid)
+        if point["filament_err"] is None or point["time_err"] is None:
+            return None
+        return 100.0 * max(point["filament_err"] / max(point["filament_g"], MIN_FILAMENT_G),
+                           point["time_err"] / max(point["time_s"], MIN_TIME_S))
+
+    def refine_anchor(self, x, tolerance_pct=None):
+        """Density to slice next to tighten the fit around x, or None if it is good enough there"""
+        tolerance_pct = SWEEP_TOLERANCE_PCT if tolerance_pct is None else tolerance_pct
+        if np.isclose(self.x, x).any():
+            return None
+        i = self._interval(x)
+        error_pct = self.interval_error_pct(i)
+        if error_pct is not None and error_pct <= tolerance_pct:
+            return None
+        if not self.x[0] <= x <= self.x[-1]:
+            # Past the outer anchors: measure the end itself
+            return 0.0 if x < self.x[0] else 1.0
+        mid = round(round((self.x[i] + self.x[i + 1]) / 2.0 / ANCHOR_STEP) * ANCHOR_STEP, 2)
+        if min(mid - self.x[i], self.x[i + 1] - mid) < 2 * ANCHOR_STEP - 1e-9:
+            return None
+        return mid
+
+
+def measured_points(anchors, children):
+    """[(fill_density, filament_used_g, print time s)] of the anchors whose slice finished"""
+    points = []
+    for anchor in anchors:
+        child = children.get(anchor["job_id"]) or {}
+        result = child.get("result")
+        if child.get("status") in ("completed", "approved", "rejected") and result:
+            points.append((anchor["fill_density"], result["filament_used_g"],
+                           slice_model.parse_time_string(result["estimated_time"]) * 3600.0))
+    return points
+
+
+def fit_points(points):
+    """InfillFit over measured points, or None with fewer than two"""
+    if len(points) < 2:
+        return None
+    return InfillFit([p[0] for p in points], [p[1] for p in points], [p[2] for p in points])
+
+
+def quote_point(fit, x, price):
+    """Filament, time and price at fill density x, with low/high bounds.
+
+    price(filament_used_g, estimated_time) returns calculate_price's dict.
+    The bounds are None while the fit has no error estimate for x.
+    """
+    point = fit.predict(x)
+    estimate = {
+        "fill_density": round(float(x), 4),
+        "filament_used_g": round(point["filament_g"], 2),
+        "estimated_time": slice_model.format_time_string(point["time_s"]),
+        "filament_used_g_range": None,
+        "estimated_time_range": None,
+        "price_range": None
+    }
+    price_info = price(estimate["filament_used_g"], estimate["estimated_time"])
+    estimate["price_info"] = price_info
+    if "error" in price_info or point["filament_err"] is None or point["time_err"] is None:
+        return estimate
+
+    filament = [max(point["filament_g"] - point["filament_err"], 0.0), point["filament_g"] + point["filament_err"]]
+    time_s = [max(point["time_s"] - point["time_err"], 0.0), point["time_s"] + point["time_err"]]
+    estimate["filament_used_g_range"] = [round(value, 2) for value in filament]
+    estimate["estimated_time_range"] = [slice_model.format_time_string(value) for value in time_s]
+    estimate["price_range"] = [
+        price(estimate["filament_used_g_range"][k], estimate["estimated_time_range"][k])["total_price"]
+        for k in (0, 1)
+    ]
+    return estimate
+
+
+def summarize(anchors, children, price, final_statuses):
+    """Aggregate a sweep from its anchor jobs; returns (status, fields for the sweep job).
+
+    The sweep stays "processing" while an anchor is still slicing. Once
+    two anchors have finished, the result carries a price curve sampled
+    every CURVE_STEP (and at each anchor); it is "completed" when every
+    anchor is final and at least two of them were sliced, "failed" otherwise.
+    """
+    lines = []
+    waiting = 0
+    for anchor in anchors:
+        child = children.get(anchor["job_id"]) or {"status": "pending"}
+        line = {"fill_density": anchor["fill_density"], "job_id": anchor["job_id"], "status": child["status"]}
+        result = child.get("result")
+        if child["status"] in ("completed", "approved", "rejected") and result:
+            line["filament_used_g"] = result["filament_used_g"]
+            line["estimated_time"] = result["estimated_time"]
+        elif child["status"] in final_statuses:
+            line["error"] = child.get("error") or f"Anchor was {child['status']}"
+        else:
+            waiting += 1
+        lines.append(line)
+
+    points = measured_points(anchors, children)
+    fit = fit_points(points)
+    result = {"anchors": lines, "curve": None, "interval_error_pct": None}
+    if fit is not None:
+        densities = sorted(set(np.round(np.arange(0.0, 1.0 + 1e-9, CURVE_STEP), 4)) | set(fit.x.round(4)))
+        result["curve"] = [quote_point(fit, x, price) for x in densities]
+        errors = [fit.interval_error_pct(i) for i in range(len(fit.x) - 1)]
+        result["interval_error_pct"] = [None if e is None else round(e, 2) for e in errors]
+
+    if waiting:
+        status = "processing"
+    else:
+        status = "completed" if fit is not None else "failed"
+    return status, {
+        "progress": {"measured": len(points), "waiting": waiting, "total": len(anchors)},
+        "result": result
+    }
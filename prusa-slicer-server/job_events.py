@@ -0,0 +1,131 @@
+"""Change notifications for jobs.
+
+Writers call publish() after a job changes; request threads waiting on a
+job block on a threading.Event until then, so an idle subscriber costs
+no CPU. Notifications only carry "this job changed": subscribers re-read
+the job from the store, which stays the source of truth.
+
+JobEvents works within one process. SocketJobEvents also relays publishes
+to the other processes sharing the job store through Unix datagram
+sockets in a common directory, one socket per listening process.
+"""
+import os
+import socket
+import threading
+
+# Statuses after which a job no longer changes on its own
+FINAL_STATUSES = ("completed", "failed", "rejected", "approved", "cancelled")
+
+
+class JobEvents:
+    """Per-job subscriber registry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, job_id):
+        """Register interest in job_id; returns the Event publish() will set.
+
+        Subscribe before reading the job so a change landing in between is
+        not missed.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, job_id, event):
+        with self._lock:
+            events = self._subscribers.get(job_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._subscribers[job_id]
+
+    def publish(self, job_id):
+        """Wake every subscriber of job_id"""
+        with self._lock:
+            events = list(self._subscribers.get(job_id, ()))
+        for event in events:
+            event.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(events) for events in self._subscribers.values())
+
+
+class SocketJobEvents(JobEvents):
+    """JobEvents relayed between processes through Unix datagram sockets.
+
+    Each process binds <directory>/<hostname>-<pid>.sock (the hostname
+    keeps containers sharing the directory apart) the first time something
+    subscribes and a listener thread blocks on it. publish() wakes local
+    subscribers and sends the job id to every other socket in the
+    directory; sockets of dead processes are removed on the way.
+    Delivery is best effort, so subscribers should still re-check the
+    store now and then.
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self._sender = None
+        self._sender_pid = None
+
+    def _socket_name(self, pid):
+        return f"{socket.gethostname()}-{pid}.sock"
+
+    def _ensure_listener(self):
+        """Bind this process's socket and start the receive thread (once per process)"""
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid == pid:
+                return
+            path = os.path.join(self.directory, self._socket_name(pid))
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            threading.Thread(target=self._listen, args=(sock,), name="job-events", daemon=True).start()
+            self._listener_pid = pid
+
+    def _listen(self, sock):
+        while True:
+            data = sock.recv(1024)
+            JobEvents.publish(self, data.decode())
+
+    def subscribe(self, job_id):
+        self._ensure_listener()
+        return super().subscribe(job_id)
+
+    def publish(self, job_id):
+        super().publish(job_id)
+        pid = os.getpid()
+        if self._sender_pid != pid:
+            # A socket inherited through fork would be shared with the parent
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+            self._sender_pid = pid
+        own = self._socket_name(pid)
+        message = job_id.encode()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".sock") or name == own:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                self._sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody listens here any more
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                # Receiver's buffer is full; it re-checks the store on its own
+                pass
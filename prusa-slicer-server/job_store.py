@@ -0,0 +1,385 @@
+"""Job storage backends.
+
+Jobs are plain dicts (see upload_file in server.py). Every backend returns
+copies, so callers can't mutate stored state behind the store's back;
+changes go through create/update/transition. Each change bumps the job's
+integer "version".
+"""
+import base64
+import json
+import sqlite3
+import threading
+import time
+
+# Statuses the retention policy may delete; approved jobs are orders and are kept
+EXPIRABLE_STATUSES = ("completed", "rejected", "failed", "cancelled")
+
+
+def encode_cursor(created_at, job_id):
+    """Opaque pagination cursor pointing just past (created_at, job_id)"""
+    raw = json.dumps([created_at, job_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = json.loads(raw)
+        return float(created_at), str(job_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _priority(job):
+    """Dispatch key of a job (see scheduler.py); jobs created without one go by age"""
+    priority = job.get("priority")
+    return job["created_at"] if priority is None else priority
+
+
+def _matches(job, statuses, material_id, created_after, created_before):
+    return (
+        (not statuses or job["status"] in statuses)
+        and (material_id is None or job.get("material_id") == material_id)
+        and (created_after is None or job["created_at"] >= created_after)
+        and (created_before is None or job["created_at"] < created_before)
+    )
+
+
+class MemoryJobStore:
+    """Process-local dict store (the original behaviour); lost on restart"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._polled = {}
+        self._lock = threading.RLock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = {**job, "version": 1}
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job and return the updated copy (None if missing)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields, version=job["version"] + 1)
+            return dict(job)
+
+    def transition(self, job_id, from_statuses, to_status, **fields):
+        """Atomically move a job to to_status if its status is in from_statuses.
+
+        Returns the updated job, or None if the job is missing or in another state.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in from_statuses:
+                return None
+            job.update(fields, status=to_status, version=job["version"] + 1)
+            return dict(job)
+
+    def claim_next(self, from_status, to_status, max_expected_seconds=None, **fields):
+        """Atomically move the lowest-priority job in from_status to to_status and return it (None if there is none).
+
+        With max_expected_seconds only jobs expected to slice within that long are considered.
+        """
+        with self._lock:
+            waiting = [
+                job for job in self._jobs.values()
+                if job["status"] == from_status and (
+                    max_expected_seconds is None
+                    or job.get("expected_slice_seconds", float("inf")) <= max_expected_seconds
+                )
+            ]
+            if not waiting:
+                return None
+            job = min(waiting, key=lambda job: (_priority(job), job["id"]))
+            job.update(fields, status=to_status, version=job["version"] + 1)
+            return dict(job)
+
+    def touch(self, job_id, when=None):
+        """Record that a client just asked for the job (no version bump)"""
+        with self._lock:
+            if job_id in self._jobs:
+                self._polled[job_id] = when or time.time()
+
+    def ids_not_polled_since(self, statuses, before):
+        """Ids of jobs in statuses whose last poll (or creation, if never polled) is before the given time"""
+        with self._lock:
+            return [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in statuses and self._polled.get(job_id, job["created_at"]) < before
+            ]
+
+    def list(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def ids_with_status(self, statuses):
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items() if job["status"] in statuses]
+
+    def backlog(self, statuses=("pending",)):
+        """(number of jobs in statuses, sum of their expected slice seconds)"""
+        with self._lock:
+            waiting = [job for job in self._jobs.values() if job["status"] in statuses]
+            return len(waiting), sum(job.get("expected_slice_seconds") or 0.0 for job in waiting)
+
+    def query(self, statuses=None, material_id=None, created_after=None, created_before=None, cursor=None, limit=50):
+        """Return up to limit jobs newest first, starting after cursor.
+
+        Rows are (job_id, created_at, version, load) where load() returns
+        the job dict, so callers can check versions before decoding.
+        """
+        with self._lock:
+            matching = [
+                job for job in self._jobs.values()
+                if _matches(job, statuses, material_id, created_after, created_before)
+                and (cursor is None or (job["created_at"], job["id"]) < cursor)
+            ]
+            matching.sort(key=lambda job: (job["created_at"], job["id"]), reverse=True)
+            return [
+                (job["id"], job["created_at"], job["version"], (lambda job=dict(job): job))
+                for job in matching[:limit]
+            ]
+
+    def evict(self, older_than, statuses=EXPIRABLE_STATUSES, batch_size=500):
+        """Delete jobs in statuses created before older_than; returns the count"""
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in statuses and job["created_at"] < older_than
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._polled.pop(job_id, None)
+            return len(expired)
+
+    def count(self):
+        with self._lock:
+            return len(self._jobs)
+
+
+class SQLiteJobStore:
+    """Durable store in a SQLite database (WAL mode).
+
+    Each thread gets its own connection; WAL lets readers proceed while a
+    writer commits, so HTTP and slicer processes can share one database
+    file. The job dict is stored as JSON with status, created_at,
+    priority and expected_slice_seconds copied into indexed columns.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                polled_at REAL,
+                priority REAL,
+                expected_seconds REAL,
+                data TEXT NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "version" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        if "polled_at" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN polled_at REAL")
+        if "priority" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN priority REAL")
+            conn.execute("ALTER TABLE jobs ADD COLUMN expected_seconds REAL")
+            conn.execute("UPDATE jobs SET priority = created_at")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created_at ON jobs (status, created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_priority ON jobs (status, priority, id)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job):
+        job = {**job, "version": 1}
+        self._conn().execute(
+            "INSERT INTO jobs (id, status, created_at, updated_at, version, priority, expected_seconds, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job["id"], job["status"], job["created_at"], time.time(), job["version"], _priority(job),
+             job.get("expected_slice_seconds"), json.dumps(job))
+        )
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _modify(self, job_id, check, fields, select=None):
+        """Read-modify-write a job inside an IMMEDIATE transaction.
+
+        select, if given, is a (query, params) pair picking the row instead of job_id.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if select is None:
+                select = ("SELECT data FROM jobs WHERE id = ?", (job_id,))
+            row = conn.execute(*select).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            job = json.loads(row[0])
+            if check is not None and not check(job):
+                conn.execute("ROLLBACK")
+                return None
+            job.update(fields, version=job.get("version", 1) + 1)
+            conn.execute(
+                "UPDATE jobs SET status = ?, created_at = ?, updated_at = ?, version = ?, priority = ?, "
+                "expected_seconds = ?, data = ? WHERE id = ?",
+                (job["status"], job["created_at"], time.time(), job["version"], _priority(job),
+                 job.get("expected_slice_seconds"), json.dumps(job), job["id"])
+            )
+            conn.execute("COMMIT")
+            return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job and return the updated copy (None if missing)"""
+        return self._modify(job_id, None, fields)
+
+    def transition(self, job_id, from_statuses, to_status, **fields):
+        """Atomically move a job to to_status if its status is in from_statuses.
+
+        Returns the updated job, or None if the job is missing or in another state.
+        """
+        return self._modify(job_id, lambda job: job["status"] in from_statuses, {**fields, "status": to_status})
+
+    def claim_next(self, from_status, to_status, max_expected_seconds=None, **fields):
+        """Atomically move the lowest-priority job in from_status to to_status and return it (None if there is none).
+
+        With max_expected_seconds only jobs expected to slice within that long
+        are considered. Safe to call from several processes at once: each job
+        is handed out once.
+        """
+        if max_expected_seconds is None:
+            select = ("SELECT data FROM jobs WHERE status = ? ORDER BY priority, id LIMIT 1", (from_status,))
+        else:
+            select = (
+                "SELECT data FROM jobs WHERE status = ? AND expected_seconds <= ? ORDER BY priority, id LIMIT 1",
+                (from_status, max_expected_seconds)
+            )
+        return self._modify(None, None, {**fields, "status": to_status}, select=select)
+
+    def touch(self, job_id, when=None):
+        """Record that a client just asked for the job (no version bump)"""
+        self._conn().execute("UPDATE jobs SET polled_at = ? WHERE id = ?", (when or time.time(), job_id))
+
+    def ids_not_polled_since(self, statuses, before):
+        """Ids of jobs in statuses whose last poll (or creation, if never polled) is before the given time"""
+        placeholders = ",".join("?" * len(statuses))
+        rows = self._conn().execute(
+            f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND COALESCE(polled_at, created_at) < ?",
+            (*statuses, before)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def list(self):
+        rows = self._conn().execute("SELECT data FROM jobs ORDER BY created_at").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def ids_with_status(self, statuses):
+        placeholders = ",".join("?" * len(statuses))
+        rows = self._conn().execute(
+            f"SELECT id FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at",
+            tuple(statuses)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def backlog(self, statuses=("pending",)):
+        """(number of jobs in statuses, sum of their expected slice seconds)"""
+        placeholders = ",".join("?" * len(statuses))
+        count, expected = self._conn().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(expected_seconds), 0) FROM jobs WHERE status IN ({placeholders})",
+            tuple(statuses)
+        ).fetchone()
+        return count, expected
+
+    def query(self, statuses=None, material_id=None, created_after=None, created_before=None, cursor=None, limit=50):
+        """Return up to limit jobs newest first, starting after cursor.
+
+        Rows are (job_id, created_at, version, load) where load() decodes
+        the job JSON, so callers can check versions before decoding.
+        """
+        clauses = []
+        params = []
+        if statuses:
+            clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if material_id is not None:
+            clauses.append("json_extract(data, '$.material_id') = ?")
+            params.append(material_id)
+        if created_after is not None:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before is not None:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        if cursor is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT id, created_at, version, data FROM jobs {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        return [
+            (job_id, created_at, version, (lambda data=data: json.loads(data)))
+            for job_id, created_at, version, data in rows
+        ]
+
+    def evict(self, older_than, statuses=EXPIRABLE_STATUSES, batch_size=500):
+        """Delete jobs in statuses created before older_than; returns the count.
+
+        Rows go in batch_size chunks so no single transaction blocks writers for long.
+        """
+        placeholders = ",".join("?" * len(statuses))
+        conn = self._conn()
+        total = 0
+        while True:
+            cur = conn.execute(
+                f"DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE created_at < ? "
+                f"AND status IN ({placeholders}) LIMIT ?)",
+                (older_than, *statuses, batch_size)
+            )
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                return total
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def create_job_store(kind, db_path=None):
+    """Build the job store named by kind ("sqlite" or "memory")"""
+    if kind == "memory":
+        return MemoryJobStore()
+    if kind == "sqlite":
+        return SQLiteJobStore(db_path)
+    raise ValueError(f"Unknown job store: {kind}")
@@ -0,0 +1,645 @@
+"""HTTP load and soak test for the quote API.
+
+Simulated customers arrive at --rate per second (Poisson; 0 keeps
+--concurrency customers busy back to back instead) and each one loads
+/api/materials, uploads a model from the folder and polls /api/job/<id>
+until the quote is final, while an admin polls /api/jobs. Everything goes
+over real HTTP to `python3 server.py`, started on a free port with a
+temporary UPLOAD_FOLDER and benchmark.py's fake prusa-slicer, whose
+latency is set with --slice-delay and --slice-delay-per-mb:
+
+    python3 loadtest.py run ../userModels --concurrency 200 --rate 5 --duration 300 --output load.json
+    python3 loadtest.py run ../userModels --rate 1 --duration 86400 --sample-interval 30   # soak
+    python3 loadtest.py check load.json [--thresholds loadtest_thresholds.json]
+
+--url points it at a server that is already running instead (RSS is then
+only sampled with --server-pid). The results hold per-endpoint latency
+percentiles and error rates, time to quote, queue depth and server RSS
+over time and the RSS growth rate; `run --thresholds` and `check` exit 1
+when any of them is past the limits in the thresholds file.
+"""
+import argparse
+import contextlib
+import datetime
+import fnmatch
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmark import PERCENTILES, collect_models, git_revision, prepare_upload_folder
+from job_events import FINAL_STATUSES
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest_thresholds.json")
+# Endpoint order in reports
+ENDPOINTS = ("materials", "upload", "job", "jobs", "metrics")
+# Gauges sampled from /metrics over time
+QUEUE_GAUGES = {
+    "quote_queue_depth": "queue_depth",
+    "quote_active_workers": "active_workers",
+    "quote_admission_waiting": "admission_waiting"
+}
+# RSS growth per hour is only judged over at least this long a window
+SOAK_MIN_SECONDS = 600
+REQUEST_TIMEOUT = 60.0
+# Error messages kept per endpoint in the results
+ERROR_EXAMPLES = 5
+
+
+# HTTP
+
+class Client:
+    """Minimal HTTP client for one base URL; a new connection per request, like a browser tab"""
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.https = parsed.scheme == "https"
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, headers=None):
+        """Returns (status, body bytes, headers dict); raises OSError or HTTPException"""
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        conn = connection_class(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.read(), dict(response.getheaders())
+        finally:
+            conn.close()
+
+
+def multipart(fields, file_name, file_data):
+    """(body, content type) of a multipart/form-data upload with one "file" part"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+                 f"Content-Type: application/octet-stream\r\n\r\n".encode())
+    parts.append(file_data)
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def unique_copy(data, name):
+    """The model with a random marker where it doesn't change the geometry, so it misses the slice cache.
+
+    Binary STL headers and OBJ comments are free for that; other formats are returned as they are.
+    """
+    marker = uuid.uuid4().hex.encode()
+    lower = name.lower()
+    if lower.endswith(".stl") and not data[:5].lower() == b"solid" and len(data) >= 84:
+        return marker.ljust(80, b" ") + data[80:]
+    if lower.endswith(".obj"):
+        return data + b"\n# " + marker + b"\n"
+    return data
+
+
+# Model mix
+
+def parse_mix(raw):
+    """[(pattern, weight)] from "glob=weight,glob=weight" (a bare glob weighs 1)"""
+    mix = []
+    for item in (raw or "").split(","):
+        if not item.strip():
+            continue
+        pattern, _, weight = item.partition("=")
+        try:
+            mix.append((pattern.strip(), float(weight) if weight else 1.0))
+        except ValueError:
+            raise ValueError(f"Invalid mix entry {item!r}: expected glob=weight")
+    return mix
+
+
+def model_weights(models, mix):
+    """[(path, weight)] of the models to draw uploads from; each model takes the weight of its first matching glob"""
+    if not mix:
+        return [(path, 1.0) for path in models]
+    weighted = []
+    for path in models:
+        name = os.path.basename(path)
+        weight = next((w for pattern, w in mix if fnmatch.fnmatch(name, pattern)), 0.0)
+        if weight > 0:
+            weighted.append((path, weight))
+    if not weighted:
+        raise ValueError("The model mix matches none of the models")
+    return weighted
+
+
+# Measurement
+
+class Recorder:
+    """Request outcomes per endpoint and quote outcomes, from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.requests = {}
+        self.error_examples = {}
+        self.quotes = []
+        self.dropped_arrivals = 0
+
+    def call(self, client, endpoint, method, path, body=None, headers=None):
+        """Make the request and record it; returns (status, body, headers) with status 0 on a connection error"""
+        start = time.perf_counter()
+        try:
+            status, data, response_headers = client.request(method, path, body, headers)
+            error = None if status < 400 or status == 429 else data[:200].decode(errors="replace")
+        except (OSError, http.client.HTTPException) as e:
+            status, data, response_headers = 0, b"", {}
+            error = f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.requests.setdefault(endpoint, []).append((start - self.started, elapsed, status))
+            if error is not None:
+                examples = self.error_examples.setdefault(endpoint, [])
+                if len(examples) < ERROR_EXAMPLES:
+                    examples.append(f"{status}: {error}")
+        return status, data, response_headers
+
+    def quote(self, outcome):
+        with self._lock:
+            self.quotes.append(outcome)
+
+    def drop_arrival(self):
+        with self._lock:
+            self.dropped_arrivals += 1
+
+    def endpoint_summary(self):
+        summary = {}
+        with self._lock:
+            requests = {endpoint: list(samples) for endpoint, samples in self.requests.items()}
+        for endpoint in sorted(requests, key=lambda e: ENDPOINTS.index(e) if e in ENDPOINTS else len(ENDPOINTS)):
+            samples = requests[endpoint]
+            statuses = [status for _, _, status in samples]
+            errors = sum(1 for status in statuses if status == 0 or (status >= 400 and status != 429))
+            # Latency is over answered requests; 429s are answered too, quickly
+            latencies = np.array([elapsed for _, elapsed, status in samples if status]) * 1000.0
+            stats = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "rejected": statuses.count(429),
+                "rejected_rate": round(statuses.count(429) / len(samples), 4),
+                "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses))}
+            }
+            if len(latencies):
+                stats["mean_ms"] = round(float(latencies.mean()), 3)
+                for p in PERCENTILES:
+                    stats[f"p{p}_ms"] = round(float(np.percentile(latencies, p)), 3)
+                stats["max_ms"] = round(float(latencies.max()), 3)
+            if endpoint in self.error_examples:
+                stats["error_examples"] = self.error_examples[endpoint]
+            summary[endpoint] = stats
+        return summary
+
+    def quote_summary(self):
+        with self._lock:
+            quotes = list(self.quotes)
+        counts = {}
+        for outcome in quotes:
+            counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+        accepted = len(quotes) - counts.get("rejected", 0) - counts.get("upload_error", 0)
+        unfinished = counts.get("failed", 0) + counts.get("timed_out", 0) + counts.get("poll_error", 0)
+        summary = {
+            "started": len(quotes),
+            "accepted": accepted,
+            "outcomes": counts,
+            "failed_rate": round(unfinished / accepted, 4) if accepted else None
+        }
+        errors = [f"{o.get('model')}: {o['error']}" for o in quotes if o.get("error")]
+        if errors:
+            summary["error_examples"] = errors[:ERROR_EXAMPLES]
+        seconds = np.array([o["seconds"] for o in quotes if o["status"] == "completed"])
+        if len(seconds):
+            summary["mean_s"] = round(float(seconds.mean()), 3)
+            for p in PERCENTILES:
+                summary[f"p{p}_s"] = round(float(np.percentile(seconds, p)), 3)
+            summary["max_s"] = round(float(seconds.max()), 3)
+        return summary
+
+
+def process_rss_mb(pid):
+    """Resident set size of a process in MB, or None if it can't be read"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def parse_gauges(text, names):
+    """{name: value} of the unlabelled samples of the given series in a Prometheus exposition"""
+    values = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in names:
+            try:
+                values[parts[0]] = float(parts[1])
+            except ValueError:
+                pass
+    return values
+
+
+def sample_server(client, recorder, pid, interval, stop, timeline):
+    """Append queue gauges and server RSS to timeline every interval seconds until stop is set"""
+    while True:
+        point = {"t": round(time.perf_counter() - recorder.started, 1)}
+        status, data, _ = recorder.call(client, "metrics", "GET", "/metrics")
+        if status == 200:
+            gauges = parse_gauges(data.decode(errors="replace"), QUEUE_GAUGES)
+            for name, key in QUEUE_GAUGES.items():
+                if name in gauges:
+                    point[key] = int(gauges[name])
+        if pid is not None:
+            rss = process_rss_mb(pid)
+            if rss is not None:
+                point["rss_mb"] = round(rss, 1)
+        timeline.append(point)
+        if stop.wait(interval):
+            return
+
+
+def queue_summary(timeline):
+    depths = [point["queue_depth"] for point in timeline if "queue_depth" in point]
+    if not depths:
+        return None
+    return {"max": max(depths), "mean": round(float(np.mean(depths)), 2), "final": depths[-1]}
+
+
+def rss_summary(timeline, warmup_s):
+    """Server RSS at the start, end and peak, and its growth after the warm-up (MB and MB/hour by least squares)"""
+    points = [(point["t"], point["rss_mb"]) for point in timeline if "rss_mb" in point]
+    if not points:
+        return None
+    steady = [p for p in points if p[0] >= warmup_s] or points
+    summary = {
+        "start_mb": points[0][1],
+        "end_mb": points[-1][1],
+        "peak_mb": max(rss for _, rss in points),
+        "warmup_s": warmup_s,
+        "window_s": round(steady[-1][0] - steady[0][0], 1),
+        "growth_mb": round(steady[-1][1] - steady[0][1], 1),
+        "growth_mb_per_hour": None
+    }
+    if len(steady) >= 3 and summary["window_s"] > 0:
+        t, rss = np.array(steady).T
+        summary["growth_mb_per_hour"] = round(float(np.polyfit(t, rss, 1)[0]) * 3600.0, 2)
+    return summary
+
+
+# Traffic
+
+class Customer:
+    """One simulated shopper: materials, upload, then poll the job until its quote is final"""
+
+    def __init__(self, client, recorder, models, args, seed):
+        self.client = client
+        self.recorder = recorder
+        self.models = models
+        self.args = args
+        self.random = random.Random(seed)
+
+    def pick_settings(self, materials):
+        settings = {"fill_density": self.random.choice((0.1, 0.15, 0.2, 0.3, 0.5))}
+        choices = [(m["id"], c["id"]) for m in (materials or {}).get("materials", []) for c in m.get("colors", [])]
+        if choices:
+            settings["material_id"], settings["color_id"] = self.random.choice(choices)
+        return settings
+
+    def session(self):
+        status, data, _ = self.recorder.call(self.client, "materials", "GET", "/api/materials")
+        materials = json.loads(data) if status == 200 else None
+
+        path = self.random.choices([p for p, _ in self.models], weights=[w for _, w in self.models])[0]
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            model = f.read()
+        if self.args.unique:
+            model = unique_copy(model, name)
+        body, content_type = multipart(self.pick_settings(materials), name, model)
+        started = time.perf_counter()
+        status, data, _ = self.recorder.call(self.client, "upload", "POST", "/api/upload", body,
+                                             {"Content-Type": content_type})
+        outcome = {"model": name}
+        if status != 200:
+            outcome["status"] = "rejected" if status == 429 else "upload_error"
+            self.recorder.quote(outcome)
+            return
+
+        job_id = json.loads(data)["job_id"]
+        deadline = started + self.args.quote_timeout
+        failures = 0
+        while True:
+            time.sleep(self.args.poll_interval)
+            status, data, _ = self.recorder.call(self.client, "job", "GET", f"/api/job/{job_id}")
+            if status == 200:
+                failures = 0
+                job = json.loads(data)
+                if job.get("status") in FINAL_STATUSES:
+                    outcome["status"] = job["status"]
+                    if job.get("error"):
+                        outcome["error"] = job["error"]
+                    break
+            else:
+                # A customer gives up after a few failed refreshes in a row
+                failures += 1
+                if failures >= 3:
+                    outcome["status"] = "poll_error"
+                    break
+            if time.perf_counter() > deadline:
+                outcome["status"] = "timed_out"
+                break
+        outcome["seconds"] = time.perf_counter() - started
+        self.recorder.quote(outcome)
+
+
+def admin_poller(client, recorder, interval, stop):
+    """The admin panel's job list, refreshed every interval seconds"""
+    while not stop.wait(interval):
+        recorder.call(client, "jobs", "GET", "/api/jobs?limit=50&fields=id,status,created_at,material_id")
+
+
+def generate_load(client, recorder, models, args):
+    """Run customers for args.duration seconds, then wait for the ones still polling"""
+    rng = random.Random(args.seed)
+    end = time.perf_counter() + args.duration
+    slots = threading.BoundedSemaphore(args.concurrency)
+
+    def run_customer(seed):
+        try:
+            Customer(client, recorder, models, args, seed).session()
+        except Exception as e:
+            recorder.quote({"status": "client_error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        if args.rate <= 0:
+            # Closed loop: every customer starts over as soon as its quote is final
+            def loop(index):
+                n = 0
+                while time.perf_counter() < end:
+                    slots.acquire()
+                    run_customer(f"{args.seed}-{index}-{n}")
+                    n += 1
+            for index in range(args.concurrency):
+                pool.submit(loop, index)
+            return
+
+        # Open loop: arrivals don't wait for earlier customers; past --concurrency they walk away
+        next_arrival = time.perf_counter()
+        while True:
+            next_arrival += rng.expovariate(args.rate)
+            if next_arrival >= end:
+                break
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            if slots.acquire(blocking=False):
+                pool.submit(run_customer, rng.random())
+            else:
+                recorder.drop_arrival()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_server(folder, workdir, workers, job_store, startup_timeout=60.0):
+    """Start server.py on a free port with a fake slicer; yields (base URL, pid)"""
+    bin_dir = prepare_upload_folder(folder, workdir)
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        "UPLOAD_FOLDER": workdir,
+        "PORT": str(port),
+        "SLICER_WORKERS": str(workers),
+        "JOB_STORE": job_store,
+        "JOB_QUEUE": "local",
+        "PYTHONUNBUFFERED": "1"
+    })
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    with open(os.path.join(workdir, "server.log"), "wb") as log:
+        process = subprocess.Popen([sys.executable, server_path], env=env, stdout=log, stderr=subprocess.STDOUT,
+                                   cwd=os.path.dirname(server_path))
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        client = Client(base_url, timeout=5.0)
+        deadline = time.time() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"server.py exited with {process.returncode}; see {workdir}/server.log")
+            try:
+                if client.request("GET", "/api/materials")[0] == 200:
+                    break
+            except (OSError, http.client.HTTPException):
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"server.py did not answer within {startup_timeout:.0f}s")
+            time.sleep(0.2)
+        yield base_url, process.pid
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_load(folder, args, workdir=None):
+    """Drive the API with args' traffic and return the results dict"""
+    folder = os.path.abspath(folder)
+    models = model_weights(collect_models(folder), parse_mix(args.mix))
+    os.environ["FAKE_SLICER_DELAY"] = str(args.slice_delay)
+    os.environ["FAKE_SLICER_DELAY_PER_MB"] = str(args.slice_delay_per_mb)
+
+    with contextlib.ExitStack() as stack:
+        if args.url:
+            base_url, pid = args.url, args.server_pid
+        else:
+            base_url, pid = stack.enter_context(local_server(folder, workdir, args.workers, args.job_store))
+        client = Client(base_url)
+        recorder = Recorder()
+        timeline = []
+        stop = threading.Event()
+        background = [
+            threading.Thread(target=sample_server, args=(client, recorder, pid, args.sample_interval, stop, timeline),
+                             daemon=True),
+            threading.Thread(target=admin_poller, args=(client, recorder, args.admin_interval, stop), daemon=True)
+        ]
+        started_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        for thread in background:
+            thread.start()
+        generate_load(client, recorder, models, args)
+        wall = time.perf_counter() - recorder.started
+        stop.set()
+        for thread in background:
+            thread.join()
+
+    warmup = args.warmup if args.warmup is not None else round(args.duration * 0.1, 1)
+    quotes = recorder.quote_summary()
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": started_at,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": folder,
+            "url": args.url,
+            "models": len(models),
+            "mix": args.mix,
+            "unique": args.unique,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "duration": args.duration,
+            "poll_interval": args.poll_interval,
+            "admin_interval": args.admin_interval,
+            "workers": None if args.url else args.workers,
+            "job_store": None if args.url else args.job_store,
+            "fake_slicer_delay": None if args.url else args.slice_delay,
+            "fake_slicer_delay_per_mb": None if args.url else args.slice_delay_per_mb
+        },
+        "wall_seconds": round(wall, 3),
+        "dropped_arrivals": recorder.dropped_arrivals,
+        "throughput_quotes_per_s": round(quotes["outcomes"].get("completed", 0) / wall, 3) if wall > 0 else None,
+        "endpoints": recorder.endpoint_summary(),
+        "quotes": quotes,
+        "queue_depth": queue_summary(timeline),
+        "rss": rss_summary(timeline, warmup),
+        "timeline": timeline
+    }
+
+
+# Thresholds
+
+def check(results, thresholds, path=()):
+    """Descriptions of every result above its limit; thresholds mirrors the results' nesting"""
+    violations = []
+    for key, limit in thresholds.items():
+        if key.startswith("_"):
+            continue
+        value = results.get(key) if isinstance(results, dict) else None
+        if isinstance(limit, dict):
+            violations += check(value or {}, limit, path + (key,))
+            continue
+        if value is None:
+            continue
+        if path == ("rss",) and key == "growth_mb_per_hour" and results.get("window_s", 0) < SOAK_MIN_SECONDS:
+            # Too short a window to tell a leak from warm-up noise
+            continue
+        if value > limit:
+            violations.append(f"{'.'.join(path + (key,))} = {value} (limit {limit})")
+    return violations
+
+
+def print_report(results, out=sys.stderr):
+    print(f"{'endpoint':<12}{'requests':>9}{'errors':>8}{'429':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=out)
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:<12}{stats['requests']:>9}{stats['errors']:>8}{stats['rejected']:>6}"
+              f"{stats.get('p50_ms', 0):>10.1f}{stats.get('p95_ms', 0):>10.1f}{stats.get('p99_ms', 0):>10.1f}", file=out)
+    quotes = results["quotes"]
+    print(f"quotes: {quotes['outcomes']}, time to quote p95 {quotes.get('p95_s')}s, "
+          f"{results['dropped_arrivals']} arrivals over --concurrency", file=out)
+    if results["queue_depth"]:
+        print(f"queue depth: max {results['queue_depth']['max']}, mean {results['queue_depth']['mean']}", file=out)
+    if results["rss"]:
+        rss = results["rss"]
+        print(f"server RSS: {rss['start_mb']} -> {rss['end_mb']} MB (peak {rss['peak_mb']}), "
+              f"{rss['growth_mb_per_hour']} MB/hour over {rss['window_s']}s", file=out)
+
+
+def load_thresholds(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def report_violations(violations):
+    for violation in violations:
+        print(f"THRESHOLD EXCEEDED: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="load the API with simulated customers")
+    run.add_argument("folder", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "userModels"))
+    run.add_argument("--concurrency", type=int, default=50, help="customers in flight at most")
+    run.add_argument("--rate", type=float, default=2.0,
+                     help="customer arrivals per second (0 = closed loop: --concurrency customers back to back)")
+    run.add_argument("--duration", type=float, default=60.0, help="seconds to keep customers arriving")
+    run.add_argument("--mix", help="model weights by file name glob, e.g. \"*.3mf=1,*Axle*=3\" (default: all equally)")
+    run.add_argument("--unique", action="store_true", help="make each STL/OBJ upload unique so it misses the slice cache")
+    run.add_argument("--poll-interval", type=float, default=1.0, help="seconds between a customer's job polls")
+    run.add_argument("--quote-timeout", type=float, default=600.0, help="seconds a customer waits for a quote")
+    run.add_argument("--admin-interval", type=float, default=5.0, help="seconds between admin /api/jobs refreshes")
+    run.add_argument("--sample-interval", type=float, default=2.0, help="seconds between queue depth/RSS samples")
+    run.add_argument("--warmup", type=float, help="seconds left out of RSS growth (default: 10%% of --duration)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--url", help="load this running server instead of starting one")
+    run.add_argument("--server-pid", type=int, help="with --url, the server process to sample RSS from")
+    run.add_argument("--workers", type=int, default=2, help="slicer worker threads of the local server (SLICER_WORKERS)")
+    run.add_argument("--job-store", default="sqlite", choices=("sqlite", "memory"))
+    run.add_argument("--slice-delay", type=float, default=1.0, help="seconds the fake slicer sleeps per slice")
+    run.add_argument("--slice-delay-per-mb", type=float, default=0.5,
+                     help="extra seconds the fake slicer sleeps per MB of model")
+    run.add_argument("--thresholds", help="exit 1 if results exceed the limits in this file")
+    run.add_argument("--output", help="write the JSON results here instead of stdout")
+    run.add_argument("--keep", action="store_true", help="keep the temporary upload folder and server.log")
+    limits = commands.add_parser("check", help="check a result file against thresholds")
+    limits.add_argument("results")
+    limits.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "check":
+        with open(args.results) as f:
+            results = json.load(f)
+        return report_violations(check(results, load_thresholds(args.thresholds)))
+
+    thresholds = load_thresholds(args.thresholds) if args.thresholds else None
+    workdir = None if args.url else tempfile.mkdtemp(prefix="quote-load-")
+    try:
+        results = run_load(args.folder, args, workdir)
+    finally:
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif workdir:
+            print(f"Kept {workdir}", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    print_report(results)
+    return report_violations(check(results, thresholds)) if thresholds else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
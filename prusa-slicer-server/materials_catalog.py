@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+class MaterialsCatalog:
+    """In-memory view of materials.json.
+
+    The file is parsed once and re-read only when its mtime or size
+    changes, so readers pay a single stat() per call. Material, color and
+    quality lookups go through dict indexes built at load time. The data
+    returned by get() is shared: callers must not mutate it.
+    """
+
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = defaults
+        self._lock = threading.Lock()
+        self._stat = None
+        self._load(defaults)
+
+    def _load(self, data, stat_key=None):
+        """Swap in new data and rebuild the indexes and serialized body"""
+        materials = {}
+        for material in data.get("materials", []):
+            materials[material.get("id")] = {
+                "material": material,
+                "colors": {c.get("id"): c for c in material.get("colors", [])}
+            }
+        qualities = {q.get("id"): q for q in data.get("global_settings", {}).get("quality_levels", []) or []}
+        body = json.dumps(data, sort_keys=True).encode()
+
+        self._data = data
+        self._materials = materials
+        self._qualities = qualities
+        self._body = body
+        self._etag = hashlib.sha256(body).hexdigest()[:32]
+        self._stat = stat_key
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Reload from disk if the file changed; create it from defaults if missing"""
+        stat_key = self._file_stat()
+        if stat_key is not None and stat_key == self._stat:
+            return
+        with self._lock:
+            stat_key = self._file_stat()
+            if stat_key is None:
+                self._write(self.defaults)
+                self._load(self.defaults, self._file_stat())
+                return
+            if stat_key == self._stat:
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Could not load materials from {self.path}: {str(e)}")
+                # Keep serving what we had; remember the stat so we don't re-parse every call
+                self._stat = stat_key
+                return
+            self._load(data, stat_key)
+
+    def _write(self, data):
+        """Atomically replace the materials file (temp file + rename)"""
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".materials-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates 0600; keep the file readable like a normal write would
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def save(self, data):
+        """Write new materials data and make it visible immediately"""
+        with self._lock:
+            self._write(data)
+            self._load(data, self._file_stat())
+
+    def get(self):
+        """Return the full materials data"""
+        self.refresh()
+        return self._data
+
+    def serialized(self):
+        """Return (json_body, etag) for the current data"""
+        self.refresh()
+        return self._body, self._etag
+
+    def find_material(self, material_id):
+        self.refresh()
+        entry = self._materials.get(material_id)
+        return entry["material"] if entry else None
+
+    def find_color(self, material_id, color_id):
+        self.refresh()
+        entry = self._materials.get(material_id)
+        return entry["colors"].get(color_id) if entry else None
+
+    def find_quality(self, quality_id):
+        self.refresh()
+        return self._qualities.get(quality_id)
@@ -0,0 +1,353 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from array import array
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+# Binary STL layout: 80 byte header, uint32 triangle count, then 50 byte records
+STL_HEADER_SIZE = 84
+STL_RECORD_DTYPE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+VERTEX_RE = re.compile(
+    rb"vertex\s+([-+0-9.eE]+)\s+([-+0-9.eE]+)\s+([-+0-9.eE]+)"
+)
+
+# 3MF core and production (multi-file models) namespaces
+CORE_NS = "{http://schemas.microsoft.com/3dmanufacturing/core/2015/02}"
+PRODUCTION_NS = "{http://schemas.microsoft.com/3dmanufacturing/production/2015/06}"
+MODEL_RELATIONSHIP = "http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"
+DEFAULT_MODEL_PATH = "3D/3dmodel.model"
+# Bambu Studio project settings: which objects sit on which plate
+BAMBU_MODEL_SETTINGS = "Metadata/model_settings.config"
+# Millimetres per 3MF model unit
+UNIT_SCALE = {
+    "micron": 0.001,
+    "millimeter": 1.0,
+    "centimeter": 10.0,
+    "inch": 25.4,
+    "foot": 304.8,
+    "meter": 1000.0,
+}
+# Component nesting deeper than this is treated as a reference cycle
+MAX_COMPONENT_DEPTH = 32
+# Parsed vertex/triangle elements are dropped from the tree in batches of this size
+PARSE_BATCH = 4096
+
+
+class MeshError(Exception):
+    """The mesh file could not be read"""
+
+
+@dataclass
+class MeshInfo:
+    """Geometry of a triangle mesh, all lengths in mm"""
+    triangle_count: int
+    size: dict
+    bbox_min: list
+    bbox_max: list
+    volume_mm3: float
+    surface_area_mm2: float
+
+    @property
+    def volume_cm3(self):
+        return self.volume_mm3 / 1000.0
+
+    @property
+    def surface_area_cm2(self):
+        return self.surface_area_mm2 / 100.0
+
+    def to_dict(self):
+        return {
+            **asdict(self),
+            "volume_cm3": self.volume_cm3,
+            "surface_area_cm2": self.surface_area_cm2
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of to_dict (the derived fields are dropped)"""
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__})
+
+
+def _binary_stl_count(file_path):
+    """Triangle count of a binary STL, or None if the file isn't laid out like one.
+
+    An exact size match is binary even with a "solid" header (some exporters
+    write one); otherwise trailing bytes after the triangles are tolerated
+    as long as the header doesn't look like ASCII STL.
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size < STL_HEADER_SIZE:
+        return None
+    with open(file_path, "rb") as f:
+        head = f.read(STL_HEADER_SIZE)
+    count = int.from_bytes(head[80:84], "little")
+    expected = STL_HEADER_SIZE + count * STL_RECORD_DTYPE.itemsize
+    if file_size == expected or (file_size > expected and head[:5].lower() != b"solid"):
+        return count
+    return None
+
+
+def is_binary_stl(file_path):
+    """True if the file holds at least as many binary STL records as its header declares"""
+    return _binary_stl_count(file_path) is not None
+
+
+def load_binary_stl(file_path):
+    """Memory-map a binary STL and return its (n, 3, 3) vertex array"""
+    count = _binary_stl_count(file_path) or 0
+    if count == 0:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    records = np.memmap(file_path, dtype=STL_RECORD_DTYPE, mode="r", offset=STL_HEADER_SIZE, shape=(count,))
+    return records["vertices"]
+
+
+def load_ascii_stl(file_path):
+    """Parse an ASCII STL and return its (n, 3, 3) vertex array"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    coords = VERTEX_RE.findall(data)
+    if len(coords) % 3 != 0:
+        raise MeshError(f"Malformed ASCII STL: {len(coords)} vertices is not a multiple of 3")
+    return np.array(coords, dtype=np.float64).reshape(-1, 3, 3)
+
+
+def load_stl(file_path):
+    """Return the (n, 3, 3) triangle array of a binary or ASCII STL"""
+    if is_binary_stl(file_path):
+        return load_binary_stl(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(5)
+    if head.lower() == b"solid":
+        return load_ascii_stl(file_path)
+    raise MeshError(f"Not a valid STL file: {file_path}")
+
+
+def _parse_transform(value):
+    """3MF transform attribute (12 numbers, row-vector convention) as a 4x4 matrix"""
+    matrix = np.identity(4)
+    if value:
+        numbers = [float(v) for v in value.split()]
+        if len(numbers) != 12:
+            raise MeshError(f"Malformed 3MF transform: {value!r}")
+        matrix[:, :3] = np.array(numbers).reshape(4, 3)
+    return matrix
+
+
+def _root_model_path(archive):
+    """Path of the root model part, from the package relationships"""
+    try:
+        rels = ET.fromstring(archive.read("_rels/.rels"))
+    except (KeyError, ET.ParseError):
+        return DEFAULT_MODEL_PATH
+    for rel in rels:
+        if rel.get("Type") == MODEL_RELATIONSHIP and rel.get("Target"):
+            return rel.get("Target").lstrip("/")
+    return DEFAULT_MODEL_PATH
+
+
+def _plate_objects(archive, plate):
+    """Ids of the objects on a Bambu Studio plate, or None for files without plates"""
+    try:
+        config = ET.fromstring(archive.read(BAMBU_MODEL_SETTINGS))
+    except (KeyError, ET.ParseError):
+        return None
+    plates = {}
+    for plate_elem in config.iter("plate"):
+        metadata = {m.get("key"): m.get("value") for m in plate_elem.findall("metadata")}
+        object_ids = set()
+        for instance in plate_elem.iter("model_instance"):
+            object_ids.update(m.get("value") for m in instance.findall("metadata") if m.get("key") == "object_id")
+        plates[metadata.get("plater_id")] = object_ids
+    if not plates:
+        return None
+    return plates.get(str(plate), set())
+
+
+def _parse_model_part(archive, part, objects):
+    """Stream one model part into objects; returns its build items.
+
+    objects maps (part, object id) to ("mesh", vertices, triangles) or
+    ("components", [(part, object id, transform), ...]). Vertices and
+    triangles are read with iterparse and the elements discarded as they
+    are consumed, so memory stays proportional to the arrays, not the XML.
+    """
+    scale = 1.0
+    coords = array("d")
+    indices = array("q")
+    components = []
+    items = []
+    container = None
+    try:
+        stream = archive.open(part)
+    except KeyError:
+        raise MeshError(f"3MF part {part} is missing")
+    with stream:
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == CORE_NS + "vertices" or tag == CORE_NS + "triangles":
+                    container = elem
+                elif tag == CORE_NS + "model":
+                    unit = elem.get("unit", "millimeter")
+                    if unit not in UNIT_SCALE:
+                        raise MeshError(f"Unsupported 3MF unit: {unit}")
+                    scale = UNIT_SCALE[unit]
+                continue
+
+            if tag == CORE_NS + "vertex":
+                coords.extend((float(elem.get("x")), float(elem.get("y")), float(elem.get("z"))))
+                if len(container) >= PARSE_BATCH:
+                    del container[:]
+            elif tag == CORE_NS + "triangle":
+                indices.extend((int(elem.get("v1")), int(elem.get("v2")), int(elem.get("v3"))))
+                if len(container) >= PARSE_BATCH:
+                    del container[:]
+            elif tag == CORE_NS + "component":
+                path = elem.get(PRODUCTION_NS + "path")
+                components.append((path.lstrip("/") if path else part, elem.get("objectid"),
+                                   _parse_transform(elem.get("transform"))))
+            elif tag == CORE_NS + "object":
+                key = (part, elem.get("id"))
+                if components:
+                    objects[key] = ("components", components)
+                elif coords:
+                    vertices = np.frombuffer(coords, dtype=np.float64).reshape(-1, 3) * scale
+                    triangles = np.frombuffer(indices, dtype=np.int64).reshape(-1, 3)
+                    if len(triangles) and (triangles.min() < 0 or triangles.max() >= len(vertices)):
+                        raise MeshError(f"3MF object {key[1]} references a vertex that does not exist")
+                    objects[key] = ("mesh", vertices, triangles)
+                coords = array("d")
+                indices = array("q")
+                components = []
+                elem.clear()
+            elif tag == CORE_NS + "item":
+                if elem.get("printable") != "0":
+                    items.append((part, elem.get("objectid"), _parse_transform(elem.get("transform"))))
+            elif tag == CORE_NS + "vertices" or tag == CORE_NS + "triangles":
+                elem.clear()
+                container = None
+    return items
+
+
+def load_3mf(file_path, plate=1):
+    """Return the (n, 3, 3) triangle array of every printable build item in a 3MF file.
+
+    Handles multiple objects, nested components (including components in
+    other model parts, as Bambu Studio writes them) and build transforms;
+    the result is in build-plate coordinates, in mm. Bambu Studio projects
+    lay their plates side by side in one build, so only the items on
+    plate are read from those.
+    """
+    try:
+        archive = zipfile.ZipFile(file_path)
+    except (OSError, zipfile.BadZipFile) as e:
+        raise MeshError(f"Not a valid 3MF file: {str(e)}")
+    with archive:
+        root = _root_model_path(archive)
+        on_plate = _plate_objects(archive, plate)
+        objects = {}
+        try:
+            items = _parse_model_part(archive, root, objects)
+            # Read the other parts components point into, once each
+            parsed = {root}
+            while True:
+                referenced = {c[0] for value in objects.values() if value[0] == "components" for c in value[1]}
+                if not referenced - parsed:
+                    break
+                for part in referenced - parsed:
+                    parsed.add(part)
+                    _parse_model_part(archive, part, objects)
+        except (ET.ParseError, ValueError, TypeError) as e:
+            raise MeshError(f"Malformed 3MF model: {str(e)}")
+
+    parts = []
+
+    def place(key, transform, depth):
+        if depth > MAX_COMPONENT_DEPTH:
+            raise MeshError("3MF components are nested too deeply (reference cycle?)")
+        obj = objects.get(key)
+        if obj is None:
+            raise MeshError(f"3MF build references missing object {key[1]} in {key[0]}")
+        if obj[0] == "components":
+            for part, object_id, child_transform in obj[1]:
+                place((part, object_id), child_transform @ transform, depth + 1)
+            return
+        _, vertices, triangles = obj
+        placed = vertices @ transform[:3, :3] + transform[3, :3]
+        parts.append(placed[triangles])
+
+    for part, object_id, transform in items:
+        if on_plate is None or object_id in on_plate:
+            place((part, object_id), transform, 0)
+    if not parts:
+        return np.empty((0, 3, 3), dtype=np.float64)
+    return np.concatenate(parts)
+
+
+def load_mesh(file_path):
+    """Return the triangle array of an STL or 3MF file"""
+    if file_path.lower().endswith(".3mf"):
+        return load_3mf(file_path)
+    return load_stl(file_path)
+
+
+def write_binary_stl(triangles, file_path):
+    """Write an (n, 3, 3) triangle array as a binary STL"""
+    tri = np.asarray(triangles, dtype=np.float64)
+    records = np.zeros(len(tri), dtype=STL_RECORD_DTYPE)
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    records["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records["vertices"] = tri
+    with open(file_path, "wb") as f:
+        f.write(b"binary STL written by mesh_analysis".ljust(80, b" "))
+        f.write(len(tri).to_bytes(4, "little"))
+        records.tofile(f)
+
+
+def analyze_triangles(triangles):
+    """Compute bounding box, signed volume and surface area of a triangle array"""
+    if len(triangles) == 0:
+        raise MeshError("Mesh has no triangles")
+
+    tri = np.asarray(triangles, dtype=np.float64)
+    v0, v1, v2 = tri[:, 0], tri[:, 1], tri[:, 2]
+
+    flat = tri.reshape(-1, 3)
+    bbox_min = flat.min(axis=0)
+    bbox_max = flat.max(axis=0)
+    size = bbox_max - bbox_min
+
+    # Sum of signed tetrahedra against the origin; orientation-independent via abs
+    volume = abs(np.einsum("ij,ij->i", v0, np.cross(v1, v2)).sum()) / 6.0
+    area = 0.5 * np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1).sum()
+
+    return MeshInfo(
+        triangle_count=int(len(tri)),
+        size={"x": float(size[0]), "y": float(size[1]), "z": float(size[2])},
+        bbox_min=bbox_min.tolist(),
+        bbox_max=bbox_max.tolist(),
+        volume_mm3=float(volume),
+        surface_area_mm2=float(area)
+    )
+
+
+def analyze_mesh(file_path):
+    """Analyze an STL or 3MF file and return its MeshInfo"""
+    return analyze_triangles(load_mesh(file_path))
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    for path in sys.argv[1:]:
+        print(json.dumps({"file": path, **analyze_mesh(path).to_dict()}))
@@ -0,0 +1,431 @@
+"""Quote-time mesh simplification.
+
+Scans and sculpts often carry far more triangles than a 0.4 mm nozzle
+can reproduce, and PrusaSlicer's time grows with the triangle count.
+With QUOTE_DECIMATE_ABOVE_TRIANGLES set, meshes above that many
+triangles are simplified by edge collapse before the quote slice, never
+moving the surface by more than QUOTE_DECIMATE_MAX_ERROR_MM. Only the
+quote uses the simplified copy: the uploaded file is kept as it is and
+is what production slices.
+
+The error of a collapse is the quadric error metric (Garland & Heckbert):
+every vertex carries the planes of the original faces merged into it,
+and the error is the root of the summed squared distances to them, so
+no plane is ever further away than the reported error. Collapses are
+applied in passes so the work stays in numpy: each pass picks edges that
+come first (cheapest error band, then a seeded shuffle) at both their
+ends, drops those whose neighbourhoods overlap, that would pinch the
+surface or flip a face, and collapses the rest at once. Boundary and
+non-manifold edges are kept. The shuffle is seeded from the mesh, so the
+same upload always simplifies the same way.
+
+    python3 mesh_decimation.py <model> [output.stl] [max_error_mm]
+"""
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import mesh_analysis
+
+# Simplify quote slices of meshes above this many triangles; 0 disables
+QUOTE_DECIMATE_ABOVE_TRIANGLES = int(os.environ.get("QUOTE_DECIMATE_ABOVE_TRIANGLES", 0))
+# Largest distance (mm) a collapse may move the surface
+QUOTE_DECIMATE_MAX_ERROR_MM = float(os.environ.get("QUOTE_DECIMATE_MAX_ERROR_MM", 0.05))
+
+MAX_PASSES = 100
+# Rounds of picking independent collapses within a pass
+SELECT_ROUNDS = 3
+# Edges are taken cheapest first in this many bands of error
+ERROR_LEVELS = 4
+# Stop once a pass removes less than this fraction of the triangles
+MIN_PASS_GAIN = 0.01
+# A collapse is rejected if it turns a face normal by more than ~78 degrees
+MIN_NORMAL_COS = 0.2
+# Below this determinant the optimal vertex position is ill-defined (flat or straight neighbourhoods)
+SINGULAR_DET = 1e-9
+
+
+@dataclass
+class DecimationResult:
+    """A simplified mesh and how far it went"""
+    triangles: np.ndarray
+    triangles_before: int
+    triangles_after: int
+    max_error_mm: float
+    passes: int
+    seconds: float
+
+    def stats(self):
+        return {
+            "triangles_before": self.triangles_before,
+            "triangles_after": self.triangles_after,
+            "max_error_mm": round(self.max_error_mm, 6),
+            "passes": self.passes,
+            "seconds": round(self.seconds, 3)
+        }
+
+
+def enabled(triangle_count, threshold=None):
+    """Whether a mesh of triangle_count triangles is simplified for its quote"""
+    threshold = QUOTE_DECIMATE_ABOVE_TRIANGLES if threshold is None else threshold
+    return threshold > 0 and triangle_count > threshold
+
+
+def weld(triangles):
+    """Shared-vertex form of a triangle soup: (vertices, faces), degenerate faces dropped"""
+    flat = np.ascontiguousarray(triangles, dtype=np.float64).reshape(-1, 3)
+    order = np.lexsort((flat[:, 2], flat[:, 1], flat[:, 0]))
+    ordered = flat[order]
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    inverse = np.empty(len(flat), dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    faces = inverse.reshape(-1, 3)
+    return ordered[first], faces[_nondegenerate(faces)]
+
+
+def _nondegenerate(faces):
+    return (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+
+
+def _face_planes(vertices, faces):
+    """(a, b, c, d) of each face's plane, unit normal; zeros for zero-area faces"""
+    v0 = vertices[faces[:, 0]]
+    normals = np.cross(vertices[faces[:, 1]] - v0, vertices[faces[:, 2]] - v0)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    return np.column_stack([normals, -np.einsum("ij,ij->i", normals, v0)])
+
+
+def _vertex_quadrics(vertex_count, faces, planes):
+    """Sum of the plane quadrics p pᵀ of every face around each vertex, flattened to 16 values"""
+    quadrics = np.zeros((vertex_count, 4, 4))
+    corners = faces.ravel()
+    for i in range(4):
+        for j in range(i, 4):
+            weights = np.repeat(planes[:, i] * planes[:, j], 3)
+            quadrics[:, i, j] = quadrics[:, j, i] = np.bincount(corners, weights=weights, minlength=vertex_count)
+    return quadrics.reshape(-1, 16)
+
+
+def _edge_keys(faces, vertex_count):
+    """Unique edges as sorted keys a * vertex_count + b (a < b), and how many faces share each"""
+    pairs = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    return np.unique(pairs[:, 0].astype(np.int64) * vertex_count + pairs[:, 1], return_counts=True)
+
+
+def _quadric_error(quadrics, points):
+    """x·Ax + 2b·x + c for the quadric [[A, b], [bᵀ, c]] at each point"""
+    ax = np.column_stack([np.einsum("ij,ij->i", quadrics[:, row:row + 3], points) for row in (0, 4, 8)])
+    linear = np.einsum("ij,ij->i", quadrics[:, [3, 7, 11]], points)
+    return np.maximum(np.einsum("ij,ij->i", points, ax) + 2.0 * linear + quadrics[:, 15], 0.0)
+
+
+def _placement(quadrics, va, vb):
+    """Best position for each collapsed edge and its squared error.
+
+    The quadric minimum when it is well defined and near the edge,
+    otherwise the best of the midpoint and the endpoints.
+    """
+    midpoint = (va + vb) / 2.0
+    # Solve A x = -b for the symmetric 3x3 A by its adjugate (cross products of its rows)
+    r0, r1, r2 = quadrics[:, 0:3], quadrics[:, 4:7], quadrics[:, 8:11]
+    c0, c1, c2 = np.cross(r1, r2), np.cross(r2, r0), np.cross(r0, r1)
+    det = np.einsum("ij,ij->i", r0, c0)
+    solvable = np.abs(det) > SINGULAR_DET
+    rhs = -quadrics[:, [3, 7, 11]]
+    solved = (rhs[:, 0:1] * c0 + rhs[:, 1:2] * c1 + rhs[:, 2:3] * c2) / np.where(solvable, det, 1.0)[:, None]
+    near = solvable & (np.linalg.norm(solved - midpoint, axis=1) <= np.linalg.norm(va - vb, axis=1))
+
+    position = solved
+    # At the minimum A x = -b, so the error reduces to b·x + c
+    error = np.maximum(np.einsum("ij,ij->i", -rhs, solved) + quadrics[:, 15], 0.0)
+    rest = np.nonzero(~near)[0]
+    if len(rest):
+        candidates = np.stack([midpoint[rest], va[rest], vb[rest]], axis=1)
+        errors = np.column_stack([_quadric_error(quadrics[rest], candidates[:, i]) for i in range(3)])
+        best = errors.argmin(axis=1)
+        rows = np.arange(len(rest))
+        position[rest] = candidates[rows, best]
+        error[rest] = errors[rows, best]
+    return position, error
+
+
+def _neighbours(a, b, vertex_count):
+    """CSR adjacency (indptr, indices) of the edge graph"""
+    src = np.concatenate([a, b])
+    order = np.argsort(src, kind="stable")
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=vertex_count))])
+    return indptr, np.concatenate([b, a])[order]
+
+
+def _ring_keys(indptr, indices, rows, vertex_count):
+    """owner * vertex_count + neighbour for the neighbours of each row vertex"""
+    lengths = indptr[rows + 1] - indptr[rows]
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner.astype(np.int64) * vertex_count + indices[np.repeat(indptr[rows], lengths) + offsets]
+
+
+class _Collapser:
+    """A welded mesh being simplified, with what carries over between passes"""
+
+    def __init__(self, triangles, max_error_mm):
+        self.vertices, self.faces = weld(triangles)
+        self.quadrics = _vertex_quadrics(len(self.vertices), self.faces, _face_planes(self.vertices, self.faces))
+        self.max_error_sq = max_error_mm ** 2
+        self.worst = 0.0
+        # Placements computed by the last pass, still valid for edges neither of whose ends moved since
+        self.cached_keys = np.empty(0, dtype=np.int64)
+        self.cached_position = np.empty((0, 3))
+        self.cached_error = np.empty(0)
+        self.moved = np.zeros(len(self.vertices), dtype=bool)
+        self.rng = np.random.default_rng(len(self.faces))
+
+    def _placements(self, keys, a, b):
+        hit = np.zeros(len(keys), dtype=bool)
+        slot = np.zeros(len(keys), dtype=np.int64)
+        if len(self.cached_keys):
+            slot = np.minimum(np.searchsorted(self.cached_keys, keys), len(self.cached_keys) - 1)
+            hit = (self.cached_keys[slot] == keys) & ~self.moved[a] & ~self.moved[b]
+        position = np.empty((len(keys), 3))
+        error = np.empty(len(keys))
+        position[hit] = self.cached_position[slot[hit]]
+        error[hit] = self.cached_error[slot[hit]]
+        miss = ~hit
+        position[miss], error[miss] = _placement(self.quadrics[a[miss]] + self.quadrics[b[miss]],
+                                                 self.vertices[a[miss]], self.vertices[b[miss]])
+        self.cached_keys, self.cached_position, self.cached_error = keys, position, error
+        self.moved[:] = False
+        return position, error
+
+    def collapse_pass(self, limit=None):
+        """Collapse one independent set of edges; returns the number collapsed"""
+        vertex_count = len(self.vertices)
+        keys, counts = _edge_keys(self.faces, vertex_count)
+        a, b = keys // vertex_count, keys % vertex_count
+        indptr, indices = _neighbours(a, b, vertex_count)
+        pinned = np.zeros(vertex_count, dtype=bool)
+        pinned[a[counts != 2]] = True
+        pinned[b[counts != 2]] = True
+        candidate = (counts == 2) & ~pinned[a] & ~pinned[b]
+        keys, a, b = keys[candidate], a[candidate], b[candidate]
+
+        position, error = self._placements(keys, a, b)
+        within = np.nonzero(error <= self.max_error_sq)[0]
+        if not len(within):
+            return 0
+        a, b, position, error = a[within], b[within], position[within], error[within]
+        # Cheapest first by coarse error level, shuffled within a level: strictly ordered
+        # errors vary smoothly over a surface and leave few edges cheapest for both ends
+        levels = np.minimum((np.sqrt(error / self.max_error_sq) * ERROR_LEVELS).astype(int), ERROR_LEVELS - 1)
+        priority = levels + self.rng.random(len(a))
+
+        open_edges = np.ones(len(a), dtype=bool)
+        blocked = np.zeros(vertex_count, dtype=bool)
+        taken = []
+        for _ in range(SELECT_ROUNDS):
+            accepted, rejected = self._select(a, b, position, priority, open_edges, blocked, indptr, indices)
+            if not len(accepted):
+                break
+            taken.append(accepted)
+            open_edges[accepted] = False
+            open_edges[rejected] = False
+
+        ids = np.sort(np.concatenate(taken)) if taken else np.empty(0, dtype=np.int64)
+        if limit is not None and len(ids) > limit:
+            ids = ids[np.argsort(priority[ids], kind="stable")[:limit]]
+        if not len(ids):
+            return 0
+        self.vertices[a[ids]] = position[ids]
+        self.quadrics[a[ids]] += self.quadrics[b[ids]]
+        self.moved[a[ids]] = True
+        remap = np.arange(vertex_count)
+        remap[b[ids]] = a[ids]
+        faces = remap[self.faces]
+        self.faces = faces[_nondegenerate(faces)]
+        self.worst = max(self.worst, float(error[ids].max()))
+        return len(ids)
+
+    def _select(self, a, b, position, priority, open_edges, blocked, indptr, indices):
+        """One round of picking independent collapses among the open edges.
+
+        Returns (accepted, rejected) edge indices; other open edges may
+        still be taken in a later round. Vertices around accepted
+        collapses are added to blocked.
+        """
+        vertices, faces = self.vertices, self.faces
+        vertex_count = len(vertices)
+
+        # Each vertex keeps only its best edge; an edge best for both ends is chosen
+        usable = np.nonzero(open_edges)[0]
+        usable = usable[~blocked[a[usable]] & ~blocked[b[usable]]]
+        rank = priority[usable]
+        best = np.full(vertex_count, np.inf)
+        np.minimum.at(best, a[usable], rank)
+        np.minimum.at(best, b[usable], rank)
+        chosen = usable[(best[a[usable]] == rank) & (best[b[usable]] == rank)]
+        ends = np.bincount(np.concatenate([a[chosen], b[chosen]]), minlength=vertex_count)
+        chosen = chosen[(ends[a[chosen]] == 1) & (ends[b[chosen]] == 1)]
+
+        # Link condition: the edge's ends may share only the two opposite vertices, or the collapse pinches the surface
+        shared = np.intersect1d(_ring_keys(indptr, indices, a[chosen], vertex_count),
+                                _ring_keys(indptr, indices, b[chosen], vertex_count), assume_unique=True)
+        pinches = np.bincount(shared // vertex_count, minlength=len(chosen)) != 2
+        rejected = [chosen[pinches]]
+        chosen = chosen[~pinches]
+
+        # Two collapses touching one face would both move it; the lower priority one waits
+        owner = np.full(vertex_count, -1)
+        owner[a[chosen]] = chosen
+        owner[b[chosen]] = chosen
+        around = faces[(owner[faces] >= 0).any(axis=1)]
+        while True:
+            touched = owner[around]
+            ordered = np.sort(touched, axis=1)
+            clash = ((ordered[:, 0] >= 0) & (ordered[:, 0] != ordered[:, 1])) | \
+                    ((ordered[:, 1] >= 0) & (ordered[:, 1] != ordered[:, 2]))
+            if not clash.any():
+                break
+            touched = touched[clash]
+            ranks = np.where(touched >= 0, priority[touched], -np.inf)
+            waiting = np.unique(touched[np.arange(len(touched)), ranks.argmax(axis=1)])
+            owner[a[waiting]] = -1
+            owner[b[waiting]] = -1
+
+        # Reject collapses that flip or flatten a surviving face
+        collapse = ordered[:, 2]
+        affected = collapse >= 0
+        around, collapse = around[affected], collapse[affected]
+        moved = (around == a[collapse][:, None]) | (around == b[collapse][:, None])
+        removed = moved.sum(axis=1) == 2
+        before = vertices[around]
+        after = np.where(moved[..., None], position[collapse][:, None, :], before)
+        normal_before = np.cross(before[:, 1] - before[:, 0], before[:, 2] - before[:, 0])
+        normal_after = np.cross(after[:, 1] - after[:, 0], after[:, 2] - after[:, 0])
+        turned = np.einsum("ij,ij->i", normal_before, normal_after) <= \
+            MIN_NORMAL_COS * np.linalg.norm(normal_before, axis=1) * np.linalg.norm(normal_after, axis=1)
+        flipped = np.unique(collapse[turned & ~removed])
+        rejected.append(flipped)
+        survivors = np.unique(collapse)
+        accepted = survivors[~np.isin(survivors, flipped, assume_unique=True)]
+
+        # Nothing else may touch the faces around an accepted collapse in this pass
+        blocked[around[np.isin(collapse, accepted, assume_unique=False)].ravel()] = True
+        return accepted, np.concatenate(rejected)
+
+    def triangles(self):
+        return self.vertices[_drop_coincident_faces(self.faces)]
+
+
+def _drop_coincident_faces(faces):
+    """Remove faces that sit on the same three vertices as another (zero-thickness leftovers)"""
+    keys = np.sort(faces, axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    return faces[counts[inverse.ravel()] == 1]
+
+
+def decimate(triangles, max_error_mm=None, target_triangles=0):
+    """Simplify an (n, 3, 3) triangle array by edge collapse.
+
+    Stops when no collapse stays within max_error_mm, or once the mesh
+    is down to target_triangles (0 = as far as the error allows).
+    """
+    started = time.perf_counter()
+    mesh = _Collapser(triangles, QUOTE_DECIMATE_MAX_ERROR_MM if max_error_mm is None else max_error_mm)
+    passes = 0
+    while passes < MAX_PASSES and len(mesh.faces) > target_triangles:
+        # Every collapse of a manifold edge removes two faces
+        limit = (len(mesh.faces) - target_triangles + 1) // 2 if target_triangles else None
+        collapsed = mesh.collapse_pass(limit)
+        if not collapsed:
+            break
+        passes += 1
+        if 2 * collapsed < MIN_PASS_GAIN * len(mesh.faces):
+            break
+
+    simplified = mesh.triangles()
+    return DecimationResult(
+        triangles=simplified,
+        triangles_before=int(len(triangles)),
+        triangles_after=int(len(simplified)),
+        max_error_mm=float(np.sqrt(mesh.worst)),
+        passes=passes,
+        seconds=time.perf_counter() - started
+    )
+
+
+def settings():
+    """This node's decimation settings, passed to slicer nodes with each job (None when disabled)"""
+    if QUOTE_DECIMATE_ABOVE_TRIANGLES <= 0:
+        return None
+    return {"above_triangles": QUOTE_DECIMATE_ABOVE_TRIANGLES, "max_error_mm": QUOTE_DECIMATE_MAX_ERROR_MM}
+
+
+def cache_variant(options=None):
+    """Slice cache key component for quotes sliced with these settings ("" when disabled)"""
+    options = settings() if options is None else options
+    if not options:
+        return ""
+    return f"decimate>{options['above_triangles']}@{options['max_error_mm']}"
+
+
+def quote_mesh(model_path, output_path, mesh_info=None, options=None):
+    """The mesh to slice for a quote: a simplified copy at output_path when model_path is dense enough.
+
+    Returns (path to slice, mesh_info of the original, stats); the path
+    is model_path itself and stats None when the mesh is left alone.
+    mesh_info may be None for formats only PrusaSlicer reads.
+    """
+    options = settings() if options is None else options
+    if not options or not model_path.lower().endswith((".stl", ".3mf")):
+        return model_path, mesh_info, None
+    if mesh_info is not None and not enabled(mesh_info.triangle_count, options["above_triangles"]):
+        return model_path, mesh_info, None
+    try:
+        triangles = mesh_analysis.load_mesh(model_path)
+        mesh_info = mesh_analysis.analyze_triangles(triangles)
+    except (OSError, mesh_analysis.MeshError) as e:
+        print(f"Could not read {os.path.basename(model_path)} for simplification: {str(e)}")
+        return model_path, mesh_info, None
+    if not enabled(len(triangles), options["above_triangles"]):
+        return model_path, mesh_info, None
+
+    result = decimate(triangles, options["max_error_mm"])
+    if result.triangles_after >= result.triangles_before:
+        return model_path, mesh_info, None
+    mesh_analysis.write_binary_stl(result.triangles, output_path)
+    print(f"Simplified {os.path.basename(model_path)} for its quote: {result.triangles_before} -> "
+          f"{result.triangles_after} triangles in {result.seconds:.2f}s")
+    return output_path, mesh_info, result.stats()
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python3 mesh_decimation.py <model> [output.stl] [max_error_mm]", file=sys.stderr)
+        return 1
+    try:
+        triangles = mesh_analysis.load_mesh(argv[1])
+    except (OSError, mesh_analysis.MeshError) as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
+    result = decimate(triangles, float(argv[3]) if len(argv) > 3 else None)
+    original = mesh_analysis.analyze_triangles(triangles)
+    simplified = mesh_analysis.analyze_triangles(result.triangles)
+    if len(argv) > 2:
+        mesh_analysis.write_binary_stl(result.triangles, argv[2])
+    print(json.dumps({
+        "file": argv[1],
+        **result.stats(),
+        "volume_drift_pct": round((simplified.volume_mm3 / original.volume_mm3 - 1) * 100, 4),
+        "area_drift_pct": round((simplified.surface_area_mm2 / original.surface_area_mm2 - 1) * 100, 4)
+    }))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,158 @@
+"""Job timing spans and Prometheus metrics.
+
+span() times one stage of a job into a list that is stored on the job
+(job["spans"]). Metrics keeps counters and stage latency histograms in
+SQLite so every process sharing the upload folder (gunicorn workers,
+worker.py's slicer processes) adds to the same series and any of them
+can serve /metrics. Gauges such as queue depth are computed at scrape
+time by the caller and passed to render().
+"""
+import contextlib
+import sqlite3
+import threading
+import time
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# name -> (type, help) for every series this module stores
+SERIES = {
+    "quote_stage_duration_seconds": ("histogram", "Time spent in each job stage"),
+    "quote_jobs_finished_total": ("counter", "Jobs that reached a final status"),
+    "quote_job_failures_total": ("counter", "Failed jobs by the stage that raised"),
+    "quote_slice_expected_seconds_total": ("counter", "Scheduler's expected slice time of the jobs that were sliced"),
+    "quote_slice_actual_seconds_total": ("counter", "Measured slice time of the same jobs"),
+    "quote_uploads_rejected_total": ("counter", "Uploads turned away with 429 because the slicing backlog was full"),
+}
+
+
+def make_span(name, start, duration_s):
+    return {"name": name, "start": start, "duration_ms": round(duration_s * 1000.0, 3)}
+
+
+@contextlib.contextmanager
+def span(spans, name):
+    """Time the block and append {"name", "start", "duration_ms"} to spans (if not None).
+
+    A span whose block raised is marked "failed": true.
+    """
+    start = time.time()
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if spans is not None:
+            spans.append(make_span(name, start, time.perf_counter() - started))
+            if failed:
+                spans[-1]["failed"] = True
+
+
+def _label_string(labels):
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in sorted(labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    return f"{name}{{{labels}}} {_format_value(value)}" if labels else f"{name} {_format_value(value)}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metrics:
+    """Counters and histograms shared through an SQLite file"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS metrics (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels, bucket)
+            )"""
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _add(self, conn, name, labels, bucket, amount):
+        conn.execute(
+            "INSERT INTO metrics (name, labels, bucket, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (name, labels, bucket) DO UPDATE SET value = value + excluded.value",
+            (name, labels, bucket, amount)
+        )
+
+    def inc(self, name, amount=1, **labels):
+        """Add amount to a counter"""
+        self._add(self._conn(), name, _label_string(labels), -1, amount)
+
+    def _observe(self, conn, name, label_string, value):
+        # Buckets are stored non-cumulative; -1 holds the sum and -2 the count
+        bucket = next((i for i, bound in enumerate(STAGE_BUCKETS) if value <= bound), len(STAGE_BUCKETS))
+        self._add(conn, name, label_string, bucket, 1)
+        self._add(conn, name, label_string, -1, value)
+        self._add(conn, name, label_string, -2, 1)
+
+    def observe_spans(self, spans):
+        """Feed job spans into the stage latency histogram, in one transaction"""
+        if not spans:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for item in spans:
+                self._observe(conn, "quote_stage_duration_seconds", _label_string({"stage": item["name"]}),
+                              item["duration_ms"] / 1000.0)
+
+    def render(self, gauges=()):
+        """Prometheus text exposition of the stored series plus gauges.
+
+        gauges is a list of (name, type, help, [(labels dict, value), ...])
+        computed by the caller at scrape time.
+        """
+        rows = self._conn().execute("SELECT name, labels, bucket, value FROM metrics ORDER BY name, labels").fetchall()
+        stored = {}
+        for name, labels, bucket, value in rows:
+            stored.setdefault(name, {}).setdefault(labels, {})[bucket] = value
+
+        lines = []
+        for name, (kind, help_text) in SERIES.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, values in stored.get(name, {}).items():
+                if kind != "histogram":
+                    lines.append(_sample(name, labels, values.get(-1, 0)))
+                    continue
+                cumulative = 0
+                for i, bound in enumerate(STAGE_BUCKETS + (float("inf"),)):
+                    cumulative += values.get(i, 0)
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{name}_bucket{{{labels + ',' if labels else ''}{le}}} {_format_value(cumulative)}")
+                lines.append(_sample(name + "_sum", labels, values.get(-1, 0)))
+                lines.append(_sample(name + "_count", labels, values.get(-2, 0)))
+
+        for name, kind, help_text, samples in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(_sample(name, _label_string(labels), value))
+        return "\n".join(lines) + "\n"
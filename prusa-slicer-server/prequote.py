@@ -0,0 +1,180 @@
+"""Instant geometric pre-quote.
+
+Estimates filament use and print time from mesh geometry alone so a
+provisional price can be shown while the real slice is still queued.
+The linear models are fitted offline against completed slices with
+`python3 prequote.py calibrate <folder>`.
+"""
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import gcode_metadata
+import mesh_analysis
+import slice_model
+from calibration import CoefficientsFile, fit_ridge, relative_errors
+from slice_cache import hash_file
+
+# Feature vectors, in order. Geometry is in cm / cm² / cm³, height in mm.
+FILAMENT_FEATURES = ["intercept", "surface_area_cm2", "infill_volume_cm3", "volume_cm3", "support_volume_cm3"]
+TIME_FEATURES = ["intercept", "height_mm", "surface_area_cm2", "infill_volume_cm3", "volume_cm3", "support_volume_cm3"]
+
+# Physically motivated starting point (PLA at 1.24 g/cm³, 0.2 mm layers on the X1C).
+# Calibration shrinks towards these values so features the corpus cannot
+# separate (e.g. every sample sliced at 15% with supports) stay sensible.
+DEFAULT_COEFFICIENTS = {
+    "filament_g": [0.2, 0.1, 1.1, 0.05, 0.3],
+    "time_s": [240.0, 12.0, 6.0, 45.0, 4.0, 20.0],
+    # Relative error bounds used for the provisional price range
+    "filament_rel_error": 0.35,
+    "time_rel_error": 0.35,
+    "samples": 0,
+    "calibrated_at": None
+}
+
+load_coefficients = CoefficientsFile(DEFAULT_COEFFICIENTS, "pre-quote").load
+
+
+def extract_features(mesh_info, fill_density, enable_supports):
+    """Return (filament_features, time_features) for a mesh and slicing parameters"""
+    volume = mesh_info.volume_cm3
+    area = mesh_info.surface_area_cm2
+    height = mesh_info.size["z"]
+    infill_volume = volume * float(fill_density)
+    support_volume = volume if enable_supports else 0.0
+    filament = [1.0, area, infill_volume, volume, support_volume]
+    time_features = [1.0, height, area, infill_volume, volume, support_volume]
+    return np.array(filament), np.array(time_features)
+
+
+def estimate(mesh_info, fill_density, enable_supports, coefficients=DEFAULT_COEFFICIENTS):
+    """Estimate filament use and print time for a mesh.
+
+    Returns a dict shaped like the slice result fields calculate_price needs,
+    plus low/high bounds from the calibration error.
+    """
+    filament_x, time_x = extract_features(mesh_info, fill_density, enable_supports)
+    filament_g = max(float(filament_x @ np.array(coefficients["filament_g"])), 0.0)
+    time_s = max(float(time_x @ np.array(coefficients["time_s"])), 0.0)
+    filament_err = coefficients["filament_rel_error"]
+    time_err = coefficients["time_rel_error"]
+
+    return {
+        "filament_used_g": round(filament_g, 2),
+        "estimated_time": slice_model.format_time_string(time_s),
+        "filament_used_g_range": [round(filament_g * (1 - filament_err), 2), round(filament_g * (1 + filament_err), 2)],
+        "estimated_time_range": [
+            slice_model.format_time_string(time_s * (1 - time_err)),
+            slice_model.format_time_string(time_s * (1 + time_err))
+        ],
+        "volume_cm3": mesh_info.volume_cm3,
+        "calibration_samples": coefficients.get("samples", 0)
+    }
+
+
+def read_slice_settings(gcode_path):
+    """Read filament, time, fill density and supports setting from a PrusaSlicer G-code file"""
+    meta = gcode_metadata.read_gcode_metadata(gcode_path)
+    if not meta.filament_used_g or meta.fill_density is None or meta.estimated_time == "Unknown":
+        return None
+
+    return {
+        "filament_used_g": meta.filament_used_g,
+        "time_s": slice_model.parse_time_string(meta.estimated_time) * 3600,
+        "fill_density": meta.fill_density,
+        # The setting, not whether supports were generated: estimate() gets the customer's choice
+        "enable_supports": meta.config.get("support_material") == "1"
+    }
+
+
+def collect_samples(folder):
+    """Pair every <name>.gcode(.gz) in folder with its <name>.stl and return feature rows.
+
+    Re-uploads of the same mesh with the same settings count once so
+    popular parts do not dominate the fit.
+    """
+    samples = []
+    seen = set()
+    gcode_paths = glob.glob(os.path.join(folder, "*.gcode")) + glob.glob(os.path.join(folder, "*.gcode.gz"))
+    for gcode_path in sorted(gcode_paths):
+        stl_path = gcode_path.split(".gcode")[0] + ".stl"
+        if not os.path.exists(stl_path):
+            continue
+        try:
+            settings = read_slice_settings(gcode_path)
+            if settings is None:
+                continue
+            sample_key = (hash_file(stl_path), settings["fill_density"], settings["enable_supports"])
+            if sample_key in seen:
+                continue
+            seen.add(sample_key)
+            mesh_info = mesh_analysis.analyze_mesh(stl_path)
+        except (OSError, ValueError, mesh_analysis.MeshError) as e:
+            print(f"Skipping {os.path.basename(gcode_path)}: {str(e)}", file=sys.stderr)
+            continue
+        filament_x, time_x = extract_features(mesh_info, settings["fill_density"], settings["enable_supports"])
+        samples.append({
+            "name": os.path.basename(stl_path),
+            "filament_x": filament_x,
+            "time_x": time_x,
+            "filament_g": settings["filament_used_g"],
+            "time_s": settings["time_s"]
+        })
+    return samples
+
+
+def calibrate(folder):
+    """Fit filament and time coefficients against the completed slices in folder"""
+    samples = collect_samples(folder)
+    if len(samples) < 2:
+        raise ValueError(f"Need at least 2 G-code/STL pairs in {folder}, found {len(samples)}")
+
+    coefficients = {"samples": len(samples), "calibrated_at": time.time()}
+    report = {"samples": len(samples)}
+    for target, x_key, y_key, features in (
+        ("filament_g", "filament_x", "filament_g", FILAMENT_FEATURES),
+        ("time_s", "time_x", "time_s", TIME_FEATURES),
+    ):
+        X = np.array([s[x_key] for s in samples])
+        y = np.array([s[y_key] for s in samples])
+        prior = DEFAULT_COEFFICIENTS[target]
+        coefficients[target] = fit_ridge(X, y, prior).tolist()
+
+        loo = relative_errors(X, y, prior)
+        error_name = "filament_rel_error" if target == "filament_g" else "time_rel_error"
+        # The provisional range covers the 90th percentile leave-one-out error
+        coefficients[error_name] = round(float(np.percentile(loo, 90)), 4)
+        report[target] = {
+            "coefficients": dict(zip(features, coefficients[target])),
+            "loo_mean_abs_pct_error": round(float(loo.mean()) * 100, 2),
+            "loo_p90_abs_pct_error": round(float(np.percentile(loo, 90)) * 100, 2),
+            "loo_max_abs_pct_error": round(float(loo.max()) * 100, 2)
+        }
+    return coefficients, report
+
+
+def main(argv):
+    if len(argv) < 3 or argv[1] != "calibrate":
+        print("Usage: python3 prequote.py calibrate <folder> [output.json]", file=sys.stderr)
+        return 1
+
+    folder = argv[2]
+    output = argv[3] if len(argv) > 3 else os.path.join(folder, "prequote_coefficients.json")
+    try:
+        coefficients, report = calibrate(folder)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
+
+    with open(output, "w") as f:
+        json.dump(coefficients, f, indent=2)
+    print(json.dumps({**report, "output": output}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,197 @@
+"""Distributed slicing queue on a Redis-compatible server.
+
+The API node submits jobs; slicer nodes (slicer_node.py) claim them,
+slice and post results back, which the API node collects into its own
+job store. Nothing is shared through the filesystem: model and profile
+bytes travel as content-addressed blobs (key = SHA-256), so a node
+fetches a given model once and checks it on arrival.
+
+Keys (under the configured prefix):
+    queue            list of job ids waiting for a slicer
+    processing       list of job ids claimed by a slicer
+    leases           sorted set: job id -> visibility deadline
+    payloads         hash: job id -> slicing parameters (JSON)
+    attempts         hash: job id -> number of claims so far
+    results          list of finished results (JSON) for the API node
+    blob:<sha256>    model/profile bytes, expiring after BLOB_TTL
+
+A claimed job stays in "processing" with a lease the slicer keeps
+extending while it works. If the slicer dies the lease runs out and
+requeue_expired() puts the job back on the queue, up to max_attempts
+claims in total.
+"""
+import hashlib
+import json
+import os
+import time
+
+import redis
+
+DEFAULT_PREFIX = "quote"
+# Seconds a claimed job stays invisible to other slicers without a heartbeat
+VISIBILITY_TIMEOUT = 120
+# Claims per job before it is failed instead of requeued
+MAX_ATTEMPTS = 3
+# Seconds model/profile blobs are kept after their last use
+BLOB_TTL = 24 * 3600
+# Client read timeout in seconds
+SOCKET_TIMEOUT = 30
+
+
+class BlobError(Exception):
+    pass
+
+
+def connect(url):
+    """Open a client for url (redis://host:port/db)"""
+    # RESP2 keeps the replies identical across servers and the stand-in. The read
+    # timeout must outlast the blocking pops (a few seconds each).
+    return redis.Redis.from_url(url, protocol=2, socket_timeout=SOCKET_TIMEOUT, socket_connect_timeout=5)
+
+
+def queue_from_env():
+    """Build the queue from REDIS_URL and the REDIS_QUEUE_PREFIX / QUEUE_* environment variables"""
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        raise ValueError("REDIS_URL must point at the queue server (redis://host:port/db)")
+    return RedisJobQueue(
+        connect(url),
+        prefix=os.environ.get("REDIS_QUEUE_PREFIX", DEFAULT_PREFIX),
+        visibility_timeout=float(os.environ.get("QUEUE_VISIBILITY_TIMEOUT", VISIBILITY_TIMEOUT)),
+        max_attempts=int(os.environ.get("QUEUE_MAX_ATTEMPTS", MAX_ATTEMPTS))
+    )
+
+
+class RedisJobQueue:
+    """Reliable work queue with visibility timeouts on a Redis-compatible server"""
+
+    def __init__(self, client, prefix=DEFAULT_PREFIX, visibility_timeout=VISIBILITY_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS):
+        self.client = client
+        self.prefix = prefix
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    # Blobs
+
+    def put_blob(self, data, digest=None):
+        """Store bytes under their SHA-256 (uploaded only if not already present); returns the digest"""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        key = self._key(f"blob:{digest}")
+        # Refresh the expiry of a blob we already have instead of sending it again
+        if not self.client.expire(key, BLOB_TTL):
+            self.client.set(key, data, ex=BLOB_TTL)
+        return digest
+
+    def put_blob_file(self, path, digest=None):
+        with open(path, "rb") as f:
+            return self.put_blob(f.read(), digest)
+
+    def get_blob(self, digest):
+        """Fetch a blob and verify it against its digest"""
+        data = self.client.get(self._key(f"blob:{digest}"))
+        if data is None:
+            raise BlobError(f"Blob {digest} is missing or expired")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise BlobError(f"Blob {digest} failed its integrity check")
+        return data
+
+    # API node side
+
+    def submit(self, job_id, payload):
+        """Queue a job; payload holds the slicing parameters and blob digests"""
+        self.client.hset(self._key("payloads"), job_id, json.dumps(payload))
+        self.client.rpush(self._key("queue"), job_id)
+
+    def next_result(self, timeout=5):
+        """Block up to timeout seconds for a finished job; returns (job_id, payload, result) or None"""
+        item = self.client.blpop([self._key("results")], timeout=timeout)
+        if item is None:
+            return None
+        message = json.loads(item[1])
+        job_id = message["job_id"]
+        raw = self.client.hget(self._key("payloads"), job_id)
+        self.client.hdel(self._key("payloads"), job_id)
+        self.client.hdel(self._key("attempts"), job_id)
+        return job_id, json.loads(raw) if raw else {}, message
+
+    def cancel(self, job_id):
+        """Withdraw a job: drop it from the queue, or take its lease so the slicing node stops"""
+        self.client.lrem(self._key("queue"), 0, job_id)
+        self.client.hdel(self._key("payloads"), job_id)
+        self.client.hdel(self._key("attempts"), job_id)
+        self._release(job_id)
+
+    def requeue_expired(self):
+        """Return jobs whose lease ran out to the queue (or fail them); returns the number handled.
+
+        Safe to run on every node at once: whoever removes the lease handles the job.
+        """
+        now = time.time()
+        processing = self._key("processing")
+        leases = self._key("leases")
+        # A slicer that died between claiming and taking its lease leaves a bare entry
+        for job_id in self.client.lrange(processing, 0, -1):
+            self.client.zadd(leases, {job_id: now + self.visibility_timeout}, nx=True)
+
+        handled = 0
+        for job_id in self.client.zrangebyscore(leases, "-inf", now):
+            if not self.client.zrem(leases, job_id):
+                continue
+            self.client.lrem(processing, 1, job_id)
+            job_id = job_id.decode()
+            attempts = int(self.client.hget(self._key("attempts"), job_id) or 0)
+            if attempts >= self.max_attempts:
+                self._post(job_id, error=f"Slicing did not finish after {attempts} attempts")
+            else:
+                self.client.rpush(self._key("queue"), job_id)
+            handled += 1
+        return handled
+
+    # Slicer node side
+
+    def claim(self, timeout=5):
+        """Block up to timeout seconds for a job; returns (job_id, payload) or None"""
+        job_id = self.client.brpoplpush(self._key("queue"), self._key("processing"), timeout)
+        if job_id is None:
+            return None
+        self.client.zadd(self._key("leases"), {job_id: time.time() + self.visibility_timeout})
+        job_id = job_id.decode()
+        self.client.hincrby(self._key("attempts"), job_id, 1)
+        raw = self.client.hget(self._key("payloads"), job_id)
+        if raw is None:
+            # Already finished elsewhere (a late duplicate after a requeue)
+            self._release(job_id)
+            return None
+        return job_id, json.loads(raw)
+
+    def heartbeat(self, job_id):
+        """Extend the lease of a job still being sliced; False if it was lost (expired or cancelled)"""
+        leases = self._key("leases")
+        if self.client.zscore(leases, job_id) is None:
+            return False
+        self.client.zadd(leases, {job_id: time.time() + self.visibility_timeout}, xx=True)
+        return True
+
+    def complete(self, job_id, result=None, error=None, details=None, spans=None):
+        """Post a slice result (or a slicing error) and its stage timings back to the API node"""
+        self._release(job_id)
+        self._post(job_id, result=result, error=error, details=details, spans=spans)
+
+    def _release(self, job_id):
+        self.client.zrem(self._key("leases"), job_id)
+        self.client.lrem(self._key("processing"), 1, job_id)
+
+    def _post(self, job_id, result=None, error=None, details=None, spans=None):
+        message = {"job_id": job_id, "result": result, "error": error, "error_details": details, "spans": spans}
+        self.client.rpush(self._key("results"), json.dumps(message))
+
+    def stats(self):
+        return {
+            "queued": self.client.llen(self._key("queue")),
+            "processing": self.client.llen(self._key("processing")),
+            "results_waiting": self.client.llen(self._key("results"))
+        }
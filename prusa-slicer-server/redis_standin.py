@@ -0,0 +1,397 @@
+"""Minimal in-process Redis stand-in for developing and testing the distributed queue.
+
+Speaks RESP2 over TCP and implements only the commands redis_queue.py
+uses (strings, lists with blocking pops, hashes, sorted sets, key
+expiry). Data lives in memory and is lost when the server stops.
+
+    python3 redis_standin.py [port]
+
+or, from Python:
+
+    server = start_standin()           # picks a free port
+    url = f"redis://127.0.0.1:{server.port}/0"
+"""
+import bisect
+import socketserver
+import sys
+import threading
+import time
+
+
+class CommandError(Exception):
+    pass
+
+
+class _Store:
+    """Keyspace shared by all connections; one lock, one condition for blocking pops"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.cond = threading.Condition()
+
+    def _live(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _typed(self, key, kind, create=False):
+        value = self._live(key)
+        if value is None:
+            if not create:
+                return None
+            value = kind()
+            self.data[key] = value
+        elif not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _drop_if_empty(self, key):
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+            self.expires.pop(key, None)
+
+    # Strings and keys
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_set(self, key, value, *options):
+        options = [o.upper() if isinstance(o, bytes) else o for o in options]
+        ttl = None
+        nx = xx = False
+        i = 0
+        while i < len(options):
+            option = options[i]
+            if option == b"EX":
+                ttl = float(options[i + 1])
+                i += 1
+            elif option == b"PX":
+                ttl = float(options[i + 1]) / 1000.0
+                i += 1
+            elif option == b"NX":
+                nx = True
+            elif option == b"XX":
+                xx = True
+            else:
+                raise CommandError("ERR syntax error")
+            i += 1
+        exists = self._live(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = bytes(value)
+        self.expires.pop(key, None)
+        if ttl is not None:
+            self.expires[key] = time.time() + ttl
+        return "OK"
+
+    def cmd_get(self, key):
+        return self._typed(key, bytes)
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._live(key) is not None)
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key) is not None:
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_expire(self, key, seconds):
+        if self._live(key) is None:
+            return 0
+        self.expires[key] = time.time() + float(seconds)
+        return 1
+
+    def cmd_ttl(self, key):
+        if self._live(key) is None:
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else int(round(deadline - time.time()))
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    # Lists
+
+    def cmd_rpush(self, key, *values):
+        items = self._typed(key, list, create=True)
+        items.extend(values)
+        self.cond.notify_all()
+        return len(items)
+
+    def cmd_lpush(self, key, *values):
+        items = self._typed(key, list, create=True)
+        for value in values:
+            items.insert(0, value)
+        self.cond.notify_all()
+        return len(items)
+
+    def cmd_llen(self, key):
+        items = self._typed(key, list)
+        return len(items) if items else 0
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._typed(key, list) or []
+        start, stop = int(start), int(stop)
+        stop = len(items) - 1 if stop == -1 else stop
+        return items[start:stop + 1]
+
+    def cmd_lrem(self, key, count, value):
+        items = self._typed(key, list)
+        if not items:
+            return 0
+        count = int(count)
+        removed = 0
+        if count >= 0:
+            i = 0
+            while i < len(items) and (count == 0 or removed < count):
+                if items[i] == value:
+                    del items[i]
+                    removed += 1
+                else:
+                    i += 1
+        else:
+            i = len(items) - 1
+            while i >= 0 and removed < -count:
+                if items[i] == value:
+                    del items[i]
+                    removed += 1
+                i -= 1
+        self._drop_if_empty(key)
+        return removed
+
+    def cmd_lpop(self, key):
+        items = self._typed(key, list)
+        if not items:
+            return None
+        value = items.pop(0)
+        self._drop_if_empty(key)
+        return value
+
+    def cmd_rpoplpush(self, source, destination):
+        items = self._typed(source, list)
+        if not items:
+            return None
+        value = items.pop()
+        self._drop_if_empty(source)
+        self._typed(destination, list, create=True).insert(0, value)
+        return value
+
+    # Hashes
+
+    def cmd_hset(self, key, *pairs):
+        fields = self._typed(key, dict, create=True)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in fields
+            fields[field] = value
+        return added
+
+    def cmd_hget(self, key, field):
+        fields = self._typed(key, dict)
+        return fields.get(field) if fields else None
+
+    def cmd_hdel(self, key, *names):
+        fields = self._typed(key, dict)
+        if not fields:
+            return 0
+        removed = sum(1 for name in names if fields.pop(name, None) is not None)
+        self._drop_if_empty(key)
+        return removed
+
+    def cmd_hincrby(self, key, field, amount):
+        fields = self._typed(key, dict, create=True)
+        value = int(fields.get(field, b"0")) + int(amount)
+        fields[field] = str(value).encode()
+        return value
+
+    def cmd_hlen(self, key):
+        fields = self._typed(key, dict)
+        return len(fields) if fields else 0
+
+    # Sorted sets (member -> score dict; range queries sort on demand)
+
+    def cmd_zadd(self, key, *args):
+        flags = set()
+        args = list(args)
+        while args and args[0].upper() in (b"NX", b"XX", b"CH"):
+            flags.add(args.pop(0).upper())
+        members = self._typed(key, dict, create=True)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            exists = member in members
+            if (b"NX" in flags and exists) or (b"XX" in flags and not exists):
+                continue
+            added += not exists
+            members[member] = float(score)
+        self._drop_if_empty(key)
+        return added
+
+    def cmd_zrem(self, key, *names):
+        members = self._typed(key, dict)
+        if not members:
+            return 0
+        removed = sum(1 for name in names if members.pop(name, None) is not None)
+        self._drop_if_empty(key)
+        return removed
+
+    def cmd_zscore(self, key, member):
+        members = self._typed(key, dict)
+        score = members.get(member) if members else None
+        return None if score is None else repr(score).encode()
+
+    def cmd_zcard(self, key):
+        members = self._typed(key, dict)
+        return len(members) if members else 0
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        members = self._typed(key, dict) or {}
+        low = float("-inf") if low == b"-inf" else float(low)
+        high = float("inf") if high in (b"+inf", b"inf") else float(high)
+        ordered = sorted((score, member) for member, score in members.items())
+        start = bisect.bisect_left(ordered, (low, b""))
+        selected = [member for score, member in ordered[start:] if score <= high]
+        if len(options) >= 3 and options[0].upper() == b"LIMIT":
+            offset, count = int(options[1]), int(options[2])
+            selected = selected[offset:offset + count] if count >= 0 else selected[offset:]
+        return selected
+
+    # Connection housekeeping sent by client libraries
+
+    def cmd_hello(self, *args):
+        if args and args[0] != b"2":
+            raise CommandError("NOPROTO this server only speaks RESP2")
+        return [b"server", b"redis", b"version", b"7.0.0-standin", b"proto", 2]
+
+    def cmd_select(self, index):
+        return "OK"
+
+    def cmd_client(self, *args):
+        return "OK"
+
+    def cmd_info(self, *args):
+        return b"# Server\r\nredis_version:7.0.0-standin\r\n"
+
+
+# Blocking commands and the pop they wait on
+BLOCKING = {b"BLPOP": "blpop", b"BRPOPLPUSH": "brpoplpush"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command (e.g. typed into telnet)
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            length = int(header[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _encode(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, CommandError):
+            return f"-{value}\r\n".encode()
+        if isinstance(value, str):
+            return f"+{value}\r\n".encode()
+        if isinstance(value, bool):
+            return f":{int(value)}\r\n".encode()
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, (bytes, bytearray)):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if isinstance(value, (list, tuple)):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(v) for v in value)
+        raise TypeError(f"Cannot encode {type(value)}")
+
+    def _blocking(self, store, name, args):
+        timeout = float(args[-1])
+        deadline = None if timeout == 0 else time.time() + timeout
+        keys = args[:-1]
+        with store.cond:
+            while True:
+                if name == "blpop":
+                    for key in keys:
+                        value = store.cmd_lpop(key)
+                        if value is not None:
+                            return [key, value]
+                else:
+                    value = store.cmd_rpoplpush(keys[0], keys[1])
+                    if value is not None:
+                        return value
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                store.cond.wait(remaining)
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].upper()
+            try:
+                if name in BLOCKING:
+                    reply = self._blocking(store, BLOCKING[name], args[1:])
+                else:
+                    method = getattr(store, "cmd_" + name.decode().lower(), None)
+                    if method is None:
+                        raise CommandError(f"ERR unknown command '{name.decode()}'")
+                    with store.cond:
+                        reply = method(*args[1:])
+            except CommandError as e:
+                reply = e
+            except (TypeError, ValueError, IndexError):
+                reply = CommandError(f"ERR wrong arguments for '{name.decode()}' command")
+            try:
+                self.wfile.write(self._encode(reply))
+            except OSError:
+                return
+
+
+class StandinServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+        self.port = self.server_address[1]
+
+    @property
+    def url(self):
+        return f"redis://{self.server_address[0]}:{self.port}/0"
+
+
+def start_standin(host="127.0.0.1", port=0):
+    """Start a stand-in server on a background thread and return it (call shutdown() to stop)"""
+    server = StandinServer(host, port)
+    threading.Thread(target=server.serve_forever, name="redis-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+    server = StandinServer("0.0.0.0", port)
+    print(f"Redis stand-in listening on port {port}")
+    server.serve_forever()
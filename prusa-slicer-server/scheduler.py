@@ -0,0 +1,166 @@
+"""Size-aware dispatch order for pending jobs.
+
+Each upload gets an expected slice time from a linear model over its
+triangle count, bounding-box volume, fill density and supports. Slicers
+claim pending jobs lowest priority first, where
+
+    priority = created_at + expected_slice_seconds / SCHEDULER_AGING_RATE
+
+i.e. shortest expected job first, with every second spent waiting
+worth SCHEDULER_AGING_RATE seconds of expected slice time: a large job
+is passed over only by jobs arriving less than expected/rate seconds
+after it, so it cannot starve.
+The key is fixed at upload, so the job store can index it.
+SCHEDULER_POLICY=fifo orders by arrival only.
+
+SCHEDULER_FAST_LANE_WORKERS slicers (of each pool) only take jobs
+expected to finish within FAST_LANE_MAX_SECONDS, so small parts keep
+moving while every other slicer is busy with large ones.
+
+Finished jobs record actual_slice_seconds next to expected_slice_seconds;
+check the estimator and refit it from the job store with
+
+    python3 scheduler.py check <jobs.db>
+    python3 scheduler.py calibrate <jobs.db> [output.json]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+import calibration
+
+FEATURES = ["intercept", "triangles_100k", "bbox_cm3", "infill_bbox_cm3", "support_bbox_cm3"]
+
+# Rough PrusaSlicer timings on a 4-core host; `calibrate` replaces them
+DEFAULT_COEFFICIENTS = {
+    "slice_s": [3.0, 6.0, 0.004, 0.02, 0.01],
+    "samples": 0,
+    "calibrated_at": None
+}
+
+# Used when the mesh can't be read at upload (e.g. OBJ): bytes per triangle
+# of the file and an assumed bounding box
+FALLBACK_BYTES_PER_TRIANGLE = 50
+FALLBACK_BBOX_CM3 = 500.0
+
+SCHEDULER_POLICY = os.environ.get("SCHEDULER_POLICY", "sjf")
+SCHEDULER_AGING_RATE = float(os.environ.get("SCHEDULER_AGING_RATE", 1.0))
+SCHEDULER_FAST_LANE_WORKERS = int(os.environ.get("SCHEDULER_FAST_LANE_WORKERS", 0))
+FAST_LANE_MAX_SECONDS = float(os.environ.get("FAST_LANE_MAX_SECONDS", 15))
+
+load_coefficients = calibration.CoefficientsFile(DEFAULT_COEFFICIENTS, "scheduler").load
+
+
+def extract_features(mesh_info, fill_density, enable_supports, file_size=0):
+    """Feature vector (see FEATURES) for a mesh, or for a file of file_size bytes if mesh_info is None"""
+    if mesh_info is not None:
+        triangles = mesh_info.triangle_count
+        size = mesh_info.size
+        bbox = size["x"] * size["y"] * size["z"] / 1000.0
+    else:
+        triangles = file_size / FALLBACK_BYTES_PER_TRIANGLE
+        bbox = FALLBACK_BBOX_CM3
+    return [1.0, triangles / 1e5, bbox, bbox * float(fill_density), bbox if enable_supports else 0.0]
+
+
+def estimate_slice_seconds(features, coefficients=DEFAULT_COEFFICIENTS):
+    return round(max(float(np.array(features) @ np.array(coefficients["slice_s"])), 0.1), 3)
+
+
+def priority(created_at, expected_seconds, policy=None, aging_rate=None):
+    """Dispatch key: pending jobs are claimed lowest first"""
+    policy = policy or SCHEDULER_POLICY
+    aging_rate = SCHEDULER_AGING_RATE if aging_rate is None else aging_rate
+    if policy == "fifo" or aging_rate <= 0:
+        return created_at
+    # Scaled so the key stays in created_at's units
+    return created_at + expected_seconds / aging_rate
+
+
+def fast_lane_workers(total):
+    """How many of total slicers are reserved for small jobs; at least one slicer always takes anything"""
+    return max(0, min(SCHEDULER_FAST_LANE_WORKERS, total - 1))
+
+
+def schedule_fields(mesh_info, fill_density, enable_supports, file_size, created_at, coefficients):
+    """Job fields set at upload: cost features, expected slice time and dispatch priority"""
+    features = extract_features(mesh_info, fill_density, enable_supports, file_size)
+    expected = estimate_slice_seconds(features, coefficients)
+    return {
+        "cost_features": [round(value, 6) for value in features],
+        "expected_slice_seconds": expected,
+        "priority": priority(created_at, expected)
+    }
+
+
+def slice_seconds(spans):
+    """Seconds spent in PrusaSlicer according to a run's spans (None if it didn't slice)"""
+    durations = [item["duration_ms"] for item in spans if item["name"] == "slice" and not item.get("failed")]
+    return round(sum(durations) / 1000.0, 3) if durations else None
+
+
+# Checking and calibration against finished jobs
+
+def _sample(job):
+    if job.get("cost_features") and job.get("actual_slice_seconds"):
+        return job["cost_features"], job["expected_slice_seconds"], job["actual_slice_seconds"]
+    return None
+
+
+def collect_samples(store):
+    """(features, expected, actual) for every completed job that was sliced, not served from cache"""
+    return calibration.job_samples(store, _sample)
+
+
+def _rank(values):
+    order = np.argsort(values)
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+    return ranks
+
+
+def check(samples):
+    """How well expected slice times matched: error percentiles and rank correlation (what SJF relies on)"""
+    expected = np.array([s[1] for s in samples])
+    actual = np.array([s[2] for s in samples])
+    errors = np.abs(expected - actual) / np.maximum(actual, 1e-9)
+    return {
+        "samples": len(samples),
+        "median_abs_pct_error": round(float(np.median(errors)) * 100, 2),
+        "p90_abs_pct_error": round(float(np.percentile(errors, 90)) * 100, 2),
+        "expected_over_actual": round(float(expected.sum() / actual.sum()), 3),
+        "rank_correlation": round(float(np.corrcoef(_rank(expected), _rank(actual))[0, 1]), 3) if len(samples) > 2 else None
+    }
+
+
+def calibrate(samples):
+    """Refit the slice time model on finished jobs"""
+    if len(samples) < 2:
+        raise ValueError(f"Need at least 2 sliced jobs with timings, found {len(samples)}")
+    X = np.array([s[0] for s in samples])
+    y = np.array([s[2] for s in samples])
+    prior = DEFAULT_COEFFICIENTS["slice_s"]
+    coefficients = {
+        "slice_s": calibration.fit_ridge(X, y, prior).tolist(),
+        "samples": len(samples),
+        "calibrated_at": time.time()
+    }
+    loo = calibration.relative_errors(X, y, prior)
+    report = {
+        "samples": len(samples),
+        "coefficients": dict(zip(FEATURES, coefficients["slice_s"])),
+        "loo_mean_abs_pct_error": round(float(loo.mean()) * 100, 2),
+        "loo_p90_abs_pct_error": round(float(np.percentile(loo, 90)) * 100, 2)
+    }
+    return coefficients, report
+
+
+def main(argv):
+    return calibration.job_store_cli(argv, "scheduler", collect_samples, check, calibrate,
+                                     "No completed jobs with slice timings")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
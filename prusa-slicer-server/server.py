@@ -1,29 +1,73 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
-import subprocess
 import os
 import json
 import uuid
 import time
 import threading
-import re
-from werkzeug.utils import secure_filename
-import queue
+import atexit
+import socket
+import math
+from werkzeug.utils import secure_filename, safe_join
+from slice_cache import SliceCache
+from job_store import create_job_store, encode_cursor, decode_cursor
+from job_events import JobEvents, SocketJobEvents, FINAL_STATUSES
+import hashlib
+import gzip
+import slice_model
+from slice_model import parse_time_string
+import mesh_analysis
+import mesh_decimation
+import prequote
+import scheduler
+import admission
+import batch_quote
+import infill_sweep
+import numpy as np
+from materials_catalog import MaterialsCatalog
+from upload_ingest import IngestRequest, IngestResult, format_matches_extension
+from artifact_store import ArtifactStore
+from metrics import Metrics, span, make_span
+from admission import AdmissionController
+from werkzeug.exceptions import RequestEntityTooLarge
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Configuration
-UPLOAD_FOLDER = "/app/shared"  # This should match the UserModels/ directory in Docker
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "/app/shared")  # This should match the UserModels/ directory in Docker
 ALLOWED_EXTENSIONS = {'stl', '3mf', 'obj'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB max file size
 MATERIALS_FILE = os.path.join(UPLOAD_FOLDER, "materials.json")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+PROFILE_FILE = os.path.join(UPLOAD_FOLDER, "prusaslicer-config", "x1c.ini")
+
+PREQUOTE_COEFFICIENTS_FILE = os.path.join(UPLOAD_FOLDER, "prequote_coefficients.json")
+SCHEDULER_COEFFICIENTS_FILE = os.path.join(UPLOAD_FOLDER, "scheduler_coefficients.json")
+ADMISSION_COEFFICIENTS_FILE = os.path.join(UPLOAD_FOLDER, "admission_coefficients.json")
+
 # Temporary directory for file conversions
 TEMP_DIR = os.path.join(UPLOAD_FOLDER, "temp")
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Uploads stream straight to disk, hashed and size-checked as they arrive
+# (allow some slack over MAX_FILE_SIZE for the other form fields)
+FORM_OVERHEAD = 64 * 1024
+app.request_class = IngestRequest
+app.config["UPLOAD_TEMP_DIR"] = TEMP_DIR
+app.config["MAX_FILE_SIZE"] = MAX_FILE_SIZE
+app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_SIZE + FORM_OVERHEAD
+
+# Batch quotes (/api/batch): files per batch and total size, zip contents included
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 100))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 500 * 1024 * 1024))
+
+# Infill sweeps (/api/job/<id>/sweep) go back to "processing" from these
+# when a quote asks for another anchor
+SWEEP_OPEN_STATUSES = ("processing", "completed", "failed")
+sweep_lock = threading.Lock()
+
 # Default materials and pricing if no file exists
 DEFAULT_MATERIALS = {
     "materials": [
@@ -125,73 +169,127 @@ DEFAULT_MATERIALS = {
     }
 }
 
-# Job queue
-job_queue = queue.Queue()
-jobs = {}  # Store job status and results
-processing_thread = None
+materials_catalog = MaterialsCatalog(MATERIALS_FILE, DEFAULT_MATERIALS)
+
+# Job store: "sqlite" (durable, default) or "memory"
+JOB_STORE = os.environ.get("JOB_STORE", "sqlite")
+JOB_STORE_DB = os.path.join(UPLOAD_FOLDER, "jobs.db")
+jobs = create_job_store(JOB_STORE, JOB_STORE_DB)  # Store job status and results
+
+# Retention: finished jobs older than this are deleted in batches
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", 30 * 24 * 3600))
+JOB_RETENTION_INTERVAL = float(os.environ.get("JOB_RETENTION_INTERVAL", 3600))
+retention_thread = None
+
+# Pending or slicing jobs nobody has asked about (status, long-poll or SSE)
+# for this many seconds are cancelled as abandoned; 0 disables the sweep
+ABANDON_AFTER_SECONDS = float(os.environ.get("ABANDON_AFTER_SECONDS", 0))
+ABANDON_CHECK_INTERVAL = 15
+abandon_thread = None
+# Statuses a job can be cancelled from
+CANCELLABLE_STATUSES = ("pending", "processing")
+# A slicing worker re-reads its job this often even without a notification
+CANCEL_RECHECK_SECONDS = 5
+
+# Status subscribers (SSE and long-poll) woken on every job change. A SQLite
+# store may be shared by several processes (see worker.py), so its
+# notifications are relayed between them.
+JOB_EVENTS_DIR = os.path.join(UPLOAD_FOLDER, "run")
+job_events = SocketJobEvents(JOB_EVENTS_DIR) if JOB_STORE == "sqlite" else JobEvents()
+# Published whenever a job becomes pending, so idle slicer processes wake up
+PENDING_CHANNEL = "pending-jobs"
+# Longest a long-poll request may block, and the SSE keep-alive interval
+LONG_POLL_MAX_TIMEOUT = 60
+SSE_KEEPALIVE_SECONDS = 15
+
+# /api/jobs page size (default and upper bound)
+JOBS_PAGE_SIZE = int(os.environ.get("JOBS_PAGE_SIZE", 50))
+JOBS_MAX_PAGE_SIZE = 500
+
+# Slicing worker pool
+SLICER_WORKERS = int(os.environ.get("SLICER_WORKERS", os.cpu_count() or 1))
+# Owner of the jobs this host slices; must survive the container being recreated
+WORKER_HOST = os.environ.get("WORKER_HOST") or socket.gethostname()
+worker_threads = []
 processing_lock = threading.Lock()
+shutdown_event = threading.Event()
+
+# Memory/CPU reservations every slicing process takes before PrusaSlicer
+# starts (see admission.py)
+ADMISSION_DB = os.path.join(UPLOAD_FOLDER, "admission.db")
+admission_controller = AdmissionController(ADMISSION_DB)
+
+# Backpressure: new uploads get 429 + Retry-After once this many jobs wait
+# for a slicer, or once the wait's expected slice time per slicer reaches
+# UPLOAD_BACKLOG_MAX_SECONDS (0 disables either limit)
+UPLOAD_BACKLOG_LIMIT = int(os.environ.get("UPLOAD_BACKLOG_LIMIT", 500))
+UPLOAD_BACKLOG_MAX_SECONDS = float(os.environ.get("UPLOAD_BACKLOG_MAX_SECONDS", 0))
+RETRY_AFTER_MIN_SECONDS = 5
+RETRY_AFTER_MAX_SECONDS = 600
+
+# Where jobs are sliced: "local" (worker threads / worker.py) or "redis"
+# (slicer_node.py on any host, see redis_queue.py)
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "local")
+if JOB_QUEUE == "redis":
+    import redis_queue
+    distributed_queue = redis_queue.queue_from_env()
+else:
+    distributed_queue = None
+result_collector_thread = None
+# Seconds between sweeps for distributed jobs whose slicer node died
+REQUEUE_INTERVAL = 15
+
+# Slice results are cached by mesh hash + slicing parameters + profile hash
+SLICE_CACHE_DB = os.path.join(UPLOAD_FOLDER, "slice_cache.db")
+SLICE_CACHE_MAX_ENTRIES = int(os.environ.get("SLICE_CACHE_MAX_ENTRIES", "2000"))
+slice_cache = SliceCache(SLICE_CACHE_DB, PROFILE_FILE, max_entries=SLICE_CACHE_MAX_ENTRIES)
+
+# Uploads and G-code are stored once per content hash (G-code gzipped) and
+# collected least-recently-used first once they exceed the quota
+ARTIFACTS_DB = os.path.join(UPLOAD_FOLDER, "artifacts.db")
+ARTIFACT_QUOTA_BYTES = int(os.environ.get("ARTIFACT_QUOTA_BYTES", 10 * 1024 ** 3))
+ARTIFACT_GC_INTERVAL = float(os.environ.get("ARTIFACT_GC_INTERVAL", 300))
+artifact_store = ArtifactStore(UPLOAD_FOLDER, ARTIFACTS_DB)
+artifact_gc_thread = None
+# Jobs whose files must survive collection
+PROTECTED_STATUSES = ("pending", "processing", "approved")
+
+# Counters and stage latency histograms for /metrics, shared by all processes
+METRICS_DB = os.path.join(UPLOAD_FOLDER, "metrics.db")
+metrics = Metrics(METRICS_DB)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def convert_3mf_to_stl(input_file_path):
-    """Convert a 3MF file to STL format using PrusaSlicer"""
-    try:
-        # Generate output file path with .stl extension
-        output_file_path = os.path.splitext(input_file_path)[0] + ".stl"
-        
-        # Use PrusaSlicer to convert the file
-        # The --export-stl command exports the model as STL
-        result = subprocess.run(
-            ["prusa-slicer", "--export-stl", input_file_path, "--output", output_file_path],
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            print(f"Error converting 3MF to STL: {result.stderr}", file=sys.stderr)
-            return None
-        
-        return output_file_path
-    except Exception as e:
-        print(f"Exception during 3MF conversion: {str(e)}", file=sys.stderr)
-        return None
+    """Read a 3MF file in-process and write its build plate as a binary STL.
 
-def parse_time_string(time_str):
-    """Convert time string like '2d 3h 45m 30s' to hours as float"""
-    total_seconds = 0
-    
-    # Extract days, hours, minutes, seconds
-    days_match = re.search(r'(\d+)d', time_str)
-    hours_match = re.search(r'(\d+)h', time_str)
-    minutes_match = re.search(r'(\d+)m', time_str)
-    seconds_match = re.search(r'(\d+)s', time_str)
-    
-    if days_match:
-        total_seconds += int(days_match.group(1)) * 24 * 3600
-    if hours_match:
-        total_seconds += int(hours_match.group(1)) * 3600
-    if minutes_match:
-        total_seconds += int(minutes_match.group(1)) * 60
-    if seconds_match:
-        total_seconds += int(seconds_match.group(1))
+    Returns (stl_path, mesh_info); the geometry is checked against the build
+    volume before anything is written.
+    """
+    try:
+        triangles = mesh_analysis.load_3mf(input_file_path)
+        mesh_info = mesh_analysis.analyze_triangles(triangles)
+    except mesh_analysis.MeshError as e:
+        raise slice_model.SliceError(f"Failed to read 3MF file: {str(e)}")
+    slice_model.check_build_volume(mesh_info.size["x"], mesh_info.size["y"], mesh_info.size["z"])
     
-    return total_seconds / 3600  # Convert to hours
+    output_file_path = os.path.splitext(input_file_path)[0] + ".stl"
+    mesh_analysis.write_binary_stl(triangles, output_file_path)
+    return output_file_path, mesh_info
 
 def calculate_price(material_id, color_id, filament_used_g, print_time, has_supports, quality_id=None, volume_cm3=None):
     """Calculate price based on material, color, filament usage, print time, and quality"""
     try:
-        materials_data = get_materials()
-        materials = materials_data["materials"]
-        global_settings = materials_data["global_settings"]
+        global_settings = get_materials()["global_settings"]
         
         # Find the material
-        material = next((m for m in materials if m["id"] == material_id), None)
+        material = materials_catalog.find_material(material_id)
         if not material:
             return {"error": f"Material {material_id} not found"}
         
         # Find the color
-        color = next((c for c in material["colors"] if c["id"] == color_id), None)
+        color = materials_catalog.find_color(material_id, color_id)
         if not color:
             return {"error": f"Color {color_id} not found for material {material_id}"}
         
@@ -225,8 +323,8 @@ def calculate_price(material_id, color_id, filament_used_g, print_time, has_supp
         
         # Get quality modifier
         quality_modifier = 0
-        if quality_id and "quality_levels" in global_settings:
-            quality_level = next((q for q in global_settings["quality_levels"] if q["id"] == quality_id), None)
+        if quality_id:
+            quality_level = materials_catalog.find_quality(quality_id)
             if quality_level:
                 quality_modifier = quality_level.get("price_modifier", 0)
         
@@ -247,173 +345,1248 @@ def calculate_price(material_id, color_id, filament_used_g, print_time, has_supp
         print(f"Error in price calculation: {str(e)}")
         return {"error": str(e)}
 
-def get_materials():
-    """Get materials from file or return defaults if file doesn't exist"""
-    if os.path.exists(MATERIALS_FILE):
-        try:
-            with open(MATERIALS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return DEFAULT_MATERIALS
+def calculate_price_matrix(filament_used_g, print_time, has_supports, material_id=None, color_id=None, quality_id=None):
+    """Price a slice result for every matching material/color/quality combination.
+
+    Vectorized equivalent of calculate_price: any of material_id, color_id or
+    quality_id left as None expands to all available options.
+    """
+    materials_data = get_materials()
+    global_settings = materials_data["global_settings"]
+    
+    materials = [m for m in materials_data["materials"] if material_id is None or m["id"] == material_id]
+    if not materials:
+        return {"error": f"Material {material_id} not found"}
+    
+    # One row per (material, color) pair
+    pairs = [(m, c) for m in materials for c in m["colors"] if color_id is None or c["id"] == color_id]
+    if not pairs:
+        return {"error": f"Color {color_id} not found for material {material_id or 'any'}"}
+    
+    quality_levels = global_settings.get("quality_levels") or []
+    if quality_id is None:
+        qualities = [(q["id"], q.get("price_modifier", 0)) for q in quality_levels] or [(None, 0)]
     else:
-        # Create the default materials file
-        with open(MATERIALS_FILE, 'w') as f:
-            json.dump(DEFAULT_MATERIALS, f, indent=2)
-        return DEFAULT_MATERIALS
+        level = materials_catalog.find_quality(quality_id)
+        qualities = [(quality_id, level.get("price_modifier", 0) if level else 0)]
+    
+    cost_per_gram = np.array([m["base_cost_per_gram"] for m, _ in pairs], dtype=float)
+    hourly_rate = np.array([m["hourly_rate"] for m, _ in pairs], dtype=float)
+    color_addon = np.array([c["addon_price"] for _, c in pairs], dtype=float)
+    material_modifier = np.array([m.get("priceModifier", 0) for m, _ in pairs], dtype=float)
+    quality_modifier = np.array([q[1] for q in qualities], dtype=float)
+    
+    material_cost = filament_used_g * cost_per_gram
+    if has_supports:
+        material_cost *= global_settings["support_material_multiplier"]
+    time_cost = parse_time_string(print_time) * hourly_rate
+    base_price = np.maximum(material_cost + time_cost, global_settings["minimum_price"])
+    markup = global_settings.get("markup_percentage", 30) / 100
+    base_price_with_markup = base_price * (1 + markup)
+    # Shape (pairs, qualities)
+    total_price = (base_price_with_markup + color_addon + material_modifier)[:, None] + quality_modifier[None, :]
+    
+    prices = []
+    for i, (material, color) in enumerate(pairs):
+        for j, (q_id, _) in enumerate(qualities):
+            prices.append({
+                "material_id": material["id"],
+                "color_id": color["id"],
+                "quality_id": q_id,
+                "base_price": round(float(base_price[i]), 2),
+                "base_price_with_markup": round(float(base_price_with_markup[i]), 2),
+                "material_cost": round(float(material_cost[i]), 2),
+                "time_cost": round(float(time_cost[i]), 2),
+                "color_addon": round(float(color_addon[i]), 2),
+                "material_modifier": round(float(material_modifier[i]), 2),
+                "quality_modifier": round(float(quality_modifier[j]), 2),
+                "total_price": round(float(total_price[i, j]), 2)
+            })
+    return {"prices": prices}
+
+def analyze_upload(model_path):
+    """Mesh geometry for the pre-quote and the scheduler (None for formats only PrusaSlicer reads).
+
+    STL is memory-mapped and cheap to read. A 3MF means decompressing and
+    parsing its XML, which takes time proportional to the file, so it is
+    only read once, by the worker (convert_3mf_to_stl), and gets None here.
+    """
+    if not model_path.lower().endswith(".stl"):
+        return None
+    try:
+        return mesh_analysis.analyze_mesh(model_path)
+    except (OSError, mesh_analysis.MeshError) as e:
+        print(f"Could not analyze mesh for pre-quote: {str(e)}")
+        return None
+
+def build_provisional_quote(mesh_info, material_id, color_id, quality_id, fill_density, enable_supports):
+    """Estimate a price from mesh geometry alone, shown until the slice finishes"""
+    if mesh_info is None:
+        return None
+    
+    coefficients = prequote.load_coefficients(PREQUOTE_COEFFICIENTS_FILE)
+    estimate = prequote.estimate(mesh_info, fill_density, enable_supports, coefficients)
+    
+    def price_for(filament_used_g, estimated_time):
+        return calculate_price(material_id, color_id, filament_used_g, estimated_time,
+                               enable_supports, quality_id, estimate["volume_cm3"])
+    
+    price_info = price_for(estimate["filament_used_g"], estimate["estimated_time"])
+    if "error" in price_info:
+        return None
+    low = price_for(estimate["filament_used_g_range"][0], estimate["estimated_time_range"][0])
+    high = price_for(estimate["filament_used_g_range"][1], estimate["estimated_time_range"][1])
+    
+    return {
+        **estimate,
+        "price_info": price_info,
+        "price_range": [low["total_price"], high["total_price"]]
+    }
+
+def get_materials():
+    """Get materials, re-reading the file only when it changed on disk"""
+    return materials_catalog.get()
 
 def save_materials(materials_data):
     """Save materials to file"""
-    with open(MATERIALS_FILE, 'w') as f:
-        json.dump(materials_data, f, indent=2)
+    materials_catalog.save(materials_data)
     return True
 
-def process_jobs():
-    """Background thread to process jobs from the queue"""
-    while True:
+def update_job(job_id, **fields):
+    """Update fields of a job in the job store"""
+    job = jobs.update(job_id, **fields)
+    if job is not None:
+        job_events.publish(job_id)
+    return job
+
+def transition_job(job_id, from_statuses, to_status, **fields):
+    """Move a job between statuses in the job store (None if it was in another state)"""
+    job = jobs.transition(job_id, from_statuses, to_status, **fields)
+    if job is not None:
+        job_events.publish(job_id)
+    return job
+
+def worker_id():
+    """Identifies the slicing process in a job's "worker" field"""
+    return f"{WORKER_HOST}:{os.getpid()}"
+
+def wake_slicers():
+    """Tell the in-process workers and slicer processes that a job is pending"""
+    if SLICER_WORKERS > 0:
+        ensure_processing_thread()
+    job_events.publish(PENDING_CHANNEL)
+
+def claim_next_job(fast_lane=False):
+    """Claim the pending job first in dispatch order (see scheduler.py) for this process.
+
+    A fast-lane slicer only takes jobs expected to slice within
+    FAST_LANE_MAX_SECONDS. Returns None if there is nothing to claim.
+    """
+    max_expected_seconds = scheduler.FAST_LANE_MAX_SECONDS if fast_lane else None
+    job = jobs.claim_next("pending", "processing", max_expected_seconds=max_expected_seconds, worker=worker_id())
+    if job is not None:
+        job_events.publish(job["id"])
+    return job
+
+def cancel_checker(job_id):
+    """Return (event, should_cancel) for slice_model; unsubscribe event when done.
+
+    should_cancel() re-reads the job when a change was published for it, or
+    every CANCEL_RECHECK_SECONDS since relayed notifications are best effort.
+    """
+    event = job_events.subscribe(job_id)
+    state = {"checked_at": time.monotonic()}
+
+    def should_cancel():
+        now = time.monotonic()
+        if not event.is_set() and now - state["checked_at"] < CANCEL_RECHECK_SECONDS:
+            return False
+        event.clear()
+        state["checked_at"] = now
+        job = jobs.get(job_id)
+        return job is None or job["status"] == "cancelled"
+
+    return event, should_cancel
+
+def cancel_job(job_id, reason):
+    """Cancel a pending or slicing job; returns the cancelled job, or None if it was in another state.
+
+    A pending job is skipped by whichever worker dequeues it; a local slice
+    is killed by its worker's should_cancel check and a distributed one is
+    withdrawn from the Redis queue.
+    """
+    job = transition_job(job_id, CANCELLABLE_STATUSES, "cancelled", cancelled_at=time.time(), cancel_reason=reason)
+    if job is None:
+        return None
+    if job.get("kind") in ("batch", "sweep"):
+        for child_id in job["children"]:
+            cancel_job(child_id, reason)
+        return job
+    update_parent(job)
+    if job.get("worker") == "redis" and distributed_queue is not None:
         try:
-            job_id = job_queue.get(timeout=1)
-            job = jobs[job_id]
-            
-            if job["status"] == "pending":
-                # Update job status
-                jobs[job_id]["status"] = "processing"
-                
-                try:
-                    # Run slicing script
-                    fill_density = job.get("fill_density", get_materials()["global_settings"]["default_fill_density"])
-                    enable_supports = "1" if job.get("enable_supports", True) else "0"
-                    
-                    result = subprocess.run(
-                        ["python3", "/app/slice_model.py", job["filename"], str(fill_density), enable_supports],
-                        capture_output=True,
-                        text=True,
-                        cwd="/app"
+            distributed_queue.cancel(job_id)
+        except Exception as e:
+            print(f"Error withdrawing job {job_id} from the distributed queue: {str(e)}")
+    metrics.inc("quote_jobs_finished_total", status="cancelled")
+    return job
+
+def process_job(job_id, job=None):
+    """Slice and price a single job; pass job if it was already claimed"""
+    if job is None:
+        # Claim the job so no other worker picks it up
+        job = transition_job(job_id, ("pending",), "processing", worker=worker_id())
+        if job is None:
+            return
+    
+    spans = [make_span("queue_wait", job["created_at"], max(0.0, time.time() - job["created_at"]))]
+    try:
+        fill_density = job.get("fill_density", get_materials()["global_settings"]["default_fill_density"])
+        model_path = slice_model.resolve_model_path(job["filename"], UPLOAD_FOLDER)
+        
+        # Identical mesh + parameters + profile: reuse the previous slice
+        cache_key = slice_cache.make_key(
+            model_path,
+            fill_density,
+            job.get("enable_supports", True),
+            job.get("quality_id", "standard"),
+            mesh_hash=job.get("content_hash"),
+            variant=mesh_decimation.cache_variant()
+        )
+        slice_result = slice_cache.get(cache_key)
+        if slice_result is not None and slice_result.get(gcode_key(slice_result)):
+            # Give this job its own name for the cached G-code, so it is kept as long as the job needs it
+            key = gcode_key(slice_result)
+            gcode_name = job_gcode_name(model_path, slice_result)
+            if artifact_store.link(slice_result[key], gcode_name, job_id):
+                slice_result = dict(slice_result, **{key: gcode_name})
+            else:
+                # The G-code was collected since; slice again rather than hand out a dead name
+                slice_cache.discard(cache_key)
+                slice_result = None
+        cache_hit = slice_result is not None
+        
+        # A 3MF is only read here, in the worker, and not at all on a cache hit
+        mesh_info = None
+        if not cache_hit and model_path.lower().endswith(".3mf"):
+            with span(spans, "convert_3mf"):
+                converted_file_path, mesh_info = convert_3mf_to_stl(model_path)
+            model_path = converted_file_path
+            artifact_store.add_file(converted_file_path, job_id=job_id)
+            # The geometry is kept so sweeps of this job don't read the 3MF again
+            update_job(job_id, filename=os.path.basename(converted_file_path), mesh_info=mesh_info.to_dict())
+        
+        if not cache_hit and distributed_queue is not None:
+            # A slicer node takes it from here; collect_distributed_results finishes the job
+            update_job(job_id, spans=job.get("spans", []) + spans)
+            metrics.observe_spans(spans)
+            submit_distributed_job(job_id, job, model_path, fill_density, cache_key)
+            return
+        
+        if not cache_hit:
+            # Dense meshes may be quoted from a simplified copy; the upload itself is left as it is
+            slice_path, decimation = model_path, None
+            if mesh_decimation.settings():
+                with span(spans, "decimate"):
+                    slice_path, mesh_info, decimation = mesh_decimation.quote_mesh(
+                        model_path, os.path.join(TEMP_DIR, f"{job_id}_quote.stl"), mesh_info
                     )
-                    
-                    if result.returncode != 0:
-                        jobs[job_id]["status"] = "failed"
-                        jobs[job_id]["error"] = result.stderr
-                    else:
-                        slice_result = json.loads(result.stdout)
-                        
-                        if "error" in slice_result:
-                            jobs[job_id]["status"] = "failed"
-                            jobs[job_id]["error"] = slice_result["error"]
-                        else:
-                            # Calculate price
-                            price_info = calculate_price(
-                                job["material_id"],
-                                job["color_id"],
-                                slice_result["filament_used_g"],
-                                slice_result["estimated_time"],
-                                job.get("enable_supports", True),
-                                job.get("quality_id", "standard"),
-                                slice_result.get("volume_cm3")
-                            )
-                            
-                            jobs[job_id]["status"] = "completed"
-                            jobs[job_id]["result"] = {
-                                **slice_result,
-                                "price_info": price_info
-                            }
-                except Exception as e:
-                    jobs[job_id]["status"] = "failed"
-                    jobs[job_id]["error"] = str(e)
-            
-            job_queue.task_done()
-        except queue.Empty:
-            pass
+            event, should_cancel = cancel_checker(job_id)
+            need = admission.job_need(job, admission.load_coefficients(ADMISSION_COEFFICIENTS_FILE))
+            try:
+                # Waits until the job's memory and CPU fit next to the slicers already running
+                with admission_controller.admit(job_id, need, should_cancel, spans) as threads:
+                    slice_result = slice_model.slice_model(
+                        slice_path,
+                        fill_density,
+                        job.get("enable_supports", True),
+                        gcode_path=os.path.splitext(model_path)[0] + ("_quote.gcode" if decimation else ".gcode"),
+                        profile_file=PROFILE_FILE,
+                        mesh_info=mesh_info,
+                        spans=spans,
+                        should_cancel=should_cancel,
+                        threads=threads
+                    ).to_dict()
+            finally:
+                job_events.unsubscribe(job_id, event)
+                if slice_path != model_path and os.path.exists(slice_path):
+                    os.remove(slice_path)
+            if decimation:
+                # G-code of the simplified mesh prices the quote but is never the print file
+                slice_result["quote_decimation"] = decimation
+                slice_result["quote_gcode_file"] = slice_result["gcode_file"]
+                slice_result["gcode_file"] = None
+            artifact_store.add_file(os.path.join(UPLOAD_FOLDER, slice_result[gcode_key(slice_result)]), job_id=job_id)
+            slice_cache.put(cache_key, slice_result)
+        
+        finish_job(job_id, job, slice_result, cache_hit, spans)
+    except slice_model.SliceCancelled:
+        # cancel_job already set the status
+        metrics.observe_spans(spans)
+    except slice_model.SliceError as e:
+        fail_job(job_id, job, spans, error=e.message, error_details=e.details)
+    except Exception as e:
+        fail_job(job_id, job, spans, error=str(e))
+
+def gcode_key(slice_result):
+    """Result field naming the job's G-code: quote_gcode_file when it was sliced from a simplified mesh"""
+    return "quote_gcode_file" if slice_result.get("quote_decimation") else "gcode_file"
+
+def job_gcode_name(model_name, slice_result):
+    """The job's own name for the G-code of slice_result, quote-only ones marked as such"""
+    suffix = "_quote.gcode" if slice_result.get("quote_decimation") else ".gcode"
+    return os.path.splitext(os.path.basename(model_name))[0] + suffix
+
+def finish_job(job_id, job, slice_result, cache_hit, spans):
+    """Price a sliced job and mark it completed; spans are this run's stage timings"""
+    with span(spans, "pricing"):
+        price_info = calculate_price(
+            job["material_id"],
+            job["color_id"],
+            slice_result["filament_used_g"],
+            slice_result["estimated_time"],
+            job.get("enable_supports", True),
+            job.get("quality_id", "standard"),
+            slice_result.get("volume_cm3")
+        )
+    
+    # Measured next to the estimates so the scheduler and admission models can be checked
+    actual_slice_seconds = scheduler.slice_seconds(spans)
+    actual_slice_memory_mb = admission.peak_memory_mb(spans)
+    
+    # The exact price replaces the geometric estimate
+    provisional_quote = job.get("provisional_quote")
+    completed = transition_job(job_id, ("processing",), "completed", provisional_quote=None,
+                               spans=job.get("spans", []) + spans, actual_slice_seconds=actual_slice_seconds,
+                               actual_slice_memory_mb=actual_slice_memory_mb, result={
+        **slice_result,
+        "cache_hit": cache_hit,
+        "price_info": price_info,
+        "provisional_total_price": provisional_quote["price_info"]["total_price"] if provisional_quote else None
+    })
+    metrics.observe_spans(spans)
+    if completed is None:
+        # Cancelled while it was being sliced
+        return
+    metrics.inc("quote_jobs_finished_total", status="completed")
+    update_parent(job)
+    if actual_slice_seconds is not None and job.get("expected_slice_seconds") is not None:
+        metrics.inc("quote_slice_expected_seconds_total", job["expected_slice_seconds"])
+        metrics.inc("quote_slice_actual_seconds_total", actual_slice_seconds)
+
+def fail_job(job_id, job, spans, **fields):
+    """Mark a job failed, keeping the timings of the stages it got through"""
+    failed = transition_job(job_id, ("processing",), "failed", spans=job.get("spans", []) + spans, **fields)
+    metrics.observe_spans(spans)
+    if failed is None:
+        # Cancelled while it was being sliced
+        return
+    metrics.inc("quote_jobs_finished_total", status="failed")
+    update_parent(job)
+    stage = next((item["name"] for item in reversed(spans) if item.get("failed")), "other")
+    metrics.inc("quote_job_failures_total", stage=stage)
+
+def update_parent(job):
+    """Re-aggregate the batch or infill sweep a child job belongs to"""
+    if job.get("batch_id"):
+        update_batch(job["batch_id"])
+    elif job.get("sweep_id"):
+        update_sweep(job["sweep_id"])
+
+def price_batch_part(part, slice_result):
+    """Unit price of one batch part from its child job's slice"""
+    return calculate_price(
+        part["material_id"],
+        part["color_id"],
+        slice_result["filament_used_g"],
+        slice_result["estimated_time"],
+        part["enable_supports"],
+        part["quality_id"],
+        slice_result.get("volume_cm3")
+    )
+
+def update_batch(batch_id):
+    """Recompute a batch's prices and status after one of its children changed.
+
+    Children finish concurrently, possibly in other processes, so the
+    aggregate is re-checked after writing it: a child that changed
+    meanwhile triggers another round here (or its own update after us).
+    """
+    seen = None
+    while True:
+        batch = jobs.get(batch_id)
+        if batch is None or batch["status"] != "processing":
+            return
+        children = {child_id: jobs.get(child_id) for child_id in batch["children"]}
+        versions = {child_id: (child or {}).get("version") for child_id, child in children.items()}
+        if versions == seen:
+            return
+        status, fields = batch_quote.summarize(batch["parts"], children, price_batch_part, FINAL_STATUSES)
+        if status != "processing":
+            fields["finished_at"] = time.time()
+        transition_job(batch_id, ("processing",), status, **fields)
+        seen = versions
+
+def sweep_pricer(sweep, material_id=None, color_id=None, quality_id=None):
+    """price(filament_used_g, estimated_time) for points on a sweep's curve, in its own or the given options"""
+    def price(filament_used_g, estimated_time):
+        return calculate_price(
+            material_id or sweep["material_id"],
+            color_id or sweep["color_id"],
+            filament_used_g,
+            estimated_time,
+            sweep["enable_supports"],
+            quality_id or sweep["quality_id"]
+        )
+    return price
+
+def update_sweep(sweep_id):
+    """Refit a sweep's curve after one of its anchor jobs changed (see update_batch)"""
+    seen = None
+    while True:
+        sweep = jobs.get(sweep_id)
+        if sweep is None or sweep["status"] not in SWEEP_OPEN_STATUSES:
+            return
+        children = {anchor["job_id"]: jobs.get(anchor["job_id"]) for anchor in sweep["anchors"]}
+        versions = {child_id: (child or {}).get("version") for child_id, child in children.items()}
+        if versions == seen:
+            return
+        status, fields = infill_sweep.summarize(sweep["anchors"], children, sweep_pricer(sweep), FINAL_STATUSES)
+        if status != "processing":
+            fields["finished_at"] = time.time()
+        transition_job(sweep_id, SWEEP_OPEN_STATUSES, status, **fields)
+        seen = versions
+
+def submit_distributed_job(job_id, job, model_path, fill_density, cache_key):
+    """Publish the model, profile and parameters of a job to the Redis queue"""
+    # The upload hash covers the original bytes; a converted 3MF needs its own
+    model_hash = job.get("content_hash") if model_path == os.path.join(UPLOAD_FOLDER, job["filename"]) else None
+    payload = {
+        "model_sha256": distributed_queue.put_blob_file(model_path, model_hash),
+        "model_ext": os.path.splitext(model_path)[1].lower(),
+        "profile_sha256": distributed_queue.put_blob_file(PROFILE_FILE) if os.path.exists(PROFILE_FILE) else None,
+        "fill_density": fill_density,
+        "enable_supports": job.get("enable_supports", True),
+        "decimate": mesh_decimation.settings(),
+        "need": admission.job_need(job, admission.load_coefficients(ADMISSION_COEFFICIENTS_FILE)),
+        "cache_key": cache_key
+    }
+    update_job(job_id, worker="redis")
+    distributed_queue.submit(job_id, payload)
+    ensure_result_collector()
+
+def store_distributed_gcode(job_id, job, slice_result, spans):
+    """Fetch the G-code a slicer node sent back into the artifact store; returns the result to keep.
+
+    The node's gcode_file names a file on the node, so it is replaced by
+    the job's own name here (under quote_gcode_file for a simplified
+    mesh), or dropped if the G-code can't be fetched (the quote still
+    stands, but nothing is downloadable or cached).
+    """
+    slice_result = dict(slice_result)
+    digest = slice_result.pop("gcode_blob", None)
+    key = gcode_key(slice_result)
+    slice_result["gcode_file"] = None
+    slice_result[key] = None
+    if digest is None:
+        return slice_result
+    gcode_name = job_gcode_name(job["filename"], slice_result)
+    gcode_path = os.path.join(UPLOAD_FOLDER, gcode_name)
+    try:
+        with span(spans, "fetch_gcode"):
+            with open(gcode_path, "wb") as f:
+                f.write(gzip.decompress(distributed_queue.get_blob(digest)))
+            artifact_store.add_file(gcode_path, job_id=job_id)
+    except Exception as e:
+        print(f"Could not fetch the G-code of job {job_id}: {str(e)}")
+        if os.path.exists(gcode_path):
+            os.remove(gcode_path)
+        return slice_result
+    slice_result[key] = gcode_name
+    return slice_result
+
+def collect_distributed_results():
+    """Background thread: apply results posted by slicer nodes and requeue their crashed jobs"""
+    last_sweep = 0.0
+    while not shutdown_event.is_set():
+        try:
+            if time.time() - last_sweep > REQUEUE_INTERVAL:
+                distributed_queue.requeue_expired()
+                last_sweep = time.time()
+            item = distributed_queue.next_result(timeout=5)
+            if item is None:
+                continue
+            job_id, payload, message = item
+            job = jobs.get(job_id)
+            if job is None or job["status"] != "processing":
+                continue
+            node_spans = message.get("spans") or []
+            if message.get("error"):
+                fail_job(job_id, job, node_spans, error=message["error"], error_details=message.get("error_details"))
+                continue
+            slice_result = store_distributed_gcode(job_id, job, message["result"], node_spans)
+            if payload.get("cache_key") and slice_result.get(gcode_key(slice_result)):
+                slice_cache.put(payload["cache_key"], slice_result)
+            finish_job(job_id, job, slice_result, False, node_spans)
         except Exception as e:
-            print(f"Error in job processing: {str(e)}")
-            time.sleep(1)
+            print(f"Error collecting distributed results: {str(e)}")
+            shutdown_event.wait(5)
+
+def ensure_result_collector():
+    """Start the distributed result collector thread in this process if needed"""
+    global result_collector_thread
+    if distributed_queue is None:
+        return
+    with processing_lock:
+        if result_collector_thread is None or not result_collector_thread.is_alive():
+            result_collector_thread = threading.Thread(
+                target=collect_distributed_results, name="result-collector", daemon=True
+            )
+            result_collector_thread.start()
 
-# Start the background processing thread
+def process_jobs(fast_lane=False):
+    """Worker loop: claim and process pending jobs until shutdown"""
+    wakeup = job_events.subscribe(PENDING_CHANNEL)
+    try:
+        while not shutdown_event.is_set():
+            wakeup.clear()
+            job = claim_next_job(fast_lane)
+            if job is None:
+                wakeup.wait(1)
+                continue
+            
+            try:
+                process_job(job["id"], job)
+            except Exception as e:
+                print(f"Error in job processing: {str(e)}")
+                time.sleep(1)
+    finally:
+        job_events.unsubscribe(PENDING_CHANNEL, wakeup)
+
+# Start the background worker pool
 def ensure_processing_thread():
-    global processing_thread
+    """Make sure SLICER_WORKERS worker threads are alive, the first few in the fast lane"""
     with processing_lock:
-        if processing_thread is None or not processing_thread.is_alive():
-            processing_thread = threading.Thread(target=process_jobs, daemon=True)
-            processing_thread.start()
+        if shutdown_event.is_set():
+            return
+        worker_threads[:] = [t for t in worker_threads if t.is_alive()]
+        fast_lane_workers = scheduler.fast_lane_workers(SLICER_WORKERS)
+        while len(worker_threads) < SLICER_WORKERS:
+            fast_lane = sum(1 for t in worker_threads if t.name.startswith("slicer-fast")) < fast_lane_workers
+            worker = threading.Thread(
+                target=process_jobs,
+                args=(fast_lane,),
+                name=f"slicer-{'fast' if fast_lane else 'worker'}-{len(worker_threads)}",
+                daemon=True
+            )
+            worker.start()
+            worker_threads.append(worker)
+
+def shutdown_workers(timeout=30):
+    """Stop claiming jobs and wait for in-flight jobs to finish"""
+    shutdown_event.set()
+    with processing_lock:
+        for worker in worker_threads:
+            worker.join(timeout)
+        worker_threads.clear()
+
+atexit.register(shutdown_workers)
+
+def requeue_unfinished_jobs(dead_worker=None):
+    """Re-enqueue jobs left pending or mid-slice by a previous run.
+
+    Jobs "processing" on this host (WORKER_HOST) were interrupted by the
+    restart. With dead_worker only that worker's jobs are reset and re-enqueued.
+    """
+    host = WORKER_HOST
+    reset = []
+    for job_id in jobs.ids_with_status(("processing",)):
+        owner = (jobs.get(job_id) or {}).get("worker")
+        if dead_worker is not None:
+            interrupted = owner == dead_worker
+        else:
+            interrupted = owner is None or owner.split(":")[0] == host
+        if interrupted and transition_job(job_id, ("processing",), "pending", worker=None):
+            reset.append(job_id)
+    
+    pending = reset if dead_worker is not None else jobs.ids_with_status(("pending",))
+    if pending:
+        wake_slicers()
+    requeued = len(pending)
+    if requeued:
+        print(f"Re-enqueued {requeued} unfinished job(s)")
+    return requeued
+
+def enforce_job_retention():
+    """Background thread: periodically delete expired finished jobs"""
+    while not shutdown_event.wait(JOB_RETENTION_INTERVAL):
+        try:
+            evicted = jobs.evict(time.time() - JOB_RETENTION_SECONDS)
+            if evicted:
+                print(f"Evicted {evicted} expired job(s)")
+        except Exception as e:
+            print(f"Error enforcing job retention: {str(e)}")
+
+def cancel_abandoned_jobs():
+    """Background thread: cancel pending/slicing jobs not polled for ABANDON_AFTER_SECONDS"""
+    while not shutdown_event.wait(ABANDON_CHECK_INTERVAL):
+        try:
+            stale = jobs.ids_not_polled_since(CANCELLABLE_STATUSES, time.time() - ABANDON_AFTER_SECONDS)
+            # Parts of a batch or sweep go with it, which is what clients poll
+            stale = [job_id for job_id in stale
+                     if not any((jobs.get(job_id) or {}).get(key) for key in ("batch_id", "sweep_id"))]
+            cancelled = sum(1 for job_id in stale if cancel_job(job_id, "abandoned"))
+            if cancelled:
+                print(f"Cancelled {cancelled} abandoned job(s)")
+        except Exception as e:
+            print(f"Error cancelling abandoned jobs: {str(e)}")
+
+def is_artifact_protected(job_id):
+    """Files of queued, slicing and approved jobs are never collected"""
+    job = jobs.get(job_id)
+    return job is not None and job["status"] in PROTECTED_STATUSES
+
+def enforce_artifact_quota():
+    """Background thread: keep stored uploads and G-code under ARTIFACT_QUOTA_BYTES"""
+    while not shutdown_event.wait(ARTIFACT_GC_INTERVAL):
+        try:
+            freed = artifact_store.collect(ARTIFACT_QUOTA_BYTES, is_artifact_protected)
+            if freed:
+                print(f"Collected {freed / 1e6:.1f} MB of artifacts")
+        except Exception as e:
+            print(f"Error enforcing artifact quota: {str(e)}")
+
+def start_background_tasks():
+    """Recover queued work from the job store and start the retention, quota and abandon threads"""
+    global retention_thread, artifact_gc_thread, abandon_thread
+    requeue_unfinished_jobs()
+    if retention_thread is None:
+        retention_thread = threading.Thread(target=enforce_job_retention, name="job-retention", daemon=True)
+        retention_thread.start()
+    if artifact_gc_thread is None:
+        artifact_gc_thread = threading.Thread(target=enforce_artifact_quota, name="artifact-gc", daemon=True)
+        artifact_gc_thread.start()
+    if abandon_thread is None and ABANDON_AFTER_SECONDS > 0:
+        abandon_thread = threading.Thread(target=cancel_abandoned_jobs, name="abandon-sweep", daemon=True)
+        abandon_thread.start()
+    ensure_result_collector()
+
+@app.teardown_request
+def discard_unclaimed_uploads(exc):
+    """Delete streamed upload parts the view did not keep"""
+    if isinstance(request, IngestRequest):
+        request.discard_unclaimed_uploads()
+
+def slicer_count():
+    """Slicers taking jobs from this job store (in-process threads, or worker.py's processes)"""
+    return SLICER_WORKERS or int(os.environ.get("SLICER_PROCESSES", os.cpu_count() or 1))
+
+def backlog_full(endpoint):
+    """A 429 response with Retry-After if the slicing backlog is over its limit, else None"""
+    if not UPLOAD_BACKLOG_LIMIT and not UPLOAD_BACKLOG_MAX_SECONDS:
+        return None
+    count, expected_seconds = jobs.backlog(("pending",))
+    drain_seconds = expected_seconds / slicer_count()
+    waits = []
+    if UPLOAD_BACKLOG_LIMIT and count >= UPLOAD_BACKLOG_LIMIT:
+        # Until enough of the queue has drained to make room
+        waits.append(drain_seconds * (count - UPLOAD_BACKLOG_LIMIT + 1) / count)
+    if UPLOAD_BACKLOG_MAX_SECONDS and drain_seconds >= UPLOAD_BACKLOG_MAX_SECONDS:
+        waits.append(drain_seconds - UPLOAD_BACKLOG_MAX_SECONDS)
+    if not waits:
+        return None
+    
+    retry_after = int(min(max(math.ceil(max(waits)), RETRY_AFTER_MIN_SECONDS), RETRY_AFTER_MAX_SECONDS))
+    metrics.inc("quote_uploads_rejected_total", endpoint=endpoint)
+    response = jsonify({
+        "error": "Too many models are waiting to be sliced; please try again later",
+        "queued_jobs": count,
+        "retry_after": retry_after
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
 
 @app.route("/api/upload", methods=["POST"])
 def upload_file():
     """Upload a 3D model file and queue it for processing"""
-    if "file" not in request.files:
+    too_large = jsonify({"error": f"File too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024)}MB"}), 400
+    
+    # Reject on the declared length before reading any of the body
+    if request.content_length is not None and request.content_length > MAX_FILE_SIZE + FORM_OVERHEAD:
+        return too_large
+    full = backlog_full("upload")
+    if full is not None:
+        return full
+    
+    spans = []
+    try:
+        with span(spans, "upload_receive"):
+            files = request.files
+    except RequestEntityTooLarge:
+        return too_large
+    
+    if "file" not in files:
         return jsonify({"error": "No file uploaded"}), 400
 
-    file = request.files["file"]
+    file = files["file"]
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
     
     if not allowed_file(file.filename):
         return jsonify({"error": f"File type not allowed. Supported types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
     
-    if request.content_length > MAX_FILE_SIZE:
-        return jsonify({"error": f"File too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024)}MB"}), 400
-    
     # Generate a unique filename
     filename = secure_filename(file.filename)
     unique_filename = f"{uuid.uuid4()}_{filename}"
-    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-    
-    # Save the file
-    file.save(file_path)
-    
-    # If the file is a 3MF, convert it to STL
-    converted_file_path = None
-    if file_path.lower().endswith('.3mf'):
-        converted_file_path = convert_3mf_to_stl(file_path)
-        if converted_file_path:
-            # Update the filename to use the converted STL file
-            unique_filename = os.path.basename(converted_file_path)
-        else:
-            return jsonify({"error": "Failed to convert 3MF file to STL"}), 500
+    job_id = str(uuid.uuid4())
+    
+    # The body was already streamed to the temp dir (and hashed on the way)
+    upload = file.stream.finish()
+    if not format_matches_extension(upload.format, filename):
+        os.unlink(upload.path)
+        return jsonify({"error": f"File content does not look like a .{filename.rsplit('.', 1)[-1]} file"}), 400
+    
+    # Move it into the store; a re-upload of the same file only adds a link
+    with span(spans, "upload_save"):
+        artifact_store.add_file(upload.path, unique_filename, job_id, digest=upload.sha256)
     
     # Create a job
-    job_id = str(uuid.uuid4())
-    material_id = request.form.get("material_id", "pla")
-    color_id = request.form.get("color_id", "white")
-    quality_id = request.form.get("quality_id", "standard")
-    fill_density = float(request.form.get("fill_density", get_materials()["global_settings"]["default_fill_density"]))
-    enable_supports = request.form.get("enable_supports", "true").lower() == "true"
+    settings = {
+        "material_id": request.form.get("material_id", "pla"),
+        "color_id": request.form.get("color_id", "white"),
+        "quality_id": request.form.get("quality_id", "standard"),
+        "fill_density": float(request.form.get("fill_density", get_materials()["global_settings"]["default_fill_density"])),
+        "enable_supports": request.form.get("enable_supports", "true").lower() == "true"
+    }
+    job = create_model_job(job_id, unique_filename, filename, upload, settings, spans)
+    wake_slicers()
+    metrics.observe_spans(spans)
+    
+    return jsonify({
+        "job_id": job_id,
+        "status": "pending",
+        "message": "File uploaded and queued for processing",
+        "provisional_quote": job["provisional_quote"]
+    })
+
+def create_model_job(job_id, unique_filename, filename, upload, settings, spans, mesh_info=None, **fields):
+    """Pre-quote, schedule and store a pending job for a stored upload; returns the job.
+
+    settings holds material_id, color_id, quality_id, fill_density and
+    enable_supports; fields are added to the job as they are. mesh_info
+    saves reading the mesh again if the caller already analyzed it.
+    """
+    created_at = time.time()
+    with span(spans, "prequote"):
+        if mesh_info is None:
+            mesh_info = analyze_upload(os.path.join(UPLOAD_FOLDER, unique_filename))
+        provisional_quote = build_provisional_quote(
+            mesh_info, settings["material_id"], settings["color_id"], settings["quality_id"],
+            settings["fill_density"], settings["enable_supports"]
+        )
+        # Expected slice time and dispatch priority
+        schedule = scheduler.schedule_fields(
+            mesh_info, settings["fill_density"], settings["enable_supports"], upload.size, created_at,
+            scheduler.load_coefficients(SCHEDULER_COEFFICIENTS_FILE)
+        )
     
     job = {
         "id": job_id,
         "filename": unique_filename,
         "original_filename": filename,
         "status": "pending",
+        "created_at": created_at,
+        "content_hash": upload.sha256,
+        "source_format": upload.format,
+        "file_size": upload.size,
+        "material_id": settings["material_id"],
+        "color_id": settings["color_id"],
+        "quality_id": settings["quality_id"],
+        "fill_density": settings["fill_density"],
+        "enable_supports": settings["enable_supports"],
+        "provisional_quote": provisional_quote,
+        **schedule,
+        **fields,
+        "spans": spans
+    }
+    jobs.create(job)
+    return job
+
+def receive_batch_files(files, received):
+    """Check the uploaded files of a batch and unpack zips, appending (name, IngestResult) to received.
+
+    Raises batch_quote.BatchError for anything the client has to fix.
+    """
+    for file in files:
+        upload = file.stream.finish()
+        if file.filename.lower().endswith(".zip"):
+            try:
+                budget = BATCH_MAX_SIZE - sum(result.size for _, result in received)
+                received.extend(batch_quote.extract_zip(
+                    upload.path, TEMP_DIR, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, budget,
+                    BATCH_MAX_FILES - len(received)
+                ))
+            finally:
+                os.unlink(upload.path)
+            continue
+        received.append((file.filename, upload))
+        if not allowed_file(file.filename):
+            raise batch_quote.BatchError(
+                f"{file.filename}: file type not allowed. Supported types: {', '.join(ALLOWED_EXTENSIONS)} or a .zip of them"
+            )
+        if upload.size > MAX_FILE_SIZE:
+            raise batch_quote.BatchError(f"{file.filename}: file too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024)}MB")
+        if len(received) > BATCH_MAX_FILES:
+            raise batch_quote.BatchError(f"A batch may hold at most {BATCH_MAX_FILES} files")
+    
+    for name, upload in received:
+        if not format_matches_extension(upload.format, name):
+            raise batch_quote.BatchError(f"{name}: content does not look like a .{name.rsplit('.', 1)[-1]} file")
+    if not received:
+        raise batch_quote.BatchError(f"No {', '.join(ALLOWED_EXTENSIONS)} files in the upload")
+
+@app.route("/api/batch", methods=["POST"])
+def upload_batch():
+    """Upload several model files (or a zip of them) and quote them as one batch.
+
+    Form fields material_id, color_id, quality_id, fill_density and
+    enable_supports apply to every part; "parts" is an optional JSON list
+    of {"name": <file or zip member name>, "quantity": n, ...} overrides.
+    """
+    too_large = jsonify({"error": f"Batch too large. Maximum size: {BATCH_MAX_SIZE / (1024 * 1024):.0f}MB"}), 400
+    if request.content_length is not None and request.content_length > BATCH_MAX_SIZE + FORM_OVERHEAD:
+        return too_large
+    # A zip may carry the whole batch; model files are held to MAX_FILE_SIZE in receive_batch_files
+    request.max_content_length = BATCH_MAX_SIZE + FORM_OVERHEAD
+    request.max_file_size = BATCH_MAX_SIZE
+    full = backlog_full("batch")
+    if full is not None:
+        return full
+    
+    spans = []
+    try:
+        with span(spans, "upload_receive"):
+            files = [f for f in request.files.getlist("files") + request.files.getlist("file") if f.filename]
+    except RequestEntityTooLarge:
+        return too_large
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+    
+    received = []
+    try:
+        with span(spans, "unpack"):
+            receive_batch_files(files, received)
+        defaults = batch_quote.parse_settings(request.form, {
+            "quantity": 1,
+            "material_id": "pla",
+            "color_id": "white",
+            "quality_id": "standard",
+            "fill_density": get_materials()["global_settings"]["default_fill_density"],
+            "enable_supports": "true"
+        })
+        overrides = batch_quote.parse_overrides(request.form.get("parts"))
+        parts = []
+        matched = set()
+        for name, upload in received:
+            override = batch_quote.match_override(name, overrides) or {}
+            if override:
+                matched.add(str(override["name"]))
+            parts.append({"name": name, "content_hash": upload.sha256, **batch_quote.parse_settings(override, defaults)})
+        unknown = sorted(set(overrides) - matched)
+        if unknown:
+            raise batch_quote.BatchError(f"parts entries match no uploaded file: {', '.join(unknown)}")
+    except (batch_quote.BatchError, RequestEntityTooLarge) as e:
+        for _, upload in received:
+            if os.path.exists(upload.path):
+                os.unlink(upload.path)
+        if isinstance(e, RequestEntityTooLarge):
+            return jsonify({"error": f"A file is too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024)}MB"}), 400
+        return jsonify({"error": str(e)}), 400
+    
+    # One child job per distinct content + slicing settings
+    batch_id = str(uuid.uuid4())
+    groups = list(batch_quote.group_parts(parts).values())
+    upload_of = {id(part): upload for part, (_, upload) in zip(parts, received)}
+    for group in groups:
+        child_id = str(uuid.uuid4())
+        for part in group:
+            part["job_id"] = child_id
+    
+    # The parent goes in first so children finishing early find it
+    jobs.create({
+        "id": batch_id,
+        "kind": "batch",
+        "status": "processing",
+        # Never claimed or reset by slicers; it finishes with its children
+        "worker": "batch",
+        "original_filename": files[0].filename if len(files) == 1 else f"{len(parts)} files",
         "created_at": time.time(),
-        "material_id": material_id,
-        "color_id": color_id,
-        "quality_id": quality_id,
-        "fill_density": fill_density,
-        "enable_supports": enable_supports
+        "parts": parts,
+        "children": [group[0]["job_id"] for group in groups],
+        "progress": {"completed": 0, "failed": 0, "waiting": len(parts), "total": len(parts)},
+        "spans": spans
+    })
+    metrics.observe_spans(spans)
+    
+    for group in groups:
+        first = group[0]
+        upload = upload_of[id(first)]
+        filename = secure_filename(os.path.basename(first["name"])) or f"part.{first['name'].rsplit('.', 1)[-1].lower()}"
+        unique_filename = f"{uuid.uuid4()}_{filename}"
+        child_spans = []
+        with span(child_spans, "upload_save"):
+            artifact_store.add_file(upload.path, unique_filename, first["job_id"], digest=upload.sha256)
+        # Identical copies are not needed
+        for part in group[1:]:
+            duplicate = upload_of[id(part)]
+            if duplicate.path != upload.path and os.path.exists(duplicate.path):
+                os.unlink(duplicate.path)
+        create_model_job(first["job_id"], unique_filename, filename, upload, first, child_spans,
+                         batch_id=batch_id, quantity=sum(part["quantity"] for part in group))
+        metrics.observe_spans(child_spans)
+    wake_slicers()
+    
+    return jsonify({
+        "batch_id": batch_id,
+        "status": "processing",
+        "message": f"{len(parts)} file(s) uploaded; {len(groups)} distinct part(s) queued for slicing",
+        "parts": [{"name": part["name"], "job_id": part["job_id"], "quantity": part["quantity"]} for part in parts]
+    })
+
+@app.route("/api/batch/<batch_id>", methods=["GET"])
+def get_batch_status(batch_id):
+    """Aggregated status of a batch with per-part and total prices"""
+    batch = jobs.get(batch_id)
+    if batch is None or batch.get("kind") != "batch":
+        return jsonify({"error": "Batch not found"}), 404
+    jobs.touch(batch_id)
+    
+    return jsonify(batch)
+
+def source_upload_name(job):
+    """Stored name of a job's upload as received (once a 3MF is read, filename points at the converted STL)"""
+    return os.path.splitext(job["filename"])[0] + os.path.splitext(job["original_filename"])[1]
+
+def create_sweep_anchor(sweep, fill_density, mesh_info=None):
+    """Queue the slice of a sweep's upload at one anchor density; returns the child job id.
+
+    The id is derived from the sweep and the density, so an anchor is only
+    ever queued once. Returns None if the upload is no longer stored.
+    """
+    child_id = str(uuid.uuid5(uuid.UUID(sweep["id"]), f"{fill_density:.2f}"))
+    if jobs.get(child_id) is not None:
+        return child_id
+    spans = []
+    # The source may be the STL read from a 3MF upload: keep the extension of what is linked
+    name = os.path.splitext(sweep["original_filename"])[0] + os.path.splitext(sweep["source_filename"])[1]
+    with span(spans, "upload_save"):
+        stored_name = artifact_store.link(sweep["source_filename"], f"{uuid.uuid4()}_{name}", child_id)
+    if stored_name is None:
+        return None
+    upload = IngestResult(
+        path=os.path.join(UPLOAD_FOLDER, stored_name),
+        size=sweep["file_size"],
+        sha256=sweep["content_hash"],
+        format=sweep["source_format"]
+    )
+    settings = {key: sweep[key] for key in ("material_id", "color_id", "quality_id", "enable_supports")}
+    create_model_job(child_id, stored_name, sweep["original_filename"], upload, {**settings, "fill_density": fill_density},
+                     spans, mesh_info=mesh_info, sweep_id=sweep["id"])
+    metrics.observe_spans(spans)
+    return child_id
+
+def add_sweep_anchor(sweep_id, fill_density):
+    """Add an anchor to a sweep and queue its slice; returns the density if it is (or already was) being sliced"""
+    with sweep_lock:
+        sweep = jobs.get(sweep_id)
+        if sweep is None or sweep["status"] not in SWEEP_OPEN_STATUSES:
+            return None
+        existing = next((a for a in sweep["anchors"] if abs(a["fill_density"] - fill_density) < 1e-9), None)
+        if existing is not None:
+            child = jobs.get(existing["job_id"])
+            return fill_density if child is not None and child["status"] not in FINAL_STATUSES else None
+        if len(sweep["anchors"]) >= infill_sweep.SWEEP_MAX_ANCHORS:
+            return None
+        child_id = create_sweep_anchor(sweep, fill_density)
+        if child_id is None:
+            return None
+        # Another process may add an anchor at the same time; at worst one of the two is sliced for nothing
+        anchors = sorted(sweep["anchors"] + [{"fill_density": fill_density, "job_id": child_id}],
+                         key=lambda anchor: anchor["fill_density"])
+        transition_job(sweep_id, SWEEP_OPEN_STATUSES, "processing", anchors=anchors,
+                       children=[anchor["job_id"] for anchor in anchors], finished_at=None)
+    wake_slicers()
+    update_sweep(sweep_id)
+    return fill_density
+
+@app.route("/api/job/<job_id>/sweep", methods=["POST"])
+def start_infill_sweep(job_id):
+    """Slice a job's upload at a few fill densities to quote every other density without re-slicing.
+
+    Optional form or query field anchors: comma-separated densities
+    (default SWEEP_ANCHORS). Asking again without anchors returns the
+    job's existing sweep.
+    """
+    source = jobs.get(job_id)
+    if source is None:
+        return jsonify({"error": "Job not found"}), 404
+    if source.get("kind") or source.get("sweep_id") or not source.get("filename"):
+        return jsonify({"error": "Only a model upload can be swept"}), 400
+    
+    existing = jobs.get(source["infill_sweep_id"]) if source.get("infill_sweep_id") else None
+    if existing is not None and existing["status"] != "cancelled" and not request.values.get("anchors"):
+        return jsonify(existing)
+    try:
+        densities = infill_sweep.parse_anchors(request.values.get("anchors"))
+    except infill_sweep.SweepError as e:
+        return jsonify({"error": str(e)}), 400
+    full = backlog_full("sweep")
+    if full is not None:
+        return full
+    source_filename = source_upload_name(source)
+    mesh_info = None
+    if source.get("mesh_info"):
+        # A 3MF its job already read: anchors slice the STL it was converted to, with its geometry
+        mesh_info = mesh_analysis.MeshInfo.from_dict(source["mesh_info"])
+        if os.path.exists(os.path.join(UPLOAD_FOLDER, source["filename"])):
+            source_filename = source["filename"]
+    model_path = os.path.join(UPLOAD_FOLDER, source_filename)
+    if not os.path.exists(model_path):
+        return jsonify({"error": "The upload of this job is no longer stored"}), 410
+    
+    sweep_id = str(uuid.uuid4())
+    anchors = [
+        {"fill_density": density, "job_id": str(uuid.uuid5(uuid.UUID(sweep_id), f"{density:.2f}"))}
+        for density in densities
+    ]
+    sweep = {
+        "id": sweep_id,
+        "kind": "sweep",
+        "status": "processing",
+        # Never claimed or reset by slicers; it finishes with its anchors
+        "worker": "sweep",
+        "source_job_id": job_id,
+        "source_filename": source_filename,
+        "original_filename": source["original_filename"],
+        "content_hash": source["content_hash"],
+        "source_format": source["source_format"],
+        "file_size": source["file_size"],
+        "material_id": source["material_id"],
+        "color_id": source["color_id"],
+        "quality_id": source["quality_id"],
+        "enable_supports": source["enable_supports"],
+        "created_at": time.time(),
+        "anchors": anchors,
+        "children": [anchor["job_id"] for anchor in anchors],
+        "progress": {"measured": 0, "waiting": len(anchors), "total": len(anchors)},
+        "spans": []
     }
+    # The parent goes in first so anchors finishing early find it
+    jobs.create(sweep)
+    if mesh_info is None:
+        mesh_info = analyze_upload(model_path)
+    for anchor in anchors:
+        create_sweep_anchor(sweep, anchor["fill_density"], mesh_info)
+    update_job(job_id, infill_sweep_id=sweep_id)
+    wake_slicers()
+    
+    return jsonify({
+        "sweep_id": sweep_id,
+        "status": "processing",
+        "message": f"Slicing {len(anchors)} fill densities",
+        "anchors": anchors
+    })
+
+@app.route("/api/sweep/<sweep_id>", methods=["GET"])
+def get_sweep_status(sweep_id):
+    """Sweep status with its anchors and the price curve fitted so far"""
+    sweep = jobs.get(sweep_id)
+    if sweep is None or sweep.get("kind") != "sweep":
+        return jsonify({"error": "Sweep not found"}), 404
+    jobs.touch(sweep_id)
+    
+    return jsonify(sweep)
+
+@app.route("/api/sweep/<sweep_id>/quote", methods=["GET"])
+def quote_from_sweep(sweep_id):
+    """Interpolated filament, time and price at ?fill_density= from a sweep, with error bars.
+
+    material_id, color_id and quality_id default to the swept job's. Where
+    the fit is worse than SWEEP_TOLERANCE_PCT another anchor is queued
+    (unless refine=false) and its density returned as "refining".
+    """
+    sweep = jobs.get(sweep_id)
+    if sweep is None or sweep.get("kind") != "sweep":
+        return jsonify({"error": "Sweep not found"}), 404
+    jobs.touch(sweep_id)
+    try:
+        fill_density = float(request.args["fill_density"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "fill_density must be a number"}), 400
+    if not 0.0 <= fill_density <= 1.0:
+        return jsonify({"error": "fill_density must be between 0 and 1"}), 400
+    
+    children = {anchor["job_id"]: jobs.get(anchor["job_id"]) for anchor in sweep["anchors"]}
+    fit = infill_sweep.fit_points(infill_sweep.measured_points(sweep["anchors"], children))
+    if fit is None:
+        return jsonify({"error": "Fewer than two fill densities have been sliced yet",
+                        "status": sweep["status"], "progress": sweep.get("progress")}), 409
     
-    jobs[job_id] = job
-    job_queue.put(job_id)
+    # New anchors only once the queued ones are in, so the fit has its error bars
+    refining = None
+    slicing = any(child is None or child["status"] not in FINAL_STATUSES for child in children.values())
+    if request.args.get("refine", "true").lower() != "false" and not slicing:
+        density = fit.refine_anchor(fill_density)
+        if density is not None:
+            refining = add_sweep_anchor(sweep_id, density)
     
-    # Ensure the processing thread is running
-    ensure_processing_thread()
+    point = infill_sweep.quote_point(fit, fill_density, sweep_pricer(
+        sweep, request.args.get("material_id"), request.args.get("color_id"), request.args.get("quality_id")
+    ))
+    if "error" in point["price_info"]:
+        return jsonify(point["price_info"]), 404
     
     return jsonify({
-        "job_id": job_id,
-        "status": "pending",
-        "message": "File uploaded and queued for processing"
+        "sweep_id": sweep_id,
+        "status": "processing" if refining is not None else sweep["status"],
+        "anchors_measured": len(fit.x),
+        **point,
+        "refining": refining
     })
 
 @app.route("/api/job/<job_id>", methods=["GET"])
 def get_job_status(job_id):
     """Get the status of a job"""
-    if job_id not in jobs:
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    jobs.touch(job_id)
+    
+    return jsonify(job)
+
+@app.route("/api/job/<job_id>", methods=["DELETE"])
+@app.route("/api/job/<job_id>/cancel", methods=["POST"])
+def cancel_job_endpoint(job_id):
+    """Cancel a pending or slicing job, killing its slicer if one is running"""
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    job = cancel_job(job_id, "requested")
+    if job is None:
+        return jsonify({"error": "Job has already finished"}), 409
+    
+    return jsonify({
+        "success": True,
+        "message": "Job cancelled",
+        "job": job
+    })
+
+@app.route("/api/job/<job_id>/wait", methods=["GET"])
+def wait_for_job(job_id):
+    """Long-poll: return the job once its version differs from ?version=, or after ?timeout= seconds"""
+    try:
+        known_version = int(request.args["version"]) if "version" in request.args else None
+        timeout = min(max(float(request.args.get("timeout", 30)), 0), LONG_POLL_MAX_TIMEOUT)
+    except ValueError:
+        return jsonify({"error": "version must be an integer and timeout a number"}), 400
+
+    event = job_events.subscribe(job_id)
+    try:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        jobs.touch(job_id)
+        if job.get("version") == known_version and job["status"] not in FINAL_STATUSES:
+            if event.wait(timeout):
+                job = jobs.get(job_id) or job
+    finally:
+        job_events.unsubscribe(job_id, event)
+    return jsonify(job)
+
+@app.route("/api/job/<job_id>/events", methods=["GET"])
+def job_event_stream(job_id):
+    """Stream the job as Server-Sent Events on every change until it reaches a final status"""
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    try:
+        # EventSource sends the id of the last event it saw when it reconnects
+        last_version = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_version = None
+
+    def generate():
+        sent_version = last_version
+        event = job_events.subscribe(job_id)
+        try:
+            while True:
+                event.clear()
+                job = jobs.get(job_id)
+                if job is None:
+                    yield "event: error\ndata: {\"error\": \"Job not found\"}\n\n"
+                    return
+                # An open stream counts as the client still watching
+                jobs.touch(job_id)
+                if job.get("version") != sent_version:
+                    sent_version = job.get("version")
+                    yield f"id: {sent_version}\ndata: {json.dumps(job)}\n\n"
+                if job["status"] in FINAL_STATUSES:
+                    return
+                if not event.wait(SSE_KEEPALIVE_SECONDS):
+                    # Comment line; keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+        finally:
+            job_events.unsubscribe(job_id, event)
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route("/api/job/<job_id>/prices", methods=["GET"])
+def get_job_prices(job_id):
+    """Re-price a completed job for other materials, colors or qualities without re-slicing.
+
+    Query parameters material_id, color_id and quality_id narrow the result;
+    omitted ones expand to every available option.
+    """
+    job = jobs.get(job_id)
+    if job is None:
         return jsonify({"error": "Job not found"}), 404
     
-    return jsonify(jobs[job_id])
+    result = job.get("result")
+    if not result:
+        return jsonify({"error": "Job has no slice result yet", "status": job["status"]}), 409
+    
+    prices = calculate_price_matrix(
+        result["filament_used_g"],
+        result["estimated_time"],
+        job.get("enable_supports", True),
+        request.args.get("material_id"),
+        request.args.get("color_id"),
+        request.args.get("quality_id")
+    )
+    if "error" in prices:
+        return jsonify(prices), 404
+    
+    return jsonify({
+        "job_id": job_id,
+        "filament_used_g": result["filament_used_g"],
+        "estimated_time": result["estimated_time"],
+        **prices
+    })
 
 @app.route("/api/materials", methods=["GET"])
 def get_materials_endpoint():
     """Get all materials"""
-    return jsonify(get_materials())
+    body, etag = materials_catalog.serialized()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @app.route("/api/materials", methods=["POST"])
 def update_materials():
@@ -427,58 +1600,187 @@ def update_materials():
 
 @app.route("/api/file/<filename>", methods=["GET"])
 def get_file(filename):
-    """Get a file by filename"""
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    if not os.path.exists(file_path):
+    """Get a job's model or G-code by filename (G-code is stored gzipped and sent compressed when accepted)"""
+    # Only names in the artifact index: the folder also holds the databases
+    stored_name = artifact_store.stored_name(filename)
+    file_path = safe_join(UPLOAD_FOLDER, stored_name) if stored_name else None
+    if file_path is None or not os.path.exists(file_path):
         return jsonify({"error": "File not found"}), 404
     
-    return send_file(file_path)
+    artifact_store.touch(stored_name)
+    if stored_name != filename:
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = send_file(file_path, mimetype="text/plain", download_name=filename, conditional=True)
+            response.headers["Content-Encoding"] = "gzip"
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+        
+        def decompressed():
+            with gzip.open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b""):
+                    yield chunk
+        
+        return Response(decompressed(), mimetype="text/plain", headers={"Vary": "Accept-Encoding"})
+    
+    return send_file(file_path, conditional=True)
+
+def parse_timestamp(value):
+    """Parse an epoch-seconds query parameter (None if absent)"""
+    if value is None or value == "":
+        return None
+    return float(value)
 
 @app.route("/api/jobs", methods=["GET"])
 def get_all_jobs():
-    """Get all jobs (admin only)"""
+    """List jobs newest first, one page at a time (admin only).
+
+    Query parameters: status (comma-separated), material_id,
+    created_after / created_before (epoch seconds), limit, cursor (the
+    next_cursor of the previous page) and fields (comma-separated keys to
+    return, e.g. "id,status,created_at" to skip the slice result).
+    """
     # In a real app, you'd add authentication here
-    return jsonify(list(jobs.values()))
+    args = request.args
+    try:
+        limit = min(max(int(args.get("limit", JOBS_PAGE_SIZE)), 1), JOBS_MAX_PAGE_SIZE)
+        created_after = parse_timestamp(args.get("created_after"))
+        created_before = parse_timestamp(args.get("created_before"))
+        cursor = decode_cursor(args["cursor"]) if args.get("cursor") else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    statuses = [s for s in args.get("status", "").split(",") if s]
+    fields = [f for f in args.get("fields", "").split(",") if f]
+
+    # Fetch one extra row to know whether another page follows
+    rows = jobs.query(
+        statuses=statuses,
+        material_id=args.get("material_id") or None,
+        created_after=created_after,
+        created_before=created_before,
+        cursor=cursor,
+        limit=limit + 1
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None
+
+    # The page is identified by the query and the versions of the jobs on it,
+    # so an unchanged page is answered without decoding any job
+    digest = hashlib.sha256(request.query_string)
+    for job_id, _, version, _ in rows:
+        digest.update(f"{job_id}:{version};".encode())
+    digest.update(str(has_more).encode())
+    etag = digest.hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        page = []
+        for _, _, _, load in rows:
+            job = load()
+            page.append({key: job[key] for key in fields if key in job} if fields else job)
+        response = jsonify({"jobs": page, "next_cursor": next_cursor, "limit": limit})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Get slice cache hit/miss counts and artifact storage usage (admin only)"""
+    stats = slice_cache.stats()
+    stats["artifacts"] = artifact_store.stats()
+    return jsonify(stats)
+
+def count_active_jobs():
+    """Processing jobs held by a slicer; batch and sweep parents only wait for their children"""
+    active = 0
+    for job_id in jobs.ids_with_status(("processing",)):
+        job = jobs.get(job_id)
+        if job is not None and not job.get("kind"):
+            active += 1
+    return active
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus metrics: queue depth, busy workers, stage latencies, cache and failure counts"""
+    cache_stats = slice_cache.stats()
+    admission_stats = admission_controller.stats()
+    gauges = [
+        ("quote_queue_depth", "gauge", "Jobs waiting for a slicer",
+         [({}, len(jobs.ids_with_status(("pending",))))]),
+        ("quote_active_workers", "gauge", "Jobs being processed by a worker right now",
+         [({}, count_active_jobs())]),
+        ("quote_slice_cache_hits_total", "counter", "Slice cache lookups that found a result",
+         [({}, cache_stats["hits"])]),
+        ("quote_slice_cache_misses_total", "counter", "Slice cache lookups that had to slice",
+         [({}, cache_stats["misses"])]),
+        ("quote_slice_cache_entries", "gauge", "Results in the slice cache",
+         [({}, cache_stats["entries"])]),
+        ("quote_artifact_bytes", "gauge", "Disk used by stored uploads and G-code",
+         [({}, artifact_store.usage())]),
+        ("quote_admission_reserved_memory_mb", "gauge", "Estimated memory reserved by running slicers",
+         [({}, admission_stats["reserved_memory_mb"])]),
+        ("quote_admission_reserved_threads", "gauge", "PrusaSlicer threads granted to running slicers",
+         [({}, admission_stats["reserved_threads"])]),
+        ("quote_admission_waiting", "gauge", "Claimed jobs waiting for memory or CPU to start slicing",
+         [({}, admission_stats["waiting"])]),
+    ]
+    if distributed_queue is not None:
+        try:
+            queue_stats = distributed_queue.stats()
+            gauges.append(("quote_distributed_queue_jobs", "gauge", "Jobs in the Redis queue by state",
+                           [({"state": state}, count) for state, count in queue_stats.items()]))
+        except Exception as e:
+            print(f"Could not read distributed queue stats: {str(e)}")
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/debug", methods=["GET", "PUT"])
+def debug_logging():
+    """Get or switch slicer debug output for all processes (admin only)"""
+    if request.method == "PUT":
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data.get("enabled"), bool):
+            return jsonify({"error": "Body must be {\"enabled\": true|false}"}), 400
+        slice_model.set_debug(data["enabled"])
+    return jsonify({"enabled": slice_model.debug_enabled()})
 
 @app.route("/api/job/<job_id>/approve", methods=["POST"])
 def approve_job(job_id):
     """Approve a job for printing (admin only)"""
-    if job_id not in jobs:
+    if jobs.get(job_id) is None:
         return jsonify({"error": "Job not found"}), 404
     
-    if jobs[job_id]["status"] != "completed":
-        return jsonify({"error": "Job is not ready for approval"}), 400
-    
     # Update job status
-    jobs[job_id]["status"] = "approved"
-    jobs[job_id]["approved_at"] = time.time()
+    job = transition_job(job_id, ("completed",), "approved", approved_at=time.time())
+    if job is None:
+        return jsonify({"error": "Job is not ready for approval"}), 400
     
+    message = "Job approved for printing"
+    if not job["result"].get("gcode_file"):
+        # Quoted from a simplified mesh (or its G-code was lost): production slices the upload
+        message += "; slice the uploaded model to print it"
     return jsonify({
         "success": True,
-        "message": "Job approved for printing",
-        "job": jobs[job_id]
+        "message": message,
+        "job": job
     })
 
 @app.route("/api/job/<job_id>/reject", methods=["POST"])
 def reject_job(job_id):
     """Reject a job (admin only)"""
-    if job_id not in jobs:
-        return jsonify({"error": "Job not found"}), 404
-    
     # Update job status
-    jobs[job_id]["status"] = "rejected"
-    jobs[job_id]["rejected_at"] = time.time()
+    job = update_job(job_id, status="rejected", rejected_at=time.time())
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
     
     return jsonify({
         "success": True,
         "message": "Job rejected",
-        "job": jobs[job_id]
+        "job": job
     })
 
 if __name__ == "__main__":
     # Initialize materials if needed
-    if not os.path.exists(MATERIALS_FILE):
-        with open(MATERIALS_FILE, 'w') as f:
-            json.dump(DEFAULT_MATERIALS, f, indent=2)
+    materials_catalog.refresh()
+    start_background_tasks()
     
-    app.run(host="0.0.0.0", port=5000)
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
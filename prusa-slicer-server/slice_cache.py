@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Bytes read per chunk when hashing model files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Bump when the shape or meaning of cached slice results changes
+CACHE_FORMAT_VERSION = 6
+
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SliceCache:
+    """Persistent LRU cache of slice results.
+
+    Entries are keyed by the mesh content hash plus every parameter that
+    changes the slicer output (fill density, supports, quality) and the
+    hash of the slicer profile. When the profile file changes on disk all
+    entries sliced with the old profile are dropped. The database (WAL
+    mode) and its hit/miss counters can be shared by several processes.
+    """
+
+    def __init__(self, db_path, profile_path, max_entries=2000):
+        self.db_path = db_path
+        self.profile_path = profile_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._profile_stat = None
+        self._profile_hash = None
+
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS slice_cache (
+                key TEXT PRIMARY KEY,
+                profile_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_slice_cache_last_used ON slice_cache (last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS slice_cache_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _count(self, name, amount=1):
+        """Add to a shared counter; committed with the caller's transaction"""
+        if amount:
+            self._conn.execute(
+                "INSERT INTO slice_cache_counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount)
+            )
+
+    def profile_hash(self):
+        """Hash of the slicer profile, recomputed only when the file changes"""
+        try:
+            st = os.stat(self.profile_path)
+            stat_key = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat_key = None
+
+        if self._profile_hash is None or stat_key != self._profile_stat:
+            new_hash = hash_file(self.profile_path) if stat_key else "no-profile"
+            if self._profile_hash is not None and new_hash != self._profile_hash:
+                self._invalidate_profile(new_hash)
+            self._profile_stat = stat_key
+            self._profile_hash = new_hash
+        return self._profile_hash
+
+    def _invalidate_profile(self, current_hash):
+        """Drop every entry that was sliced with a different profile"""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM slice_cache WHERE profile_hash != ?", (current_hash,))
+            self._count("evictions", cur.rowcount)
+            self._conn.commit()
+
+    def make_key(self, model_path, fill_density, enable_supports, quality_id=None, mesh_hash=None, variant=""):
+        """Build the cache key for a model file and its slicing parameters.
+
+        variant tells apart slices of the same mesh prepared differently
+        (e.g. simplified for the quote); it is left out of the key when empty.
+        """
+        mesh_hash = mesh_hash or hash_file(model_path)
+        parts = [
+            str(CACHE_FORMAT_VERSION),
+            mesh_hash,
+            f"{float(fill_density):.4f}",
+            "1" if enable_supports else "0",
+            quality_id or "",
+            self.profile_hash(),
+        ]
+        if variant:
+            parts.append(variant)
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached slice result for key, or None on a miss"""
+        profile_hash = self.profile_hash()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM slice_cache WHERE key = ? AND profile_hash = ?",
+                (key, profile_hash)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE slice_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._count("hits")
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def discard(self, key):
+        """Drop an entry that turned out to be unusable; the lookup that found it counts as a miss"""
+        with self._lock:
+            self._conn.execute("DELETE FROM slice_cache WHERE key = ?", (key,))
+            self._count("hits", -1)
+            self._count("misses")
+            self._conn.commit()
+
+    def put(self, key, result):
+        """Store a slice result, evicting the least recently used entries if full"""
+        profile_hash = self.profile_hash()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO slice_cache (key, profile_hash, result, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, profile_hash, json.dumps(result), now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM slice_cache").fetchone()[0]
+            if count > self.max_entries:
+                cur = self._conn.execute(
+                    "DELETE FROM slice_cache WHERE key IN "
+                    "(SELECT key FROM slice_cache ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self._count("evictions", cur.rowcount)
+            self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM slice_cache").fetchone()[0]
+            counters = dict(self._conn.execute("SELECT name, value FROM slice_cache_counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
@@ -3,162 +3,414 @@ import sys
 import re
 import json
 import os
+import resource
+import signal
+import time
 import traceback
-import shutil
+from dataclasses import dataclass, asdict, field
+import mesh_analysis
+import gcode_metadata
+from metrics import span
 
-# Enable debug mode? (1 = on, 0 = off)
-DEBUG = 1
+SHARED_FOLDER = os.environ.get("UPLOAD_FOLDER", "/app/shared")
+PROFILE_FILE = os.path.join(SHARED_FOLDER, "prusaslicer-config", "x1c.ini")
 
-def debug_print(msg):
+# Debug output: on with SLICER_DEBUG=1, or switched at runtime by creating
+# DEBUG_FLAG_FILE (see set_debug), which every process re-checks at most
+# every DEBUG_CHECK_INTERVAL seconds
+DEBUG = os.environ.get("SLICER_DEBUG", "0") == "1"
+DEBUG_FLAG_FILE = os.path.join(SHARED_FOLDER, "run", "debug")
+DEBUG_CHECK_INTERVAL = 5.0
+_debug_flag = {"enabled": False, "checked_at": 0.0}
+
+# Maximum build size for Bambu Lab X1C
+MAX_DIMENSION = 256.0  # Max print size in mm
+
+# Limits for each PrusaSlicer process: wall-clock seconds and address space
+# in MB (0 = unlimited). On expiry the slicer's whole process group is killed.
+SLICER_TIMEOUT = float(os.environ.get("SLICER_TIMEOUT", "600"))
+SLICER_MEMORY_LIMIT_MB = int(os.environ.get("SLICER_MEMORY_LIMIT_MB", "8192"))
+# Seconds between checks of the timeout and the cancel callback
+SLICER_POLL_INTERVAL = 0.5
+
+def debug_enabled():
     if DEBUG:
-        print(f"[DEBUG] {msg}", file=sys.stderr)
+        return True
+    now = time.monotonic()
+    if now - _debug_flag["checked_at"] > DEBUG_CHECK_INTERVAL:
+        _debug_flag["enabled"] = os.path.exists(DEBUG_FLAG_FILE)
+        _debug_flag["checked_at"] = now
+    return _debug_flag["enabled"]
 
-try:
-    # Command-line arguments:
-    # sys.argv[1] = STL filename
-    # sys.argv[2] = Fill density (default: 0.15)
-    # sys.argv[3] = Enable supports (default: 0 = off, 1 = on)
+def set_debug(enabled):
+    """Switch debug output on or off for every process sharing SHARED_FOLDER"""
+    if enabled:
+        os.makedirs(os.path.dirname(DEBUG_FLAG_FILE), exist_ok=True)
+        open(DEBUG_FLAG_FILE, "a").close()
+    elif os.path.exists(DEBUG_FLAG_FILE):
+        os.unlink(DEBUG_FLAG_FILE)
+    _debug_flag["enabled"] = enabled
+    _debug_flag["checked_at"] = time.monotonic()
+
+def debug_print(msg, *args):
+    """Print a debug line; msg is %-formatted with args only when debug output is on"""
+    if debug_enabled():
+        print(f"[DEBUG] {msg % args if args else msg}", file=sys.stderr)
+
+
+class SliceError(Exception):
+    """Slicing failed; details carries structured context for the caller"""
+
+    def __init__(self, message, **details):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+    def to_dict(self):
+        return {"error": self.message, **self.details}
 
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "Missing filename argument"}))
-        sys.exit(1)
 
-    # Get file extension
-    filename = sys.argv[1]
-    file_ext = os.path.splitext(filename)[1].lower()
+class SliceCancelled(SliceError):
+    """The job was cancelled while its slicer was running"""
+
+
+@dataclass
+class SliceResult:
+    """Result of slicing a single model"""
+    filament_used_g: float
+    estimated_time: str
+    has_supports: bool
+    size: dict
+    volume_cm3: float
+    fill_density: float
+    surface_area_cm2: float = 0.0
+    triangle_count: int = 0
+    gcode_file: str = ""
+    gcode_stats: dict = field(default_factory=dict)
+    success: bool = field(default=True)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def parse_time_string(time_str):
+    """Convert time string like '2d 3h 45m 30s' to hours as float"""
+    total_seconds = 0
     
-    MODEL_FILE = "/app/shared/" + filename  # STL/3MF file path
-    GCODE_FILE = os.path.splitext(MODEL_FILE)[0] + ".gcode"
-    PROFILE_FILE = "/app/shared/prusaslicer-config/x1c.ini"
+    # Extract days, hours, minutes, seconds
+    days_match = re.search(r'(\d+)d', time_str)
+    hours_match = re.search(r'(\d+)h', time_str)
+    minutes_match = re.search(r'(\d+)m', time_str)
+    seconds_match = re.search(r'(\d+)s', time_str)
     
-    # Check if the file exists and is accessible
-    if not os.path.exists(MODEL_FILE):
-        debug_print(f"Model file not found: {MODEL_FILE}")
-        # Check if there's a converted version (for 3MF files that were converted to STL)
-        original_base = os.path.splitext(MODEL_FILE)[0]
-        potential_stl = original_base + ".stl"
-        if os.path.exists(potential_stl):
-            debug_print(f"Found converted STL file: {potential_stl}")
-            MODEL_FILE = potential_stl
-            GCODE_FILE = os.path.splitext(MODEL_FILE)[0] + ".gcode"
-        else:
-            print(json.dumps({"error": f"File not found: {MODEL_FILE}"}))
-            sys.exit(1)
+    if days_match:
+        total_seconds += int(days_match.group(1)) * 24 * 3600
+    if hours_match:
+        total_seconds += int(hours_match.group(1)) * 3600
+    if minutes_match:
+        total_seconds += int(minutes_match.group(1)) * 60
+    if seconds_match:
+        total_seconds += int(seconds_match.group(1))
+    
+    return total_seconds / 3600  # Convert to hours
+
+
+def format_time_string(seconds):
+    """Convert seconds to a PrusaSlicer-style time string like '1h 28m 57s'"""
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 24 * 3600)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    parts = []
+    if days:
+        parts.append(f"{days}d")
+    if days or hours:
+        parts.append(f"{hours}h")
+    if days or hours or minutes:
+        parts.append(f"{minutes}m")
+    parts.append(f"{seconds}s")
+    return " ".join(parts)
+
+
+def resolve_model_path(filename, shared_folder=SHARED_FOLDER):
+    """Return the on-disk model path for an uploaded filename.
+
+    Falls back to the converted STL when the original 3MF is gone.
+    """
+    model_file = filename if os.path.isabs(filename) else os.path.join(shared_folder, filename)
+    if os.path.exists(model_file):
+        return model_file
+
+    debug_print("Model file not found: %s", model_file)
+    # Check if there's a converted version (for 3MF files that were converted to STL)
+    potential_stl = os.path.splitext(model_file)[0] + ".stl"
+    if os.path.exists(potential_stl):
+        debug_print("Found converted STL file: %s", potential_stl)
+        return potential_stl
+
+    raise SliceError(f"File not found: {model_file}")
+
+
+def run_limited(cmd, timeout=None, should_cancel=None, usage=None):
+    """Run cmd under the slicer limits; returns (returncode, stdout, stderr).
+
+    The process runs in its own session so a timeout or cancellation can
+    kill it together with anything it spawned. should_cancel() is polled
+    while it runs; returning True kills it and raises SliceCancelled. If
+    usage is a dict, its "peak_rss_mb" is set to the process's peak
+    resident memory as sampled at each poll (where /proc is available).
+    """
+    timeout = SLICER_TIMEOUT if timeout is None else timeout
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               start_new_session=True)
+    if SLICER_MEMORY_LIMIT_MB > 0:
+        limit = SLICER_MEMORY_LIMIT_MB * 1024 * 1024
+        try:
+            # Set from outside so no code runs between fork and exec
+            resource.prlimit(process.pid, resource.RLIMIT_AS, (limit, limit))
+        except (OSError, ValueError) as e:
+            debug_print("Could not limit slicer memory: %s", e)
+
+    deadline = time.monotonic() + timeout if timeout > 0 else None
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=SLICER_POLL_INTERVAL)
+                return process.returncode, stdout, stderr
+            except subprocess.TimeoutExpired:
+                pass
+            if usage is not None:
+                peak = _peak_rss_mb(process.pid)
+                if peak is not None:
+                    usage["peak_rss_mb"] = max(peak, usage.get("peak_rss_mb", 0.0))
+            if should_cancel is not None and should_cancel():
+                raise SliceCancelled("Job was cancelled")
+            if deadline is not None and time.monotonic() > deadline:
+                raise SliceError(f"Slicing timed out after {timeout:g} s", timeout_s=timeout)
+    finally:
+        if process.returncode is None:
+            _kill_group(process)
+
+
+def _peak_rss_mb(pid):
+    """High-water mark of a running process's resident memory in MB (None if unknown)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.communicate()
 
-    # Get optional arguments
-    FILL_DENSITY = sys.argv[2] if len(sys.argv) > 2 else "0.15" 
-    ENABLE_SUPPORTS = "--support-material-auto" if (len(sys.argv) > 3 and sys.argv[3] == "1") else ""
 
-    debug_print(f"Processing file: {MODEL_FILE}")
-    debug_print(f"Using fill density: {FILL_DENSITY}")
-    debug_print(f"Support material enabled: {ENABLE_SUPPORTS != ''}")
+def _failure_message(stderr):
+    if SLICER_MEMORY_LIMIT_MB > 0 and ("bad_alloc" in stderr or "out of memory" in stderr.lower()):
+        return f"Slicing ran out of memory (limit {SLICER_MEMORY_LIMIT_MB} MB)"
+    return f"Slicing failed: {stderr}"
 
-    # Check if file exists
-    if not os.path.exists(MODEL_FILE):
-        print(json.dumps({"error": f"File not found: {MODEL_FILE}"}))
-        sys.exit(1)
 
-    # Maximum build size for Bambu Lab X1C
-    MAX_DIMENSION = 256.0  # Max print size in mm
+def get_model_size(model_file, should_cancel=None):
+    """Run PrusaSlicer --info and return the (x, y, z) size in mm
 
-    # Run PrusaSlicer to get model dimensions
-    info_cmd = ["prusa-slicer", "--info", MODEL_FILE]
-    debug_print(f"Running info command: {' '.join(info_cmd)}")
-    info_result = subprocess.run(info_cmd, capture_output=True, text=True)
+    Only used for formats mesh_analysis cannot read (e.g. OBJ).
+    """
+    info_cmd = ["prusa-slicer", "--info", model_file]
+    debug_print("Running info command: %s", " ".join(info_cmd))
+    returncode, stdout, stderr = run_limited(info_cmd, should_cancel=should_cancel)
 
-    if info_result.returncode != 0:
-        debug_print(f"Info command error: {info_result.stderr}")
-        print(json.dumps({"error": "Failed to get model information"}))
-        sys.exit(1)
+    if returncode != 0:
+        debug_print("Info command error: %s", stderr)
+        raise SliceError("Failed to get model information")
 
     # Extract size values
-    size_match = re.search(r"size_x = (.+?)\nsize_y = (.+?)\nsize_z = (.+?)\n", info_result.stdout)
-    if size_match:
-        size_x, size_y, size_z = map(float, size_match.groups())
-        debug_print(f"Model size: X={size_x}mm, Y={size_y}mm, Z={size_z}mm")
-        
-        # Check if any dimension exceeds the limit
-        if size_x > MAX_DIMENSION or size_y > MAX_DIMENSION or size_z > MAX_DIMENSION:
-            print(json.dumps({
-                "error": "Model is too large to print",
-                "size_x": size_x,
-                "size_y": size_y,
-                "size_z": size_z,
-                "max_dimension": MAX_DIMENSION
-            }))
-            sys.exit(1)  # Exit script
-    else:
-        debug_print(f"Could not extract size from output: {info_result.stdout}")
-        print(json.dumps({"error": "Could not determine model dimensions"}))
-        sys.exit(1)
+    size_match = re.search(r"size_x = (.+?)\nsize_y = (.+?)\nsize_z = (.+?)\n", stdout)
+    if not size_match:
+        debug_print("Could not extract size from output: %s", stdout)
+        raise SliceError("Could not determine model dimensions")
+
+    return tuple(map(float, size_match.groups()))
+
+
+def analyze_model(model_file):
+    """Return MeshInfo for STL and 3MF files, or None for formats that need PrusaSlicer"""
+    if not model_file.lower().endswith((".stl", ".3mf")):
+        return None
+    try:
+        return mesh_analysis.analyze_mesh(model_file)
+    except mesh_analysis.MeshError as e:
+        raise SliceError(f"Failed to read model: {str(e)}")
+
+
+def check_build_volume(size_x, size_y, size_z):
+    """Raise SliceError if any dimension exceeds the printer's build volume"""
+    if size_x > MAX_DIMENSION or size_y > MAX_DIMENSION or size_z > MAX_DIMENSION:
+        raise SliceError(
+            "Model is too large to print",
+            size_x=size_x,
+            size_y=size_y,
+            size_z=size_z,
+            max_dimension=MAX_DIMENSION
+        )
+
+
+def run_slicer(model_file, gcode_file, fill_density, enable_supports, profile_file=PROFILE_FILE, should_cancel=None,
+               threads=None, usage=None):
+    """Slice model_file to gcode_file with PrusaSlicer, within SLICER_TIMEOUT and SLICER_MEMORY_LIMIT_MB.
 
+    threads caps PrusaSlicer's worker threads (its own choice if None);
+    usage is passed to run_limited.
+    """
     # Run slicing with custom settings
     slicing_cmd = [
-        "prusa-slicer", 
-        "--load", PROFILE_FILE, 
-        "--fill-density", str(FILL_DENSITY),  # Use decimal format
+        "prusa-slicer",
+        "--load", profile_file,
+        "--fill-density", str(fill_density),  # Use decimal format
         "--export-gcode",
-        "--output", GCODE_FILE
+        "--output", gcode_file
     ]
 
+    if threads:
+        slicing_cmd.extend(["--threads", str(int(threads))])
+
     # Add support material flags (must be before the STL file)
-    if ENABLE_SUPPORTS:
+    if enable_supports:
         slicing_cmd.append("--support-material")
         slicing_cmd.append("--support-material-auto")
 
     # Finally, add the STL file to be sliced
-    slicing_cmd.append(MODEL_FILE)
+    slicing_cmd.append(model_file)
 
-    debug_print(f"Slicing command: {' '.join(slicing_cmd)}")
+    debug_print("Slicing command: %s", " ".join(slicing_cmd))
 
-    slicing_result = subprocess.run(slicing_cmd, capture_output=True, text=True)
+    try:
+        returncode, _, stderr = run_limited(slicing_cmd, should_cancel=should_cancel, usage=usage)
+    except SliceError:
+        # Don't leave a partial G-code file behind
+        if os.path.exists(gcode_file):
+            os.remove(gcode_file)
+        raise
 
     # Check if slicing failed
-    if slicing_result.returncode != 0:
-        debug_print(f"Slicing error: {slicing_result.stderr}")
-        print(json.dumps({"error": f"Slicing failed: {slicing_result.stderr}"}))
-        sys.exit(1)
+    if returncode != 0:
+        debug_print("Slicing error: %s", stderr)
+        raise SliceError(_failure_message(stderr))
 
-    # Extract filament usage & print time from G-code
-    filament_used = 0.0
-    print_time = "Unknown"
-    has_supports = False
 
+def parse_gcode(gcode_file, object_height=None):
+    """Read slice statistics from the G-code footer"""
     try:
-        with open(GCODE_FILE, "r") as gcode:
-            for line in gcode:
-                if "; total filament used [g] =" in line:
-                    filament_used = float(line.split("=")[1].strip())
-                elif "; estimated printing time" in line:
-                    print_time = line.split("=")[1].strip()
-                elif "support" in line.lower() and "generated" in line.lower():
-                    has_supports = True
+        return gcode_metadata.read_gcode_metadata(gcode_file, object_height)
     except Exception as e:
-        debug_print(f"Error reading G-code file: {str(e)}")
-        print(json.dumps({"error": f"Error reading G-code file: {str(e)}"}))
-        sys.exit(1)
-
-    debug_print(f"Filament used: {filament_used}g")
-    debug_print(f"Estimated print time: {print_time}")
-    debug_print(f"Has supports: {has_supports}")
-
-    # Return JSON response
-    print(json.dumps({
-        "success": True,
-        "filament_used_g": filament_used,
-        "estimated_time": print_time,
-        "has_supports": has_supports,
-        "size": {
+        debug_print("Error reading G-code file: %s", e)
+        raise SliceError(f"Error reading G-code file: {str(e)}")
+
+
+def slice_model(model_path, fill_density=0.15, enable_supports=False, gcode_path=None, profile_file=PROFILE_FILE,
+                mesh_info=None, spans=None, should_cancel=None, threads=None):
+    """Slice a model and return a SliceResult.
+
+    mesh_info skips re-reading the mesh when the caller already analyzed it.
+    The info, slice and gcode_parse stages are timed into spans if given;
+    the slice span also records the slicer's threads and peak_rss_mb.
+    threads caps PrusaSlicer's worker threads (see admission.py).
+    should_cancel() is polled while PrusaSlicer runs (see run_limited).
+    Raises SliceError when the model is missing, too large, fails to slice
+    or exceeds the slicer limits, and SliceCancelled when cancelled.
+    """
+    model_file = resolve_model_path(model_path)
+    gcode_file = gcode_path or os.path.splitext(model_file)[0] + ".gcode"
+    fill_density = float(fill_density)
+
+    debug_print("Processing file: %s", model_file)
+    debug_print("Using fill density: %s", fill_density)
+    debug_print("Support material enabled: %s", enable_supports)
+
+    with span(spans, "info"):
+        if mesh_info is None:
+            mesh_info = analyze_model(model_file)
+        if mesh_info:
+            size_x, size_y, size_z = mesh_info.size["x"], mesh_info.size["y"], mesh_info.size["z"]
+            volume_cm3 = mesh_info.volume_cm3
+        else:
+            size_x, size_y, size_z = get_model_size(model_file, should_cancel)
+            volume_cm3 = (size_x * size_y * size_z) / 1000.0  # Bounding box, convert mm³ to cm³
+    debug_print("Model size: X=%smm, Y=%smm, Z=%smm, volume=%.2fcm³", size_x, size_y, size_z, volume_cm3)
+    check_build_volume(size_x, size_y, size_z)
+
+    usage = {}
+    try:
+        with span(spans, "slice"):
+            run_slicer(model_file, gcode_file, fill_density, enable_supports, profile_file, should_cancel,
+                       threads, usage)
+    finally:
+        if spans is not None:
+            if threads:
+                spans[-1]["threads"] = int(threads)
+            if "peak_rss_mb" in usage:
+                spans[-1]["peak_rss_mb"] = usage["peak_rss_mb"]
+
+    with span(spans, "gcode_parse"):
+        meta = parse_gcode(gcode_file, size_z)
+
+    debug_print("Filament used: %sg", meta.filament_used_g)
+    debug_print("Estimated print time: %s", meta.estimated_time)
+    debug_print("Has supports: %s", meta.has_supports)
+
+    return SliceResult(
+        filament_used_g=meta.filament_used_g,
+        estimated_time=meta.estimated_time,
+        has_supports=meta.has_supports,
+        size={
             "x": size_x,
             "y": size_y,
             "z": size_z
         },
-        "volume_cm3": (size_x * size_y * size_z) / 1000.0,  # Convert mm³ to cm³
-        "fill_density": float(FILL_DENSITY)
-    }))
-
-except Exception as e:
-    error_details = traceback.format_exc()
-    debug_print(f"Unexpected error: {str(e)}\n{error_details}")
-    print(json.dumps({"error": f"Unexpected error: {str(e)}"}))
-    sys.exit(1)
+        volume_cm3=volume_cm3,
+        fill_density=fill_density,
+        surface_area_cm2=mesh_info.surface_area_cm2 if mesh_info else 0.0,
+        triangle_count=mesh_info.triangle_count if mesh_info else 0,
+        gcode_file=os.path.basename(gcode_file),
+        gcode_stats=meta.to_dict()
+    )
+
+
+def main(argv):
+    """Command-line wrapper: print the slice result (or error) as JSON.
+
+    argv[1] = STL filename
+    argv[2] = Fill density (default: 0.15)
+    argv[3] = Enable supports (default: 0 = off, 1 = on)
+    """
+    if len(argv) < 2:
+        print(json.dumps({"error": "Missing filename argument"}))
+        return 1
+
+    fill_density = argv[2] if len(argv) > 2 else "0.15"
+    enable_supports = len(argv) > 3 and argv[3] == "1"
+
+    try:
+        result = slice_model(argv[1], fill_density, enable_supports)
+    except SliceError as e:
+        print(json.dumps(e.to_dict()))
+        return 1
+    except Exception as e:
+        error_details = traceback.format_exc()
+        debug_print("Unexpected error: %s\n%s", e, error_details)
+        print(json.dumps({"error": f"Unexpected error: {str(e)}"}))
+        return 1
+
+    print(json.dumps(result.to_dict()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,184 @@
+"""Slicer node for the distributed queue (JOB_QUEUE=redis).
+
+Claims jobs from the Redis queue, fetches the model and slicer profile
+by content hash into a local cache, slices them and posts the result
+back to the API node, with the G-code as a gzipped blob for the API
+node's artifact store. Nodes share nothing but the queue server, so any
+number of them can run on any host that reaches REDIS_URL:
+
+    REDIS_URL=redis://queue-host:6379/0 python3 slicer_node.py [threads]
+"""
+import contextlib
+import gzip
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+import redis
+
+import admission
+import mesh_decimation
+import redis_queue
+import slice_model
+from metrics import span
+
+# Local cache of models/profiles fetched from the queue, keyed by hash
+NODE_CACHE_DIR = os.environ.get("NODE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "slicer-node"))
+# Seconds between sweeps for jobs whose slicer died
+REQUEUE_INTERVAL = 15
+# Longest gap between heartbeats, which is also how soon a cancelled slice stops
+HEARTBEAT_INTERVAL = 5
+
+
+def fetch_blob(queue, digest, extension, cache_dir=NODE_CACHE_DIR):
+    """Return a local path holding the blob, downloading it on first use"""
+    blob_dir = os.path.join(cache_dir, "blobs")
+    os.makedirs(blob_dir, exist_ok=True)
+    path = os.path.join(blob_dir, digest + extension)
+    if not os.path.exists(path):
+        data = queue.get_blob(digest)
+        fd, tmp_path = tempfile.mkstemp(dir=blob_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+
+def put_gcode(queue, gcode_path):
+    """Upload the gzipped G-code as a blob; returns its digest (of the compressed bytes)"""
+    with open(gcode_path, "rb") as f:
+        # mtime=0 so identical slices give identical blobs
+        return queue.put_blob(gzip.compress(f.read(), compresslevel=6, mtime=0))
+
+
+def keep_lease(queue, job_id, done, lost):
+    """Heartbeat thread: extend the job's lease until done is set; sets lost if the lease is gone"""
+    while not done.wait(min(queue.visibility_timeout / 3, HEARTBEAT_INTERVAL)):
+        try:
+            if not queue.heartbeat(job_id):
+                # Cancelled, or requeued for another node: stop slicing
+                print(f"Lost the lease on job {job_id}; stopping its slice")
+                lost.set()
+                return
+        except redis.RedisError as e:
+            print(f"Heartbeat for job {job_id} failed: {str(e)}")
+
+
+def slice_job(queue, job_id, payload, cache_dir=NODE_CACHE_DIR, controller=None):
+    """Slice one claimed job and post the outcome.
+
+    controller (an admission.AdmissionController for this host), if given,
+    holds the slice back until the memory and CPU need the API node
+    estimated fit.
+    """
+    done = threading.Event()
+    lost = threading.Event()
+    threading.Thread(target=keep_lease, args=(queue, job_id, done, lost), daemon=True).start()
+    gcode_path = os.path.join(cache_dir, "gcode", f"{job_id}.gcode")
+    os.makedirs(os.path.dirname(gcode_path), exist_ok=True)
+    spans = []
+    slice_path = None
+    try:
+        with span(spans, "fetch_model"):
+            model_path = fetch_blob(queue, payload["model_sha256"], payload.get("model_ext", ".stl"), cache_dir)
+            profile_path = slice_model.PROFILE_FILE
+            if payload.get("profile_sha256"):
+                profile_path = fetch_blob(queue, payload["profile_sha256"], ".ini", cache_dir)
+        # The API node's decimation settings, so its slice cache keys stay right
+        slice_path, mesh_info, decimation = model_path, None, None
+        if payload.get("decimate"):
+            with span(spans, "decimate"):
+                slice_path, mesh_info, decimation = mesh_decimation.quote_mesh(
+                    model_path, os.path.join(cache_dir, "gcode", f"{job_id}_quote.stl"), options=payload["decimate"]
+                )
+        # Jobs queued by an older API node carry no need; they get the baseline
+        need = payload.get("need") or {"memory_mb": admission.DEFAULT_COEFFICIENTS["memory_mb"][0], "threads": 1}
+        admit = controller.admit(job_id, need, lost.is_set, spans) if controller else contextlib.nullcontext()
+        with admit as threads:
+            result = slice_model.slice_model(
+                slice_path,
+                payload["fill_density"],
+                payload["enable_supports"],
+                gcode_path=gcode_path,
+                profile_file=profile_path,
+                mesh_info=mesh_info,
+                spans=spans,
+                should_cancel=lost.is_set,
+                threads=threads
+            ).to_dict()
+        if decimation:
+            result["quote_decimation"] = decimation
+        with span(spans, "upload_gcode"):
+            result["gcode_blob"] = put_gcode(queue, gcode_path)
+        queue.complete(job_id, result=result, spans=spans)
+    except slice_model.SliceCancelled:
+        # Nobody is waiting for this result any more
+        pass
+    except slice_model.SliceError as e:
+        queue.complete(job_id, error=e.message, details=e.details, spans=spans)
+    except redis.RedisError:
+        # Not the job's fault; leave it to be retried when the lease expires
+        raise
+    except Exception as e:
+        queue.complete(job_id, error=str(e), spans=spans)
+    finally:
+        done.set()
+        # The G-code went back as a blob; nothing is kept on the node
+        if os.path.exists(gcode_path):
+            os.remove(gcode_path)
+        if slice_path is not None and slice_path != model_path and os.path.exists(slice_path):
+            os.remove(slice_path)
+
+
+def run_node(queue, stop, cache_dir=NODE_CACHE_DIR):
+    """Claim and slice jobs until stop is set"""
+    os.makedirs(cache_dir, exist_ok=True)
+    controller = admission.AdmissionController(os.path.join(cache_dir, "admission.db"))
+    last_sweep = 0.0
+    while not stop.is_set():
+        try:
+            if time.time() - last_sweep > REQUEUE_INTERVAL:
+                requeued = queue.requeue_expired()
+                if requeued:
+                    print(f"Requeued {requeued} job(s) with expired leases")
+                last_sweep = time.time()
+            claimed = queue.claim(timeout=5)
+            if claimed is None:
+                continue
+            slice_job(queue, *claimed, cache_dir=cache_dir, controller=controller)
+        except redis.RedisError as e:
+            # The queue server is unreachable; a claimed job comes back once its lease expires
+            print(f"Queue error: {str(e)}")
+            stop.wait(5)
+
+
+def main(argv):
+    try:
+        queue = redis_queue.queue_from_env()
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    threads = int(argv[1]) if len(argv) > 1 else int(os.environ.get("SLICER_WORKERS", os.cpu_count() or 1))
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    print(f"Slicer node starting {threads} thread(s)")
+    workers = [
+        threading.Thread(target=run_node, args=(queue, stop), name=f"slicer-node-{i}")
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        while worker.is_alive():
+            worker.join(1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
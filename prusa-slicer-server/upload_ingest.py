@@ -0,0 +1,162 @@
+"""Streaming ingestion of uploaded model files.
+
+Werkzeug normally spools each multipart file part into a temporary file
+and only then hands it to the view, which copies it again with save().
+IngestRequest replaces that stream with IngestStream, which writes the
+part straight into the upload temp directory in chunks, hashes it and
+sniffs its format as it arrives, and aborts as soon as the part grows
+past the configured maximum size.
+"""
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Bytes kept from the start of the file for format sniffing
+SNIFF_BYTES = 512
+
+ZIP_SIGNATURE = b"PK\x03\x04"
+
+# Formats each extension may contain
+EXTENSION_FORMATS = {
+    "stl": {"stl_binary", "stl_ascii", "binary"},
+    "3mf": {"3mf"},
+    "obj": {"text"},
+}
+
+
+@dataclass
+class IngestResult:
+    """A fully received upload"""
+    path: str
+    size: int
+    sha256: str
+    format: str
+
+
+def sniff_format(head, size):
+    """Guess the model format from the first bytes and total size of a file"""
+    if head.startswith(ZIP_SIGNATURE):
+        return "3mf"
+    if len(head) >= 84:
+        triangle_count = int.from_bytes(head[80:84], "little")
+        # Trailing bytes after the triangles are allowed unless the header reads like ASCII STL
+        if size == 84 + triangle_count * 50 or (size > 84 + triangle_count * 50 and head[:5].lower() != b"solid"):
+            return "stl_binary"
+    if b"\x00" in head:
+        # Binary data that isn't a well-formed STL (e.g. a wrong triangle count)
+        return "binary"
+    if head.lstrip()[:5].lower() == b"solid":
+        return "stl_ascii"
+    return "text"
+
+
+class IngestStream:
+    """Writable target for one multipart file part"""
+
+    def __init__(self, directory, max_size):
+        self.path = os.path.join(directory, f"{uuid.uuid4()}.part")
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self._file = open(self.path, "w+b")
+        self._finished = False
+
+    def write(self, data):
+        if self.max_size is not None and self.size + len(data) > self.max_size:
+            self.discard()
+            raise RequestEntityTooLarge()
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    # Werkzeug seeks to 0 once the part is complete and wraps us in a FileStorage
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def finish(self):
+        """Close the file and return what was received"""
+        self.close()
+        self._finished = True
+        return IngestResult(
+            path=self.path,
+            size=self.size,
+            sha256=self._hash.hexdigest(),
+            format=sniff_format(self._head, self.size)
+        )
+
+    def discard(self):
+        """Delete the partial/unused file"""
+        self.close()
+        if not self._finished and os.path.exists(self.path):
+            os.unlink(self.path)
+        self._finished = True
+
+
+class IngestRequest(Request):
+    """Request class that streams file parts through IngestStream.
+
+    Reads UPLOAD_TEMP_DIR and MAX_FILE_SIZE from the app config; a view
+    may raise the part limit for its request through max_file_size.
+    """
+
+    @property
+    def max_file_size(self):
+        return self.__dict__.get("_max_file_size", current_app.config.get("MAX_FILE_SIZE"))
+
+    @max_file_size.setter
+    def max_file_size(self, value):
+        self.__dict__["_max_file_size"] = value
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_size = self.max_file_size
+        if max_size is not None and content_length and content_length > max_size:
+            raise RequestEntityTooLarge()
+        stream = IngestStream(current_app.config["UPLOAD_TEMP_DIR"], max_size)
+        self.ingest_streams.append(stream)
+        return stream
+
+    @property
+    def ingest_streams(self):
+        if "_ingest_streams" not in self.__dict__:
+            self.__dict__["_ingest_streams"] = []
+        return self.__dict__["_ingest_streams"]
+
+    def discard_unclaimed_uploads(self):
+        """Remove temp files of parts the view did not finish"""
+        for stream in self.ingest_streams:
+            stream.discard()
+
+
+def format_matches_extension(fmt, filename):
+    """True if the sniffed format is plausible for the file's extension"""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    allowed = EXTENSION_FORMATS.get(ext)
+    return allowed is None or fmt in allowed
@@ -0,0 +1,102 @@
+"""Slicing tier for the production deployment.
+
+Runs SLICER_PROCESSES slicer processes that claim pending jobs from the
+shared SQLite job store, so slicing never runs inside the HTTP worker
+processes (start those with `gunicorn -c gunicorn.conf.py server:app`
+and SLICER_WORKERS=0). The supervisor also resets jobs whose slicer
+process died and runs the job retention sweep.
+
+Usage: python3 worker.py [processes]
+"""
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+# Seconds an idle slicer waits for a new-job notification before re-checking the store
+IDLE_RECHECK_SECONDS = 5
+# Seconds running slices get to finish after SIGTERM before they are killed
+SHUTDOWN_TIMEOUT = float(os.environ.get("SLICER_SHUTDOWN_TIMEOUT", 30))
+
+
+def run_slicer_process(fast_lane=False):
+    """Body of one slicer process: claim and process jobs until SIGTERM (only small ones in the fast lane)"""
+    import server
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    wakeup = server.job_events.subscribe(server.PENDING_CHANNEL)
+    while not stopping.is_set():
+        wakeup.clear()
+        job = server.claim_next_job(fast_lane)
+        if job is None:
+            wakeup.wait(IDLE_RECHECK_SECONDS)
+            continue
+        try:
+            server.process_job(job["id"], job)
+        except Exception as e:
+            print(f"Error in job processing: {str(e)}")
+            time.sleep(1)
+
+
+def main(argv):
+    os.environ["SLICER_WORKERS"] = "0"
+    import server
+
+    if server.JOB_STORE != "sqlite":
+        print("worker.py needs JOB_STORE=sqlite so the HTTP processes see its jobs", file=sys.stderr)
+        return 1
+
+    count = int(argv[1]) if len(argv) > 1 else int(os.environ.get("SLICER_PROCESSES", os.cpu_count() or 1))
+    server.materials_catalog.refresh()
+    server.start_background_tasks()
+
+    # spawn, not fork: each slicer opens its own SQLite connections
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # The first slots only take jobs the scheduler expects to be quick
+    fast_lane_slots = server.scheduler.fast_lane_workers(count)
+    print(f"Starting {count} slicer process(es), {fast_lane_slots} in the fast lane")
+    while not stopping.is_set():
+        for slot in range(count):
+            process = processes.get(slot)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                # The process died mid-job; give its job to the others
+                dead_worker = f"{server.WORKER_HOST}:{process.pid}"
+                print(f"Slicer process {process.pid} exited with code {process.exitcode}; restarting")
+                server.requeue_unfinished_jobs(dead_worker=dead_worker)
+            process = context.Process(target=run_slicer_process, args=(slot < fast_lane_slots,),
+                                      name=f"slicer-{slot}", daemon=False)
+            process.start()
+            processes[slot] = process
+        stopping.wait(1)
+
+    print("Stopping slicer processes")
+    for process in processes.values():
+        process.terminate()
+    deadline = time.time() + SHUTDOWN_TIMEOUT
+    for process in processes.values():
+        process.join(max(deadline - time.time(), 0))
+        if process.is_alive():
+            process.kill()
+            process.join()
+    server.shutdown_event.set()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))